@@ -0,0 +1,38 @@
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from .models import User
+from .tokens import get_token_version
+
+
+class ClaimsUser(TokenUser):
+    # id, is_staff and is_superuser come from the token's claims, the User
+    # row is only loaded when .user is used
+
+    @cached_property
+    def is_active(self):
+        return self.token.get('is_active', False)
+
+    @cached_property
+    def user(self):
+        return User.objects.get(pk=self.id)
+
+    def __str__(self):
+        return f'ClaimsUser {self.id}'
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    # for views that only need the user's id and flags. revoked tokens are
+    # rejected by comparing their token_version claim with the cached one
+    def get_user(self, validated_token):
+        if 'token_version' not in validated_token:
+            # issued before the claims existed
+            return super().get_user(validated_token)
+
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+        if get_token_version(user_id) != validated_token['token_version']:
+            raise AuthenticationFailed(_('Token has been revoked'), code='token_revoked')
+        return ClaimsUser(validated_token)
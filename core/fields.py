@@ -0,0 +1,30 @@
+from rest_framework import serializers
+
+
+class BatchLoadedField(serializers.Field):
+    # a read-only value looked up by the object's pk. under a many=True
+    # serializer load() runs once for every object in the list, subclasses
+    # implement it and return a value for each of pks
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', 'pk')
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def load(self, model, pks):
+        raise NotImplementedError
+
+    def to_representation(self, pk):
+        return self.get_loaded()[pk]
+
+    def get_loaded(self):
+        serializer = self.parent
+        owner = serializer.parent if isinstance(serializer.parent, serializers.ListSerializer) \
+            else serializer
+        if not hasattr(owner, '_batch_loaded'):
+            owner._batch_loaded = {}
+        if self.field_name not in owner._batch_loaded:
+            instances = owner.instance if owner is not serializer else [serializer.instance]
+            owner._batch_loaded[self.field_name] = self.load(
+                serializer.Meta.model, [instance.pk for instance in instances or []])
+        return owner._batch_loaded[self.field_name]
@@ -1,7 +1,40 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.core.cache import cache
+from django.db import models, transaction
+
+# fields baked into token claims, changing one revokes the user's tokens
+TOKEN_CLAIM_FIELDS = ['password', 'is_staff', 'is_superuser', 'is_active']
+
+
+def token_version_key(user_id):
+    return f'core:token_version:{user_id}'
+
 
 # Create your models here.
 class User(AbstractUser):
     email = models.EmailField(unique=True)
-    
+    # compared against the token_version claim, see core.authentication
+    token_version = models.PositiveIntegerField(default=0, editable=False)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if all(field in field_names for field in TOKEN_CLAIM_FIELDS):
+            instance._loaded_claims = instance.token_claims()
+        return instance
+
+    def token_claims(self):
+        return [getattr(self, field) for field in TOKEN_CLAIM_FIELDS]
+
+    def save(self, *args, **kwargs):
+        loaded = getattr(self, '_loaded_claims', None)
+        revoked = loaded is not None and loaded != self.token_claims()
+        if revoked:
+            self.token_version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'token_version'}
+        super().save(*args, **kwargs)
+        self._loaded_claims = self.token_claims()
+        if revoked:
+            key = token_version_key(self.pk)
+            transaction.on_commit(lambda: cache.delete(key))
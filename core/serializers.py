@@ -1,5 +1,7 @@
 from djoser.serializers import UserSerializer as BaseUserSerializer, UserCreateSerializer as BaseUserCreateSerializer
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer as BaseTokenObtainPairSerializer
+from .tokens import ClaimsRefreshToken
 
 # custom serializer to add some extra fields to user create serializer
 
@@ -16,3 +18,8 @@ class UserSerializer(BaseUserSerializer):
         fields = ['id', 'username',
                   'email', 'first_name', 'last_name']
         # got to settings and create a new set
+
+
+# tokens carry the claims core.authentication.StatelessJWTAuthentication reads
+class TokenObtainPairSerializer(BaseTokenObtainPairSerializer):
+    token_class = ClaimsRefreshToken
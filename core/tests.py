@@ -1,3 +1,89 @@
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from .models import User
+from .tokens import ClaimsRefreshToken
 
-# Create your tests here.
+
+class TokenVersionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+
+    def test_claim_changes_revoke(self):
+        self.user.set_password('changed')
+        self.user.save()
+        self.user.is_staff = True
+        self.user.save(update_fields=['is_staff'])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.token_version, 2)
+
+    def test_other_changes_keep_tokens(self):
+        self.user.first_name = 'Alice'
+        self.user.save()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.token_version, 0)
+
+
+class StatelessJWTAuthenticationTests(TestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        self.authorize(ClaimsRefreshToken.for_user(self.user))
+
+    def authorize(self, refresh):
+        self.client.credentials(HTTP_AUTHORIZATION=f'JWT {refresh.access_token}')
+
+    def get_orders(self):
+        return self.client.get('/store/orders/', HTTP_ACCEPT='application/json')
+
+    def assertRevoked(self, response):
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['code'], 'token_revoked')
+
+    def save(self):
+        # the cached version is dropped once the change commits
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+
+    def test_password_change_revokes(self):
+        self.assertEqual(self.get_orders().status_code, 200)
+        self.user.set_password('changed')
+        self.save()
+        self.assertRevoked(self.get_orders())
+        self.authorize(ClaimsRefreshToken.for_user(self.user))
+        self.assertEqual(self.get_orders().status_code, 200)
+
+    def test_deactivation_revokes(self):
+        self.assertEqual(self.get_orders().status_code, 200)
+        self.user.is_active = False
+        self.save()
+        self.assertRevoked(self.get_orders())
+
+    def test_deleted_user(self):
+        self.user.delete()
+        self.assertRevoked(self.get_orders())
+
+    def test_claims_only(self):
+        self.get_orders()
+        # the token version is cached, nothing reads the user row
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.get_orders().status_code, 200)
+            self.assertEqual(self.client.get('/store/customers/me/').status_code, 200)
+        self.assertFalse([query for query in queries if 'core_user' in query['sql']])
+
+    def test_no_customer_claim(self):
+        # a deleted customer must not outlive it in tokens
+        self.assertNotIn('customer_id', ClaimsRefreshToken.for_user(self.user).access_token)
+
+    def test_token_without_claims(self):
+        # issued before the claims were added, checked against the user row
+        self.authorize(RefreshToken.for_user(self.user))
+        self.assertEqual(self.get_orders().status_code, 200)
+        self.user.is_active = False
+        self.save()
+        self.assertEqual(self.get_orders().status_code, 401)
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework_simplejwt.tokens import RefreshToken
+from .models import User, token_version_key
+
+# how long a user's token version is trusted without reading it again,
+# also the longest a revoked token can keep working on another cache
+TOKEN_VERSION_TIMEOUT = getattr(settings, 'CORE_TOKEN_VERSION_TIMEOUT', 30)
+
+REVOKED = -1
+
+
+class ClaimsRefreshToken(RefreshToken):
+    # access tokens copy these claims from their refresh token. the
+    # customer id isn't one, a customer can be deleted while its user's
+    # tokens stay valid, store.customers resolves it from a cache instead
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['token_version'] = user.token_version
+        token['is_staff'] = user.is_staff
+        token['is_superuser'] = user.is_superuser
+        token['is_active'] = user.is_active
+        return token
+
+
+def get_token_version(user_id):
+    # REVOKED for inactive and deleted users
+    key = token_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        row = User.objects.filter(pk=user_id) \
+            .values_list('token_version', 'is_active').first()
+        version = row[0] if row and row[1] else REVOKED
+        cache.set(key, version, timeout=TOKEN_VERSION_TIMEOUT)
+    return version
@@ -0,0 +1,26 @@
+from django.db import connections
+
+UPSERT_BATCH_SIZE = 500
+
+
+def upsert_adding(model, key, columns, added, rows, using='default'):
+    # inserts rows, tuples of values for columns, in batches of one
+    # statement. a row whose key exists adds its added columns to the
+    # stored ones instead, the other columns are only set on new rows.
+    # callers hold the transaction and pass rows in key order, so
+    # concurrent writers lock them in the same sequence
+    connection = connections[using]
+    table = connection.ops.quote_name(model._meta.db_table)
+    if connection.vendor == 'mysql':
+        conflict = 'ON DUPLICATE KEY UPDATE ' + ', '.join(
+            f'{column} = {column} + VALUES({column})' for column in added)
+    else:
+        conflict = f'ON CONFLICT ({", ".join(key)}) DO UPDATE SET ' + ', '.join(
+            f'{column} = {table}.{column} + excluded.{column}' for column in added)
+    row = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[start:start + UPSERT_BATCH_SIZE]
+            cursor.execute(
+                f'INSERT INTO {table} ({", ".join(columns)}) VALUES {", ".join([row] * len(batch))} {conflict}',
+                [value for values in batch for value in values])
@@ -0,0 +1,61 @@
+import atexit
+import threading
+from collections import Counter
+from django.conf import settings
+from django.db import connections
+from .models import LikeCount
+
+# deltas are held in process and written by one upsert per batch, so a burst
+# of likes on one object becomes a single row update
+FLUSH_INTERVAL = getattr(settings, 'LIKES_FLUSH_INTERVAL', 1.0)
+FLUSH_SIZE = getattr(settings, 'LIKES_FLUSH_SIZE', 500)
+
+
+class LikeCountBuffer:
+    def __init__(self, flush_interval=FLUSH_INTERVAL, flush_size=FLUSH_SIZE):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.lock = threading.Lock()
+        self.pending = Counter()
+        self.timer = None
+
+    def add(self, content_type_id, object_id, delta):
+        with self.lock:
+            self.pending[(content_type_id, object_id)] += delta
+            full = len(self.pending) >= self.flush_size
+            if self.timer is None and self.flush_interval > 0 and not full:
+                self.timer = threading.Timer(self.flush_interval, self.flush_from_timer)
+                self.timer.daemon = True
+                self.timer.start()
+        if full or self.flush_interval <= 0:
+            self.flush()
+
+    def flush(self):
+        # returns the number of counters written. on failure the deltas go
+        # back into the buffer for the next flush
+        with self.lock:
+            deltas, self.pending = self.pending, Counter()
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if not deltas:
+            return 0
+        try:
+            LikeCount.objects.apply_deltas(deltas)
+        except Exception:
+            with self.lock:
+                self.pending.update(deltas)
+            raise
+        return len(deltas)
+
+    def flush_from_timer(self):
+        try:
+            self.flush()
+        finally:
+            # the timer thread opened its own connections
+            connections.close_all()
+
+
+buffer = LikeCountBuffer()
+atexit.register(buffer.flush)
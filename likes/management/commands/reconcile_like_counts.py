@@ -0,0 +1,68 @@
+from collections import defaultdict
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef
+from likes.counters import buffer
+from likes.models import LikeCount, LikedItem
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds LikeCount from LikedItem in batches and fixes any drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        # likes still buffered in other processes show up as drift and are
+        # added again when they flush, run this when writes are quiet
+        buffer.flush()
+        checked, fixed = self.fix_counters(batch_size)
+        created = self.create_missing(batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} counters, fixed {fixed}, created {created}.'))
+
+    def fix_counters(self, batch_size):
+        last_id = 0
+        checked = fixed = 0
+        while True:
+            # walk counters by primary key so each batch is an index range
+            batch = list(LikeCount.objects.filter(pk__gt=last_id).order_by('pk')
+                         .values_list('pk', 'content_type_id', 'object_id', 'count')[:batch_size])
+            if not batch:
+                return checked, fixed
+            last_id = batch[-1][0]
+
+            objects = defaultdict(list)
+            for _, content_type_id, object_id, _ in batch:
+                objects[content_type_id].append(object_id)
+            with transaction.atomic():
+                actual = {}
+                for content_type_id, object_ids in objects.items():
+                    rows = LikedItem.objects.filter(
+                        content_type_id=content_type_id, object_id__in=object_ids
+                    ).order_by().values('object_id').annotate(count=Count('id')) \
+                        .values_list('object_id', 'count')
+                    actual.update({(content_type_id, object_id): count
+                                   for object_id, count in rows})
+                for pk, content_type_id, object_id, stored in batch:
+                    count = actual.get((content_type_id, object_id), 0)
+                    if count != stored:
+                        LikeCount.objects.filter(pk=pk).update(count=count)
+                        fixed += 1
+            checked += len(batch)
+
+    def create_missing(self, batch_size):
+        counted = LikeCount.objects.filter(
+            content_type_id=OuterRef('content_type_id'), object_id=OuterRef('object_id'))
+        created = 0
+        while True:
+            rows = list(LikedItem.objects.filter(~Exists(counted)).order_by()
+                        .values('content_type_id', 'object_id')
+                        .annotate(count=Count('id'))[:batch_size])
+            if not rows:
+                return created
+            # a concurrent flush may have created some of these meanwhile
+            LikeCount.objects.bulk_create([LikeCount(**row) for row in rows],
+                                          ignore_conflicts=True)
+            created += len(rows)
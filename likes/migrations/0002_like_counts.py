@@ -0,0 +1,65 @@
+# Generated by Django 4.2 on 2026-10-18 09:16
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+
+def delete_duplicate_likes(apps, schema_editor):
+    # keep the first like of every (user, object) so the constraint applies
+    LikedItem = apps.get_model('likes', 'LikedItem')
+    first = LikedItem.objects.values('user_id', 'content_type_id', 'object_id') \
+        .annotate(first=Min('id')).values('first')
+    LikedItem.objects.exclude(id__in=first).delete()
+
+
+def populate_like_counts(apps, schema_editor):
+    LikedItem = apps.get_model('likes', 'LikedItem')
+    LikeCount = apps.get_model('likes', 'LikeCount')
+    counts = LikedItem.objects.values('content_type_id', 'object_id') \
+        .annotate(count=Count('id')).order_by('content_type_id', 'object_id')
+    batch = []
+    for row in counts.iterator(chunk_size=BATCH_SIZE):
+        batch.append(LikeCount(**row))
+        if len(batch) == BATCH_SIZE:
+            LikeCount.objects.bulk_create(batch)
+            batch = []
+    LikeCount.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('likes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LikeCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(delete_duplicate_likes,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='likeditem',
+            constraint=models.UniqueConstraint(fields=('user', 'content_type', 'object_id'), name='likes_likeditem_unique_user_object'),
+        ),
+        migrations.AddField(
+            model_name='likecount',
+            name='content_type',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype'),
+        ),
+        migrations.AddConstraint(
+            model_name='likecount',
+            constraint=models.UniqueConstraint(fields=('content_type', 'object_id'), name='likes_likecount_unique_object'),
+        ),
+        migrations.RunPython(populate_like_counts,
+                             migrations.RunPython.noop),
+    ]
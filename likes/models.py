@@ -1,10 +1,91 @@
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
+from core.upserts import upsert_adding
+
+
+class LikedItemManager(models.Manager):
+    def like(self, user_id, obj):
+        # True when this is a new like, counts are updated through the
+        # buffer once the like is committed
+        from .counters import buffer
+
+        content_type = ContentType.objects.get_for_model(obj)
+        (liked_item, created) = self.get_or_create(
+            user_id=user_id, content_type=content_type, object_id=obj.pk)
+        if created:
+            transaction.on_commit(lambda: buffer.add(content_type.id, obj.pk, 1))
+        return created
+
+    def unlike(self, user_id, obj):
+        from .counters import buffer
+
+        content_type = ContentType.objects.get_for_model(obj)
+        (deleted, _) = self.filter(
+            user_id=user_id, content_type=content_type, object_id=obj.pk).delete()
+        if deleted:
+            transaction.on_commit(lambda: buffer.add(content_type.id, obj.pk, -deleted))
+        return bool(deleted)
+
+    def liked_ids(self, user_id, obj_type, obj_ids):
+        # the subset of obj_ids the user has liked, one query on the unique index
+        obj_ids = list(obj_ids)
+        if not obj_ids:
+            return set()
+        content_type = ContentType.objects.get_for_model(obj_type)
+        return set(self.filter(
+            user_id=user_id, content_type=content_type, object_id__in=obj_ids
+        ).values_list('object_id', flat=True))
+
 
 class LikedItem(models.Model):
+    objects = LikedItemManager()
     user = models.ForeignKey(settings.AUTH_USER_MODEL,  on_delete=models.CASCADE)
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     object_id = models.PositiveIntegerField()
-    content_object = GenericForeignKey()
\ No newline at end of file
+    content_object = GenericForeignKey()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'content_type', 'object_id'],
+                                    name='likes_likeditem_unique_user_object'),
+        ]
+
+
+class LikeCountManager(models.Manager):
+    def counts_for_many(self, obj_type, obj_ids):
+        # {object id: likes}, objects nobody liked are left out
+        obj_ids = list(obj_ids)
+        if not obj_ids:
+            return {}
+        content_type = ContentType.objects.get_for_model(obj_type)
+        return dict(self.filter(
+            content_type=content_type, object_id__in=obj_ids
+        ).values_list('object_id', 'count'))
+
+    def apply_deltas(self, deltas):
+        # adds {(content_type_id, object_id): delta} to the counters with one
+        # upsert per batch
+        rows = sorted((*key, delta) for key, delta in deltas.items() if delta)
+        with transaction.atomic(using=self.db):
+            upsert_adding(self.model, ['content_type_id', 'object_id'],
+                          ['content_type_id', 'object_id', 'count'], ['count'], rows, using=self.db)
+        return len(rows)
+
+
+class LikeCount(models.Model):
+    # denormalized number of LikedItem rows per object, kept up to date by
+    # likes.counters and rebuilt by the reconcile_like_counts command
+    objects = LikeCountManager()
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    # buffered deltas from different processes can land out of order, so
+    # this may briefly dip below zero
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['content_type', 'object_id'],
+                                    name='likes_likecount_unique_object'),
+        ]
@@ -0,0 +1,10 @@
+from core.fields import BatchLoadedField
+from .models import LikeCount
+
+
+class LikesCountField(BatchLoadedField):
+    # renders an object's like count, the counts of a whole list come from
+    # one query
+    def load(self, model, pks):
+        counts = LikeCount.objects.counts_for_many(model, pks)
+        return {pk: max(counts.get(pk, 0), 0) for pk in pks}
@@ -1,3 +1,53 @@
+from unittest import mock
+from django.contrib.contenttypes.models import ContentType
 from django.test import TestCase
+from core.models import User
+from .counters import LikeCountBuffer
+from .models import LikeCount
 
-# Create your tests here.
+
+class LikeCountBufferTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # any model will do for the generic keys
+        cls.content_type = ContentType.objects.get_for_model(User)
+
+    def counts(self):
+        return dict(LikeCount.objects.values_list('object_id', 'count'))
+
+    def test_deltas_wait_for_flush(self):
+        buffer = LikeCountBuffer(flush_interval=60)
+        self.addCleanup(buffer.flush)
+        buffer.add(self.content_type.id, 1, 1)
+        buffer.add(self.content_type.id, 1, 1)
+        buffer.add(self.content_type.id, 2, 1)
+        self.assertEqual(self.counts(), {})
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(self.counts(), {1: 2, 2: 1})
+        self.assertIsNone(buffer.timer)
+
+    def test_deltas_add_to_stored_counts(self):
+        buffer = LikeCountBuffer(flush_interval=60)
+        buffer.add(self.content_type.id, 1, 3)
+        buffer.flush()
+        buffer.add(self.content_type.id, 1, -1)
+        buffer.add(self.content_type.id, 2, 1)
+        buffer.add(self.content_type.id, 2, -1)
+        # the cancelled out counter isn't written at all
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(self.counts(), {1: 2})
+
+    def test_full_buffer_flushes(self):
+        buffer = LikeCountBuffer(flush_interval=60, flush_size=2)
+        buffer.add(self.content_type.id, 1, 1)
+        buffer.add(self.content_type.id, 2, 1)
+        self.assertEqual(self.counts(), {1: 1, 2: 1})
+        self.assertIsNone(buffer.timer)
+
+    def test_failed_flush_keeps_deltas(self):
+        buffer = LikeCountBuffer(flush_interval=0)
+        with mock.patch.object(LikeCount.objects, 'apply_deltas', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                buffer.add(self.content_type.id, 1, 1)
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(self.counts(), {1: 1})
@@ -1,8 +1,10 @@
 from django.contrib import admin
-from django.db.models.aggregates import Count
 from django.urls import reverse
 from django.utils.html import format_html, urlencode
 from . import models
+from .exports import stream_export
+from .pagination import EstimatedCountPaginator
+from .serializers import OrderSerializer, ProductSerializer
 
 
 class InventoryFilter(admin.SimpleListFilter):
@@ -34,12 +36,6 @@ class CollectionAdmin(admin.ModelAdmin):
             })
             )
         return format_html('<a href="{}">{}</a>', url, collection.products_count)
-        
-    # overide get quesryset to do count
-    def get_queryset(self, request):
-        return super().get_queryset(request).annotate(
-            products_count=Count('products')
-        )
 
 
 
@@ -51,12 +47,15 @@ class ProductAdmin(admin.ModelAdmin):
         'slug' : ['title']
     }
     search_fields = ['title']
-    actions = ['clear_inventory']
+    actions = ['clear_inventory', 'export_csv', 'export_ndjson']
     list_display = ['title', 'price', 'inventory_status', 'collection']
     list_editable = ['price']
     list_filter = ['collection', 'last_updated', InventoryFilter]
     list_per_page = 10
     list_select_related = ['collection']  #eager loading
+    # no exact COUNT(*) over big tables, see store.counting
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     def collection_title(self, product):
         return product.collection.title
@@ -75,6 +74,14 @@ class ProductAdmin(admin.ModelAdmin):
             f'{updated_count} products where successfully updated',
         )
 
+    @admin.action(description='Export as CSV', permissions=['view'])
+    def export_csv(self, request, queryset):
+        return stream_export(queryset, ProductSerializer, 'csv', 'products')
+
+    @admin.action(description='Export as NDJSON', permissions=['view'])
+    def export_ndjson(self, request, queryset):
+        return stream_export(queryset, ProductSerializer, 'ndjson', 'products')
+
 
 @admin.register(models.Customer)
 class CustomerAdmin(admin.ModelAdmin):
@@ -82,6 +89,8 @@ class CustomerAdmin(admin.ModelAdmin):
     list_editable = ['membership']
     list_per_page = 10
     list_select_related = ['user'] #eagerloading users withcustomers
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     ordering = ['user__first_name', 'user__last_name']
     search_fields = ['first_name__istartswith', 'last_name__istartswith']
 
@@ -97,7 +106,19 @@ class OrderItemInLine(admin.TabularInline):
 @admin.register(models.Order)
 class OrderAdmin(admin.ModelAdmin):
     autocomplete_fields = ['customer']
+    actions = ['export_csv', 'export_ndjson']
     inlines = [OrderItemInLine]
     list_display = ['id', 'placed_at', 'customer']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    # the selected orders go through the same streaming path as the api
+    @admin.action(description='Export as CSV', permissions=['view'])
+    def export_csv(self, request, queryset):
+        return stream_export(queryset, OrderSerializer, 'csv', 'orders')
+
+    @admin.action(description='Export as NDJSON', permissions=['view'])
+    def export_ndjson(self, request, queryset):
+        return stream_export(queryset, OrderSerializer, 'ndjson', 'orders')
 
 
@@ -0,0 +1,300 @@
+import random
+from collections import Counter, namedtuple
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.urls import URLResolver, get_resolver
+from django.utils import timezone
+from core.models import User
+from likes.models import LikeCount, LikedItem
+from store.models import Cart, CartItem, Collection, Customer, Order, OrderItem, Product, Review
+from store.rollups import rebuild
+from tags.models import Tag, TaggedItem
+
+
+PASSWORD = 'benchmark-password'
+
+# role is one of 'anon', 'customer', 'idle' (a customer with no orders) or
+# 'staff'. path and data are formatted with the ids returned by seed(), so
+# every run hits the same rows. data is sent as json unless it is a string
+# with its own content_type
+Endpoint = namedtuple('Endpoint', ['route', 'method', 'path', 'data', 'role', 'content_type'],
+                      defaults=['application/json'])
+
+ENDPOINTS = [
+    Endpoint('api-root', 'GET', '/store/', None, 'anon'),
+
+    Endpoint('products-list', 'GET', '/store/products/', None, 'anon'),
+    Endpoint('products-list', 'GET', '/store/products/?search=product&ordering=-price&price__gt=10', None, 'anon'),
+    Endpoint('products-list', 'GET', '/store/products/?cursor=&ordering=last_updated', None, 'anon'),
+    Endpoint('products-list', 'GET', '/store/products/?tags=tag-0,tag-1', None, 'anon'),
+    Endpoint('products-list', 'GET', '/store/products/?tags_any=tag-0,tag-1,tag-2', None, 'anon'),
+    Endpoint('products-list', 'POST', '/store/products/', {
+        'title': 'New product', 'slug': 'new-product', 'inventory': 10,
+        'price': 12.5, 'collection': '{collection}'}, 'staff'),
+    Endpoint('products-detail', 'GET', '/store/products/{product}/', None, 'anon'),
+    Endpoint('products-detail', 'PUT', '/store/products/{product}/', {
+        'title': 'Renamed product', 'slug': 'renamed-product', 'inventory': 10,
+        'price': 15, 'collection': '{collection}'}, 'staff'),
+    Endpoint('products-detail', 'PATCH', '/store/products/{product}/', {'price': 20}, 'staff'),
+    Endpoint('products-detail', 'DELETE', '/store/products/{unsold_product}/', None, 'staff'),
+    Endpoint('products-like', 'POST', '/store/products/{unsold_product}/like/', None, 'customer'),
+    Endpoint('products-like', 'DELETE', '/store/products/{product}/like/', None, 'customer'),
+    Endpoint('products-liked', 'GET', '/store/products/liked/?ids={product},{unsold_product}', None, 'customer'),
+    Endpoint('products-export', 'GET', '/store/products/export/?ordering=price', None, 'staff'),
+    Endpoint('products-import', 'POST', '/store/products/import/',
+             'title,slug,price,inventory,collection\n'
+             'Imported product,,10,5,Collection 0\n'
+             'Renamed product,product-0,12,5,Collection 1\n'
+             'Broken product,,0,5,Collection 0\n', 'staff', 'text/csv'),
+    Endpoint('products-export', 'GET', '/store/products/export/?output=csv&tags_any=tag-0', None, 'staff'),
+
+    Endpoint('collection-list', 'GET', '/store/collections/', None, 'anon'),
+    Endpoint('collection-list', 'POST', '/store/collections/', {'title': 'New collection'}, 'staff'),
+    Endpoint('collection-detail', 'GET', '/store/collections/{collection}/', None, 'anon'),
+    Endpoint('collection-detail', 'PUT', '/store/collections/{collection}/', {'title': 'Renamed'}, 'staff'),
+    Endpoint('collection-detail', 'PATCH', '/store/collections/{collection}/', {'title': 'Renamed'}, 'staff'),
+    Endpoint('collection-detail', 'DELETE', '/store/collections/{empty_collection}/', None, 'staff'),
+
+    Endpoint('product-reviews-list', 'GET', '/store/products/{product}/reviews/', None, 'anon'),
+    Endpoint('product-reviews-list', 'POST', '/store/products/{product}/reviews/', {
+        'name': 'Reviewer', 'description': 'Works as described.'}, 'anon'),
+    Endpoint('product-reviews-detail', 'GET', '/store/products/{product}/reviews/{review}/', None, 'anon'),
+    Endpoint('product-reviews-detail', 'PUT', '/store/products/{product}/reviews/{review}/', {
+        'name': 'Reviewer', 'description': 'Changed my mind.'}, 'anon'),
+    Endpoint('product-reviews-detail', 'PATCH', '/store/products/{product}/reviews/{review}/', {
+        'description': 'Changed my mind.'}, 'anon'),
+    Endpoint('product-reviews-detail', 'DELETE', '/store/products/{product}/reviews/{review}/', None, 'anon'),
+
+    Endpoint('cart-list', 'POST', '/store/carts/', {}, 'anon'),
+    Endpoint('cart-detail', 'GET', '/store/carts/{cart}/', None, 'anon'),
+    Endpoint('cart-detail', 'DELETE', '/store/carts/{cart}/', None, 'anon'),
+    Endpoint('cart-items-list', 'GET', '/store/carts/{cart}/items/', None, 'anon'),
+    Endpoint('cart-items-list', 'POST', '/store/carts/{cart}/items/', {
+        'product_id': '{product}', 'quantity': 1}, 'anon'),
+    Endpoint('cart-items-bulk', 'POST', '/store/carts/{cart}/items/bulk/', [
+        {'product_id': '{product}', 'quantity': 3},
+        {'product_id': '{unsold_product}', 'quantity': 0}], 'anon'),
+    Endpoint('cart-items-detail', 'GET', '/store/carts/{cart}/items/{cart_item}/', None, 'anon'),
+    Endpoint('cart-items-detail', 'PATCH', '/store/carts/{cart}/items/{cart_item}/', {'quantity': 2}, 'anon'),
+    Endpoint('cart-items-detail', 'DELETE', '/store/carts/{cart}/items/{cart_item}/', None, 'anon'),
+
+    Endpoint('customer-list', 'GET', '/store/customers/', None, 'staff'),
+    Endpoint('customer-detail', 'GET', '/store/customers/{customer}/', None, 'staff'),
+    Endpoint('customer-detail', 'PUT', '/store/customers/{customer}/', {'phone': '556', 'membership': 'S'}, 'staff'),
+    Endpoint('customer-detail', 'PATCH', '/store/customers/{customer}/', {'phone': '557'}, 'staff'),
+    Endpoint('customer-detail', 'DELETE', '/store/customers/{idle_customer}/', None, 'staff'),
+    Endpoint('customer-me', 'GET', '/store/customers/me/', None, 'customer'),
+    Endpoint('customer-me', 'PUT', '/store/customers/me/', {'phone': '558', 'membership': 'G'}, 'customer'),
+
+    Endpoint('orders-list', 'GET', '/store/orders/', None, 'customer'),
+    Endpoint('orders-list', 'GET', '/store/orders/?cursor=', None, 'staff'),
+    Endpoint('orders-list', 'POST', '/store/orders/', {'cart_id': '{cart}'}, 'customer'),
+    Endpoint('orders-export', 'GET', '/store/orders/export/', None, 'customer'),
+    Endpoint('orders-export', 'GET', '/store/orders/export/?output=csv', None, 'staff'),
+    Endpoint('orders-detail', 'GET', '/store/orders/{order}/', None, 'customer'),
+    Endpoint('orders-detail', 'PATCH', '/store/orders/{order}/', {'payment_status': 'C'}, 'staff'),
+    Endpoint('orders-detail', 'DELETE', '/store/orders/{empty_order}/', None, 'staff'),
+
+    Endpoint('sales-analytics-list', 'GET', '/store/analytics/sales/?start=2000-01-01&end=2100-12-31', None, 'staff'),
+    Endpoint('sales-analytics-list', 'GET', '/store/analytics/sales/'
+             '?start=2000-01-01&end=2100-12-31&group_by=day,collection&status=P,C', None, 'staff'),
+    Endpoint('sales-analytics-list', 'GET', '/store/analytics/sales/'
+             '?start=2000-01-01&end=2100-12-31&group_by=product&limit=20', None, 'staff'),
+
+    Endpoint('user-list', 'GET', '/auth/users/', None, 'customer'),
+    Endpoint('user-list', 'POST', '/auth/users/', {
+        'username': 'newuser', 'password': 'a-long-Passw0rd!', 'email': 'new@example.com',
+        'first_name': 'New', 'last_name': 'User'}, 'anon'),
+    Endpoint('user-me', 'GET', '/auth/users/me/', None, 'customer'),
+    Endpoint('user-me', 'PUT', '/auth/users/me/', {
+        'email': 'me@example.com', 'first_name': 'Me', 'last_name': 'Myself'}, 'customer'),
+    Endpoint('user-me', 'PATCH', '/auth/users/me/', {'first_name': 'Me'}, 'customer'),
+    Endpoint('user-me', 'DELETE', '/auth/users/me/', {'current_password': PASSWORD}, 'idle'),
+    Endpoint('user-detail', 'GET', '/auth/users/{user}/', None, 'customer'),
+    Endpoint('user-detail', 'PUT', '/auth/users/{user}/', {
+        'email': 'me@example.com', 'first_name': 'Me', 'last_name': 'Myself'}, 'customer'),
+    Endpoint('user-detail', 'PATCH', '/auth/users/{user}/', {'first_name': 'Me'}, 'customer'),
+    Endpoint('user-detail', 'DELETE', '/auth/users/{idle_user}/', {'current_password': PASSWORD}, 'idle'),
+    Endpoint('user-activation', 'POST', '/auth/users/activation/', {'uid': 'x', 'token': 'x'}, 'anon'),
+    Endpoint('user-resend-activation', 'POST', '/auth/users/resend_activation/', {'email': '{email}'}, 'anon'),
+    Endpoint('user-reset-password-confirm', 'POST', '/auth/users/reset_password_confirm/', {
+        'uid': 'x', 'token': 'x', 'new_password': 'a-long-Passw0rd!'}, 'anon'),
+    Endpoint('user-reset-username-confirm', 'POST', '/auth/users/reset_username_confirm/', {
+        'uid': 'x', 'token': 'x', 'new_username': 'renamed'}, 'anon'),
+    Endpoint('user-set-password', 'POST', '/auth/users/set_password/', {
+        'current_password': PASSWORD, 'new_password': 'a-long-Passw0rd!'}, 'customer'),
+    Endpoint('user-set-username', 'POST', '/auth/users/set_username/', {
+        'current_password': PASSWORD, 'new_username': 'renamed'}, 'customer'),
+    Endpoint('jwt-create', 'POST', '/auth/jwt/create/', {'username': '{username}', 'password': PASSWORD}, 'anon'),
+    Endpoint('jwt-refresh', 'POST', '/auth/jwt/refresh/', {'refresh': '{refresh}'}, 'anon'),
+    Endpoint('jwt-verify', 'POST', '/auth/jwt/verify/', {'token': '{access}'}, 'anon'),
+]
+
+
+# routes that fail whatever they are sent, timing their errors measures
+# nothing. fix the route and give it an endpoint above instead
+EXCLUDED = {
+    ('customer-list', 'POST'): "CustomerSerializer has no writable user, every insert breaks NOT NULL user_id",
+    ('orders-detail', 'PUT'): "OrderSerializer's nested items aren't writable",
+    ('user-reset-password', 'POST'): "djoser's PASSWORD_RESET_CONFIRM_URL isn't configured",
+    ('user-reset-username', 'POST'): "djoser's USERNAME_RESET_CONFIRM_URL isn't configured",
+}
+
+# run after ENDPOINTS against seed_catalog()'s extra products, the small
+# seed can't show costs that grow with the size of the catalog
+CATALOG_SIZE = 20000
+CATALOG_ENDPOINTS = [
+    Endpoint('products-list', 'GET', '/store/products/?search=lamp', None, 'anon'),
+    Endpoint('products-list', 'GET', '/store/products/?search=lamp+kettle', None, 'anon'),
+    Endpoint('products-list', 'GET', '/store/products/?search=lamp&cursor=', None, 'anon'),
+]
+
+CATALOG_WORDS = ['classic', 'organic', 'smart', 'wireless', 'compact', 'deluxe', 'eco',
+                 'portable', 'premium', 'vintage', 'lamp', 'kettle', 'jacket', 'speaker',
+                 'backpack', 'mug', 'chair', 'watch', 'blender', 'scarf']
+
+
+def endpoint_label(endpoint, catalog=False):
+    label = f'{endpoint.method} {endpoint.path}'
+    return f'{label} [{CATALOG_SIZE} products]' if catalog else label
+
+
+def registered_routes(prefixes=('store/', 'auth/')):
+    # every (route name, method) the url conf serves under the given prefixes
+    routes = set()
+
+    def walk(patterns, prefix):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                walk(pattern.url_patterns, prefix + str(pattern.pattern))
+                continue
+            if not prefix.startswith(prefixes) or pattern.name is None:
+                continue
+            callback = pattern.callback
+            actions = getattr(callback, 'actions', None)
+            if actions:
+                allowed = callback.cls.http_method_names
+                methods = [method for method in actions if method in allowed]
+            elif pattern.name == 'api-root':
+                methods = ['get']
+            else:
+                methods = ['post']
+            routes.update((pattern.name, method.upper()) for method in methods)
+
+    walk(get_resolver().url_patterns, '')
+    return routes
+
+
+def seed(seed=0, collections=20, products=500, customers=100, orders=300,
+         carts=50, reviews=1000, tags=30, likes=5):
+    rng = random.Random(seed)
+
+    collection_rows = Collection.objects.bulk_create([
+        Collection(title=f'Collection {i}') for i in range(collections + 1)])
+    *collection_rows, empty_collection = collection_rows
+    product_rows = Product.objects.bulk_create([
+        Product(title=f'Product {i}', slug=f'product-{i}',
+                description=f'Description of product {i} ' * 5,
+                price=Decimal(rng.randint(100, 99999)) / 100,
+                inventory=rng.randint(1, 500),
+                collection=rng.choice(collection_rows))
+        for i in range(products)])
+
+    password = make_password(PASSWORD)
+    users = User.objects.bulk_create([
+        User(username=f'user{i}', email=f'user{i}@example.com', password=password,
+             first_name=f'First{i}', last_name=f'Last{i}')
+        for i in range(customers)])
+    staff = User.objects.create(username='staff', email='staff@example.com',
+                                password=password, is_staff=True, is_superuser=True)
+    # deletable, nothing references it
+    idle = User.objects.create(username='idle', email='idle@example.com', password=password)
+    customer_rows = Customer.objects.bulk_create([
+        Customer(user=user, phone=f'555-{i:04}') for i, user in enumerate(users)])
+
+    # a few heavy customers and popular products, like real traffic
+    order_rows = Order.objects.bulk_create([
+        Order(customer=rng.choices(customer_rows, weights=[1 / (i + 1) for i in range(customers)])[0])
+        for _ in range(orders)])
+    popular = [1 / (i + 1) for i in range(products - 1)]
+    sold = product_rows[:-1]
+    items = []
+    for order in order_rows:
+        for product in set(rng.choices(sold, weights=popular, k=rng.randint(1, 8))):
+            items.append(OrderItem(order=order, product=product,
+                                   quantity=rng.randint(1, 5), unit_price=product.price))
+    OrderItem.objects.bulk_create(items)
+    # deletable, its items would protect it
+    empty_order = Order.objects.create(customer=customer_rows[-1])
+    # bulk inserts skip the sales rollups
+    rebuild(timezone.localdate(), timezone.localdate())
+
+    cart_rows = Cart.objects.bulk_create([Cart() for _ in range(carts)])
+    CartItem.objects.bulk_create([
+        CartItem(cart=cart, product=product, quantity=rng.randint(1, 5))
+        for cart in cart_rows
+        for product in set(rng.choices(sold, weights=popular, k=rng.randint(1, 10)))])
+
+    Review.objects.bulk_create([
+        Review(product=rng.choices(sold, weights=popular)[0], name=f'Reviewer {i}',
+               description='A review ' * 10)
+        for i in range(reviews)])
+
+    tag_rows = Tag.objects.bulk_create([Tag(label=f'tag-{i}') for i in range(tags)])
+    product_type = ContentType.objects.get_for_model(Product)
+    TaggedItem.objects.bulk_create([
+        TaggedItem(tag=tag, content_type=product_type, object_id=product.id)
+        for product in product_rows
+        for tag in rng.sample(tag_rows, rng.randint(0, min(3, tags)))])
+
+    # every customer likes a few popular products, the first one included
+    liked = {(user.id, product.id) for user in users
+             for product in [sold[0], *rng.choices(sold, weights=popular, k=likes)]}
+    LikedItem.objects.bulk_create([
+        LikedItem(user_id=user_id, content_type=product_type, object_id=product_id)
+        for user_id, product_id in sorted(liked)])
+    like_counts = Counter(product_id for _, product_id in liked)
+    LikeCount.objects.bulk_create([
+        LikeCount(content_type=product_type, object_id=product_id, count=count)
+        for product_id, count in sorted(like_counts.items())])
+
+    # the heaviest customer, so its order list is the worst case
+    customer = customer_rows[0]
+    cart = cart_rows[0]
+    product = sold[0]
+    return {
+        'collection': collection_rows[0].id,
+        'empty_collection': empty_collection.id,
+        'product': product.id,
+        'unsold_product': product_rows[-1].id,
+        'review': Review.objects.filter(product=product).values_list('id', flat=True).first(),
+        'cart': str(cart.id),
+        'cart_item': CartItem.objects.filter(cart=cart).values_list('id', flat=True).first(),
+        'customer': customer.id,
+        'order': Order.objects.filter(customer=customer).values_list('id', flat=True).first(),
+        'user': customer.user_id,
+        'username': customer.user.username,
+        'email': customer.user.email,
+        'customer_user': customer.user,
+        'staff_user': staff,
+        'idle_user': idle.id,
+        'idle_customer': idle.customer.id,
+        'empty_order': empty_order.id,
+        'idle_customer_user': idle,
+    }
+
+
+def seed_catalog(seed=0, products=CATALOG_SIZE):
+    # a catalog the size seed_store makes, titles and descriptions drawn
+    # from a small vocabulary so every search term matches many products
+    rng = random.Random(seed)
+    collection = Collection.objects.create(title='Catalog')
+    Product.objects.bulk_create([
+        Product(title=' '.join(rng.sample(CATALOG_WORDS, 3)).title() + f' {i}',
+                slug=f'catalog-{i}',
+                description=' '.join(rng.choices(CATALOG_WORDS, k=30)),
+                price=Decimal(rng.randint(100, 99999)) / 100,
+                inventory=rng.randint(1, 500),
+                collection=collection)
+        for i in range(products)], batch_size=2000)
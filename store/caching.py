@@ -0,0 +1,117 @@
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+# cached responses are keyed by the current version of every scope they read
+# from, bumping a scope makes all of its old entries unreachable
+CACHE_ALIAS = getattr(settings, 'STORE_CACHE_ALIAS', 'default')
+RESPONSE_TIMEOUT = getattr(settings, 'STORE_RESPONSE_CACHE_TIMEOUT', 60 * 15)
+LOCK_TIMEOUT = 10
+POLL_INTERVAL = 0.05
+
+MISSING = object()
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def version_key(scope):
+    return f'store:version:{scope}'
+
+
+def get_versions(scopes):
+    cache = get_cache()
+    keys = [version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # start from the clock rather than 0, so an evicted counter can
+            # never come back to a value some stale entry was stored under
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(*scopes):
+    def bump():
+        cache = get_cache()
+        for scope in scopes:
+            try:
+                cache.incr(version_key(scope))
+            except ValueError:
+                cache.add(version_key(scope), time.time_ns(), timeout=None)
+    # only once the transaction commits. bumped earlier, a concurrent
+    # request can still read the old rows and cache them under the new
+    # version. the same goes for every cache entry dropped after a write
+    transaction.on_commit(bump)
+
+
+def get_or_set_coalesced(key, compute, timeout=RESPONSE_TIMEOUT):
+    # only one caller per key computes a miss, the rest wait for its result
+    cache = get_cache()
+    value = cache.get(key, MISSING)
+    if value is not MISSING:
+        return value
+
+    lock_key = f'{key}:lock'
+    if not cache.add(lock_key, 1, timeout=LOCK_TIMEOUT):
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            value = cache.get(key, MISSING)
+            if value is not MISSING:
+                return value
+            if cache.get(lock_key) is None:
+                # the holder gave up without storing anything
+                break
+        return compute()
+
+    try:
+        value = compute()
+        if value is not MISSING:
+            cache.set(key, value, timeout=timeout)
+        return value
+    finally:
+        cache.delete(lock_key)
+
+
+def response_cache_key(request, view, kwargs, versions):
+    params = sorted((name, request.query_params.getlist(name))
+                    for name in request.query_params)
+    raw = repr((request.get_host(), view.basename, view.action,
+                sorted(kwargs.items()), params, versions))
+    return 'store:response:' + hashlib.md5(raw.encode()).hexdigest()
+
+
+class CachedResponseMixin:
+    # scopes whose writes invalidate this viewset's cached reads
+    cache_scopes = []
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        # cache the serialized data, not the rendered body, so content
+        # negotiation still happens per request
+        versions = get_versions(self.cache_scopes)
+        key = response_cache_key(request, self, kwargs, versions)
+        response = None
+
+        def compute():
+            nonlocal response
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return MISSING
+            return response.data
+
+        data = get_or_set_coalesced(key, compute)
+        if response is not None:
+            return response
+        return Response(data)
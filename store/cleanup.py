@@ -0,0 +1,44 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import Cart
+
+# carts without item writes for this long are deleted by sweep_abandoned_carts
+ABANDONED_CART_AGE = getattr(settings, 'STORE_ABANDONED_CART_AGE', timedelta(days=30))
+
+
+def sweep_abandoned_carts(max_age=None, batch_size=500, after=None, on_batch=None):
+    # deletes abandoned carts with their items and reservations, oldest
+    # first, one short transaction per batch of carts. every batch is
+    # committed, so an interrupted sweep just starts over; pass the
+    # created_at of the last batch as after to skip the range already
+    # scanned. on_batch(cursor, carts, rows) is called after each batch and
+    # the totals are returned as (carts, rows)
+    cutoff = timezone.now() - (ABANDONED_CART_AGE if max_age is None else max_age)
+    cursor = (after, None) if after else None
+    total_carts = total_rows = 0
+
+    while True:
+        queryset = Cart.objects.abandoned(cutoff).order_by('created_at', 'id')
+        if cursor and cursor[1] is None:
+            queryset = queryset.filter(created_at__gte=cursor[0])
+        elif cursor:
+            # keyset over (created_at, id) on the created_at index
+            queryset = queryset.filter(
+                Q(created_at__gt=cursor[0]) | Q(created_at=cursor[0], id__gt=cursor[1]))
+        batch = list(queryset.values_list('created_at', 'id')[:batch_size])
+        if not batch:
+            return total_carts, total_rows
+        cursor = batch[-1]
+
+        with transaction.atomic():
+            # checked again so a cart written to since the select survives
+            (rows, per_model) = Cart.objects.abandoned(cutoff) \
+                .filter(pk__in=[pk for _, pk in batch]).delete()
+        carts = per_model.get(Cart._meta.label, 0)
+        total_carts += carts
+        total_rows += rows
+        if on_batch:
+            on_batch(cursor, carts, rows)
@@ -0,0 +1,64 @@
+import hashlib
+from django.conf import settings
+from django.db import connections
+from .caching import get_cache
+
+# lists are counted exactly until they reach this many rows, past it the
+# count comes from table statistics or a cached count
+COUNT_ESTIMATE_THRESHOLD = getattr(settings, 'STORE_COUNT_ESTIMATE_THRESHOLD', 10000)
+COUNT_CACHE_TIMEOUT = getattr(settings, 'STORE_COUNT_CACHE_TIMEOUT', 60)
+
+
+def table_estimate(queryset):
+    # the planner's row estimate for the whole table, None when the backend
+    # keeps none we can read
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'mysql':
+            cursor.execute('SELECT table_rows FROM information_schema.tables '
+                           'WHERE table_schema = DATABASE() AND table_name = %s', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    # postgres reports -1 for tables that were never analyzed
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+def is_whole_table(queryset):
+    query = queryset.query
+    return (not query.where and not query.distinct and query.group_by is None
+            and query.combinator is None and query.low_mark == 0 and query.high_mark is None)
+
+
+def count_cache_key(queryset):
+    sql, params = queryset.order_by().query.sql_with_params()
+    raw = repr((queryset.db, sql, params))
+    return 'store:count:' + hashlib.md5(raw.encode()).hexdigest()
+
+
+def approximate_count(queryset, threshold=COUNT_ESTIMATE_THRESHOLD):
+    # returns (count, approximate). small results are counted exactly, large
+    # ones come from table statistics when the whole table is listed, or
+    # from a count cached for COUNT_CACHE_TIMEOUT seconds
+    if queryset.query.is_empty():
+        # .none(), e.g. a tag filter no tag matches, has no sql to key on
+        return 0, False
+    if is_whole_table(queryset):
+        estimate = table_estimate(queryset)
+        if estimate is not None and estimate >= threshold:
+            return estimate, True
+
+    cache = get_cache()
+    key = count_cache_key(queryset)
+    count = cache.get(key)
+    if count is not None:
+        return count, True
+    count = queryset.count()
+    if count >= threshold:
+        cache.set(key, count, timeout=COUNT_CACHE_TIMEOUT)
+    return count, False
@@ -0,0 +1,31 @@
+from django.db import transaction
+from .caching import get_cache
+from .models import Customer
+
+# user ids map to customer ids for good, so the entry only needs to go when
+# the customer is deleted
+CUSTOMER_ID_TIMEOUT = 60 * 60 * 24
+
+
+def customer_id_key(user_id):
+    return f'store:customer_id:{user_id}'
+
+
+def get_customer_id(user_id):
+    cache = get_cache()
+    key = customer_id_key(user_id)
+    customer_id = cache.get(key)
+    if customer_id is None:
+        customer_id = Customer.objects.filter(
+            user_id=user_id).values_list('id', flat=True).first()
+        if customer_id is None:
+            # every user gets a customer when it's created, this only covers
+            # users inserted without signals, e.g. by bulk_create()
+            (customer, created) = Customer.objects.only('id').get_or_create(user_id=user_id)
+            customer_id = customer.id
+        cache.set(key, customer_id, timeout=CUSTOMER_ID_TIMEOUT)
+    return customer_id
+
+
+def forget_customer_id(user_id):
+    transaction.on_commit(lambda: get_cache().delete(customer_id_key(user_id)))
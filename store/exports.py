@@ -0,0 +1,96 @@
+import csv
+import itertools
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework import serializers
+from rest_framework.utils.encoders import JSONEncoder
+from .optimizer import optimize_queryset
+
+EXPORT_CHUNK_SIZE = getattr(settings, 'STORE_EXPORT_CHUNK_SIZE', 2000)
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+class Echo:
+    # csv.writer wants a file, hand back each line instead of buffering it
+    def write(self, value):
+        return value
+
+
+def csv_columns(serializer, prefix=''):
+    columns = []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        nested = field.child if isinstance(field, serializers.ListSerializer) else field
+        if isinstance(nested, serializers.BaseSerializer):
+            columns.extend(csv_columns(nested, f'{prefix}{name}.'))
+        else:
+            columns.append(prefix + name)
+    return columns
+
+
+def csv_value(value, encoder=JSONEncoder()):
+    # same representation as the json responses, e.g. decimals as numbers
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return encoder.default(value)
+
+
+def csv_rows(data, prefix=''):
+    # one row per object, or per element of its nested list of objects, e.g.
+    # an order with three items becomes three rows repeating the order
+    row = {}
+    exploded = None
+    for name, value in data.items():
+        if isinstance(value, dict):
+            row.update(next(csv_rows(value, f'{prefix}{name}.')))
+        elif isinstance(value, list) and value and isinstance(value[0], dict):
+            exploded = (f'{prefix}{name}.', value)
+        elif isinstance(value, list):
+            row[prefix + name] = '|'.join(str(csv_value(item)) for item in value)
+        else:
+            row[prefix + name] = csv_value(value)
+    if exploded is None:
+        yield row
+        return
+    for item in exploded[1]:
+        for item_row in csv_rows(item, exploded[0]):
+            yield {**row, **item_row}
+
+
+def serialized_chunks(queryset, serializer_class, context, chunk_size):
+    # iterator() prefetches related rows once per chunk, and each chunk is
+    # serialized as a list so batched fields load once per chunk too
+    queryset = optimize_queryset(queryset, serializer_class)
+    rows = queryset.iterator(chunk_size=chunk_size)
+    while chunk := list(itertools.islice(rows, chunk_size)):
+        yield serializer_class(chunk, many=True, context=context).data
+
+
+def stream_export(queryset, serializer_class, output='ndjson', filename='export',
+                  context=None, chunk_size=EXPORT_CHUNK_SIZE):
+    # memory stays at one chunk whatever the size of queryset
+    chunks = serialized_chunks(queryset, serializer_class, context or {}, chunk_size)
+
+    if output == 'csv':
+        writer = csv.DictWriter(Echo(), csv_columns(serializer_class(context=context or {})),
+                                extrasaction='ignore')
+
+        def lines():
+            yield writer.writeheader()
+            for chunk in chunks:
+                yield ''.join(writer.writerow(row)
+                              for data in chunk for row in csv_rows(data))
+    else:
+        encoder = JSONEncoder()
+
+        def lines():
+            for chunk in chunks:
+                yield ''.join(encoder.encode(data) + '\n' for data in chunk)
+
+    response = StreamingHttpResponse(lines(), content_type=EXPORT_FORMATS[output])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{output}"'
+    return response
@@ -0,0 +1,143 @@
+import operator
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from rest_framework import serializers
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from core.fields import BatchLoadedField
+from .serializers import TAX_RATE, CollectionSerializer, ProductSerializer, ReviewSerializer
+
+# drf fields whose to_representation() returns what the database already
+# gives back for the column
+PASSTHROUGH_FIELDS = (serializers.CharField, serializers.IntegerField,
+                      serializers.BooleanField, serializers.FloatField)
+
+
+class ValuesSerializer:
+    # a read-only stand in for serializer_class that renders .values() rows
+    # to the same json, without building model instances or running drf's
+    # field machinery per row. the converters are compiled once per class
+    # from serializer_class's own fields, a field they can't reproduce is
+    # an error at startup rather than a different response.
+    # SerializerMethodFields are computed by the method of the same name
+    # here, from the row and the columns listed in method_columns
+    serializer_class = None
+    method_columns = []
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    @classmethod
+    def compiled(cls):
+        if '_compiled' not in cls.__dict__:
+            cls._compiled = cls.compile()
+        return cls._compiled
+
+    @classmethod
+    def compile(cls):
+        model = cls.serializer_class.Meta.model
+        # batch loaded fields are looked up by primary key
+        columns = [model._meta.pk.attname, *cls.method_columns]
+        getters = []
+        loaders = []
+        for name, field in cls.serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, BatchLoadedField):
+                loaders.append((name, field))
+                getters.append((name, None))
+                continue
+            if isinstance(field, serializers.SerializerMethodField):
+                getters.append((name, getattr(cls, field.method_name)))
+                continue
+            try:
+                if len(field.source_attrs) != 1:
+                    raise FieldDoesNotExist
+                model_field = model._meta.get_field(field.source_attrs[0])
+            except FieldDoesNotExist:
+                raise ImproperlyConfigured(
+                    f'{cls.__name__} cannot render {cls.serializer_class.__name__}.{name}')
+            column = model_field.attname
+            columns.append(column)
+            if isinstance(field, PASSTHROUGH_FIELDS) or (
+                    isinstance(field, serializers.DecimalField)
+                    and not getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+                    and field.decimal_places == model_field.decimal_places) or (
+                    isinstance(field, PrimaryKeyRelatedField) and field.pk_field is None):
+                getters.append((name, operator.itemgetter(column)))
+            else:
+                getters.append((name, cls.converter(column, field.to_representation)))
+        return list(dict.fromkeys(columns)), getters, loaders
+
+    @staticmethod
+    def converter(column, to_representation):
+        # drf renders None as is without calling the field
+        def convert(row):
+            value = row[column]
+            return None if value is None else to_representation(value)
+        return convert
+
+    @classmethod
+    def values(cls, queryset):
+        # keyset pagination reads the ordering values back off the rows
+        columns = cls.compiled()[0]
+        ordering = [item.lstrip('-') for item in
+                    queryset.query.order_by or queryset.model._meta.ordering
+                    if isinstance(item, str) and item.lstrip('-') not in ('pk', '?')]
+        return queryset.prefetch_related(None).values(*dict.fromkeys(columns + ordering))
+
+    @classmethod
+    def load(cls, field, pks):
+        # {pk: value} of a batch loaded field, one query for all of pks like
+        # the field itself does under many=True
+        return field.load(cls.serializer_class.Meta.model, pks)
+
+    @classmethod
+    def serialize(cls, rows, loaded):
+        _, getters, _ = cls.compiled()
+        pk = cls.serializer_class.Meta.model._meta.pk.attname
+        return [{name: get(row) if get is not None else loaded[name][row[pk]]
+                 for name, get in getters}
+                for row in rows]
+
+    @property
+    def data(self):
+        rows = list(self.rows)
+        _, _, loaders = self.compiled()
+        pk = self.serializer_class.Meta.model._meta.pk.attname
+        pks = [row[pk] for row in rows]
+        loaded = {name: self.load(field, pks) for name, field in loaders} if rows else {}
+        return self.serialize(rows, loaded)
+
+
+class CollectionValuesSerializer(ValuesSerializer):
+    serializer_class = CollectionSerializer
+
+
+class ProductValuesSerializer(ValuesSerializer):
+    serializer_class = ProductSerializer
+    method_columns = ['price']
+
+    # computed from the fetched price, sql arithmetic on the price doesn't
+    # round the same way as the serializer's Decimal
+    @staticmethod
+    def calculate_tax(row):
+        return row['price'] * TAX_RATE
+
+
+class ReviewValuesSerializer(ValuesSerializer):
+    serializer_class = ReviewSerializer
+
+
+class ValuesListMixin:
+    # list renders through values_serializer_class, retrieve and writes keep
+    # the model serializer
+    values_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        values_serializer = self.values_serializer_class
+        queryset = values_serializer.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(values_serializer(page).data)
+        return Response(values_serializer(queryset).data)
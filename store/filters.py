@@ -1,12 +1,60 @@
-from ast import mod
-from django_filters.rest_framework import FilterSet
+from django_filters.rest_framework import CharFilter, FilterSet
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+from tags.models import Tag, TaggedItem
 from .models import Product
+from .search import get_search_backend
+
+MAX_TAGS = 20
 
 
 class ProductFilter(FilterSet):
+    # comma separated labels, ?tags= needs all of them, ?tags_any= any one
+    tags = CharFilter(method='filter_tags', label='Products with all of these tags')
+    tags_any = CharFilter(method='filter_tags', label='Products with any of these tags')
+
     class Meta:
         model = Product
         fields = {
             'collection_id' : ['exact'],
             'price' : ['gt', 'lt']
-        }
\ No newline at end of file
+        }
+
+    def filter_tags(self, queryset, name, value):
+        labels = list(dict.fromkeys(
+            label.strip() for label in value.split(',') if label.strip()))
+        if not labels:
+            return queryset
+        if len(labels) > MAX_TAGS:
+            raise ValidationError({name: [f'At most {MAX_TAGS} tags can be given.']})
+
+        ids = Tag.objects.ids_for_labels(labels)
+        match_all = name == 'tags'
+        groups = [ids[label] for label in labels if ids[label]]
+        if not groups or (match_all and len(groups) < len(labels)):
+            # a label no tag has matches nothing
+            return queryset.none()
+        return queryset.filter(
+            id__in=TaggedItem.objects.object_ids_tagged(Product, groups, match_all))
+
+
+class FullTextSearchFilter(BaseFilterBackend):
+    # replaces DRF's SearchFilter (icontains scans) with the configured
+    # full text backend, results come back ordered by relevance unless
+    # OrderingFilter runs afterwards with an explicit ?ordering=
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        terms = request.query_params.get(self.search_param, '')
+        if not terms.strip():
+            return queryset
+        return get_search_backend().search(queryset, terms)
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.search_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Full text search over title and description.',
+            'schema': {'type': 'string'},
+        }]
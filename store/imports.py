@@ -0,0 +1,162 @@
+import codecs
+import csv
+import io
+import itertools
+import json
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.text import slugify
+from rest_framework import serializers
+from .models import Collection, Product
+
+IMPORT_BATCH_SIZE = getattr(settings, 'STORE_IMPORT_BATCH_SIZE', 500)
+IMPORT_FORMATS = ['csv', 'ndjson']
+
+
+class ProductImportSerializer(serializers.Serializer):
+    # field checks only, nothing here touches the database. the collection is
+    # given by title and resolved for the whole batch at once
+    title = serializers.CharField(max_length=255)
+    slug = serializers.SlugField(max_length=50, required=False, allow_blank=True)
+    description = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    price = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=1)
+    inventory = serializers.IntegerField(min_value=1)
+    collection = serializers.CharField(max_length=255)
+
+    def validate(self, data):
+        data['slug'] = data.get('slug') or slugify(data['title'])[:50]
+        if not data['slug']:
+            raise serializers.ValidationError({'slug': ['Could not be generated from the title.']})
+        return data
+
+
+class ImportResult:
+    def __init__(self, max_errors=None):
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+        self.max_errors = max_errors
+
+    def error(self, line, errors):
+        self.error_count += 1
+        if self.max_errors is None or len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def as_dict(self):
+        return {'created': self.created, 'updated': self.updated,
+                'error_count': self.error_count, 'errors': self.errors}
+
+
+def read_records(stream, file_format):
+    # yields (line, record or None, error) from a text stream, one line at
+    # a time, so nothing but the current row is held
+    if file_format == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record, None
+        return
+    for line, text in enumerate(stream, start=1):
+        if not text.strip():
+            continue
+        try:
+            record = json.loads(text)
+        except ValueError as error:
+            yield line, None, {'non_field_errors': [f'Invalid JSON: {error}']}
+            continue
+        if not isinstance(record, dict):
+            yield line, None, {'non_field_errors': ['Expected a JSON object.']}
+            continue
+        yield line, record, None
+
+
+def text_stream(file):
+    # files opened in binary, uploads and request bodies all iterate over
+    # lines of bytes, csv and json want str
+    if isinstance(file, io.TextIOBase):
+        return file
+    return codecs.iterdecode(file, 'utf-8-sig')
+
+
+def collection_ids():
+    # one query per import. titles aren't unique, the oldest one wins
+    return dict(Collection.objects.order_by('-pk').values_list('title', 'pk'))
+
+
+def import_products(file, file_format='csv', batch_size=IMPORT_BATCH_SIZE,
+                    result=None, on_batch=None):
+    # rows are matched to existing products on slug, given or generated
+    # from the title. each batch is validated and written in one
+    # transaction, a bad row is reported and the rest of its batch still goes
+    result = result or ImportResult()
+    collections = collection_ids()
+    records = read_records(text_stream(file), file_format)
+    while batch := list(itertools.islice(records, batch_size)):
+        import_batch(batch, collections, result)
+        if on_batch:
+            on_batch(result)
+    return result
+
+
+def import_batch(batch, collections, result):
+    # one serializer for the batch, building one per row costs more than
+    # validating it
+    serializer = ProductImportSerializer()
+    valid = {}
+    for line, record, errors in batch:
+        if errors is None:
+            try:
+                data = serializer.run_validation(record)
+            except serializers.ValidationError as error:
+                errors = error.detail
+            else:
+                data['collection_id'] = collections.get(data.pop('collection'))
+                if data['collection_id'] is not None:
+                    # a slug repeated within the batch, the later row wins
+                    # and the earlier one is reported as skipped
+                    replaced = valid.pop(data['slug'], None)
+                    if replaced is not None:
+                        result.error(replaced[0], {'slug': [f'Overridden by line {line} with the same slug.']})
+                    valid[data['slug']] = (line, data)
+                    continue
+                errors = {'collection': ['No collection with this title.']}
+        result.error(line, errors)
+    if not valid:
+        return
+
+    existing = {}
+    ambiguous = set()
+    for slug, pk in Product.objects.filter(slug__in=valid).values_list('slug', 'pk'):
+        if slug in existing:
+            ambiguous.add(slug)
+        existing[slug] = pk
+    for slug in ambiguous:
+        line = valid.pop(slug)[0]
+        result.error(line, {'slug': ['Matches more than one product.']})
+
+    now = timezone.now()
+    created = []
+    # an upsert sets one list of columns, rows without a description keep
+    # the one they have
+    updated = {True: [], False: []}
+    for slug, (line, data) in valid.items():
+        product = Product(pk=existing.get(slug), last_updated=now, **data)
+        if product.pk is None:
+            created.append(product)
+        else:
+            updated['description' in data].append(product)
+
+    fields = ['title', 'price', 'inventory', 'collection', 'last_updated']
+    with transaction.atomic():
+        Product.objects.bulk_create(created)
+        # an INSERT .. ON CONFLICT/ON DUPLICATE KEY UPDATE on the primary
+        # key, bulk_update() would build a CASE per row and column
+        for has_description, products in updated.items():
+            if products:
+                Product.objects.bulk_create(
+                    products, update_conflicts=True,
+                    update_fields=fields + ['description'] if has_description else fields,
+                    unique_fields=['id'] if connection.features.supports_update_conflicts_with_target else None)
+    result.created += len(created)
+    result.updated += len(updated[True]) + len(updated[False])
@@ -0,0 +1,89 @@
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import Product, Reservation
+
+# how long adding to a cart holds the stock
+RESERVATION_TTL = getattr(settings, 'STORE_RESERVATION_TTL', timedelta(minutes=15))
+
+
+class InsufficientInventory(Exception):
+    # missing_ids are the product_ids with no product at all, which get
+    # this far where foreign keys are only checked at commit (sqlite)
+    def __init__(self, product_ids, missing_ids=()):
+        self.product_ids = sorted(product_ids)
+        self.missing_ids = sorted(missing_ids)
+        super().__init__(f'Not enough inventory for products {self.product_ids}')
+
+
+def live_reservations(now=None, exclude_cart_items=()):
+    # served by the (product, expires_at) index
+    queryset = Reservation.objects.filter(expires_at__gt=now or timezone.now())
+    if exclude_cart_items:
+        queryset = queryset.exclude(cart_item_id__in=exclude_cart_items)
+    return queryset
+
+
+def reserved_subquery(now=None, exclude_cart_items=()):
+    # SUM of live reservations for the outer product row, 0 when there are none
+    reserved = live_reservations(now, exclude_cart_items) \
+        .filter(product_id=OuterRef('pk')).order_by() \
+        .values('product_id').annotate(total=Sum('quantity')).values('total')
+    return Coalesce(Subquery(reserved), Value(0))
+
+
+def reserve(cart_items):
+    # (re)reserve the full quantity of each cart line for another TTL, or
+    # raise InsufficientInventory and reserve nothing
+    if not cart_items:
+        return
+    now = timezone.now()
+    wanted = Counter()
+    for item in cart_items:
+        wanted[item.product_id] += item.quantity
+    item_ids = [item.pk for item in cart_items]
+
+    # callers run this inside their own transaction, no savepoint needed
+    with transaction.atomic(savepoint=False):
+        # lock the products in pk order, what other carts hold comes back
+        # with the locked rows. carts adding the same product queue here
+        # for the length of this short transaction, it's what stops two of
+        # them both reserving the last unit, and checkout then only takes
+        # its conditional UPDATE
+        available = dict(Product.objects.select_for_update()
+                         .filter(pk__in=wanted).order_by('pk')
+                         .annotate(available=F('inventory') - reserved_subquery(now, item_ids))
+                         .values_list('pk', 'available'))
+        short = [product_id for product_id, quantity in wanted.items()
+                 if available.get(product_id, 0) < quantity]
+        if short:
+            raise InsufficientInventory(short, [product_id for product_id in short
+                                                if product_id not in available])
+
+        # one upsert refreshes existing reservations and adds new ones
+        Reservation.objects.bulk_create([
+            Reservation(cart_item_id=item.pk, product_id=item.product_id,
+                        quantity=item.quantity, expires_at=now + RESERVATION_TTL)
+            for item in cart_items],
+            update_conflicts=True,
+            # mysql's ON DUPLICATE KEY takes no conflict target
+            unique_fields=['cart_item'] if connection.features.supports_update_conflicts_with_target else None,
+            update_fields=['product', 'quantity', 'expires_at'])
+
+
+def release_expired(batch_size=1000, now=None):
+    # deletes expired reservations oldest first, one short transaction per
+    # batch, and returns how many were removed
+    now = now or timezone.now()
+    released = 0
+    while True:
+        ids = list(Reservation.objects.filter(expires_at__lte=now)
+                   .order_by('expires_at').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return released
+        with transaction.atomic():
+            released += Reservation.objects.filter(pk__in=ids).delete()[0]
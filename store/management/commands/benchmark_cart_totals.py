@@ -0,0 +1,92 @@
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework import serializers
+from store.models import Cart, CartItem, Collection, Product
+from store.profiling import measure
+from store.serializers import CartSerializer, SimpleProductSerializer
+
+
+# the serializers as they were before totals moved into SQL, kept here so
+# both paths can be measured against the same data
+
+
+class LegacyCartItemSerializer(serializers.ModelSerializer):
+    product = SimpleProductSerializer()
+    total_price = serializers.SerializerMethodField()
+
+    def get_total_price(self, cart_item):
+        return cart_item.quantity * cart_item.product.price
+
+    class Meta:
+        model = CartItem
+        fields = ['id', 'product', 'quantity', 'total_price']
+
+
+class LegacyCartSerializer(serializers.ModelSerializer):
+    id = serializers.UUIDField(read_only=True)
+    items = LegacyCartItemSerializer(many=True, read_only=True)
+    total_price = serializers.SerializerMethodField()
+
+    def get_total_price(self, cart):
+        return sum([item.quantity * item.product.price for item in cart.items.all()])
+
+    class Meta:
+        model = Cart
+        fields = ['id', 'items', 'total_price']
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compares Python and SQL computed cart totals on the cart retrieve path.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1, 50, 500])
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        # everything created here is rolled back at the end
+        try:
+            with transaction.atomic():
+                self.run(options['sizes'], options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, sizes, repeat):
+        collection = Collection.objects.create(title='benchmark')
+        products = Product.objects.bulk_create([
+            Product(title=f'benchmark {i}', slug=f'benchmark-{i}',
+                    description='x' * 500, price=Decimal(i % 997) / 7 + 1,
+                    inventory=100, collection=collection)
+            for i in range(max(sizes))
+        ])
+
+        self.stdout.write(f'{"items":>6} {"path":<7} {"queries":>7} {"rows":>6} '
+                          f'{"p50 ms":>9} {"p95 ms":>9} {"peak KiB":>9}')
+        for size in sizes:
+            cart = Cart.objects.create()
+            CartItem.objects.bulk_create([
+                CartItem(cart=cart, product=product, quantity=i % 5 + 1)
+                for i, product in enumerate(products[:size])
+            ])
+
+            def legacy():
+                instance = Cart.objects.prefetch_related('items__product').get(pk=cart.pk)
+                return LegacyCartSerializer(instance).data
+
+            def current():
+                instance = Cart.objects.with_totals().get(pk=cart.pk)
+                return CartSerializer(instance).data
+
+            if legacy() != current():
+                raise CommandError(f'Serialized carts differ for {size} items')
+
+            for name, func in [('python', legacy), ('sql', current)]:
+                stats = measure(func, repeat=repeat)
+                self.stdout.write(
+                    f'{size:>6} {name:<7} {stats["queries"]:>7} {stats["rows"]:>6} '
+                    f'{stats["p50_ms"]:>9} {stats["p95_ms"]:>9} {stats["peak_kib"]:>9}')
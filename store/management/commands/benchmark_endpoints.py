@@ -0,0 +1,155 @@
+import json
+from pathlib import Path
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import setup_test_environment, teardown_test_environment
+from rest_framework.test import APIClient
+from core.tokens import ClaimsRefreshToken
+from store.benchmarks.endpoints import (CATALOG_ENDPOINTS, ENDPOINTS, EXCLUDED, endpoint_label,
+                                       registered_routes, seed, seed_catalog)
+from store.profiling import measure
+
+
+BASELINE = Path(__file__).resolve().parents[2] / 'benchmarks' / 'baseline.json'
+
+
+def fill(value, fixtures):
+    # '{product}' becomes the raw id, anything else is str.format()ed
+    if isinstance(value, str):
+        if value.startswith('{') and value.endswith('}') and value[1:-1] in fixtures:
+            return fixtures[value[1:-1]]
+        return value.format(**fixtures)
+    if isinstance(value, list):
+        return [fill(item, fixtures) for item in value]
+    if isinstance(value, dict):
+        return {key: fill(item, fixtures) for key, item in value.items()}
+    return value
+
+
+class Command(BaseCommand):
+    help = 'Measures queries, rows, latency and memory of every API route against a committed baseline.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--baseline', default=str(BASELINE))
+        parser.add_argument('--update-baseline', action='store_true',
+                            help='Write the measured numbers as the new baseline.')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--tolerance', type=float, default=2.0,
+                            help='Allowed factor over the baseline for p50 latency and memory.')
+        parser.add_argument('--slack-ms', type=float, default=10.0,
+                            help='Absolute latency slack on top of the tolerance.')
+        parser.add_argument('--filter', default='',
+                            help='Only run endpoints whose label contains this text, '
+                                 'with --update-baseline only their entries are rewritten.')
+
+    def handle(self, *args, **options):
+        missing = registered_routes() - {(e.route, e.method) for e in ENDPOINTS} - set(EXCLUDED)
+        if missing:
+            raise CommandError(f'Routes without a benchmark: {sorted(missing)}')
+
+        # never touch the configured database, build a throwaway test one
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            results = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        path = Path(options['baseline'])
+        if options['update_baseline']:
+            # a budget for a crash would pass as long as it keeps crashing
+            errors = [f'{label}: {stats["status"]}' for label, stats in results.items() if stats['status'] >= 500]
+            if errors:
+                raise CommandError('Not writing server errors into the baseline:\n  ' + '\n  '.join(errors))
+            written = results
+            if options['filter'] and path.exists():
+                # only the filtered endpoints are re-recorded, the others
+                # keep their budgets
+                written = {**json.loads(path.read_text()), **results}
+            path.write_text(json.dumps(written, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Wrote {len(results)} endpoints to {path}'))
+            return
+
+        baseline = json.loads(path.read_text()) if path.exists() else {}
+        failures = self.compare(results, baseline, options)
+        if failures:
+            raise CommandError('Budget exceeded:\n  ' + '\n  '.join(failures))
+        self.stdout.write(self.style.SUCCESS(f'{len(results)} endpoints within budget.'))
+
+    def run(self, options):
+        fixtures = seed()
+        refresh = ClaimsRefreshToken.for_user(fixtures['customer_user'])
+        fixtures.update(refresh=str(refresh), access=str(refresh.access_token))
+        tokens = {
+            'customer': str(refresh.access_token),
+            'staff': str(ClaimsRefreshToken.for_user(fixtures['staff_user']).access_token),
+            'idle': str(ClaimsRefreshToken.for_user(fixtures['idle_customer_user']).access_token),
+        }
+
+        results = {}
+        self.stdout.write(f'{"endpoint":<70} {"status":>6} {"queries":>7} {"rows":>6} '
+                          f'{"p50 ms":>8} {"p95 ms":>8} {"peak KiB":>9}')
+        self.measure_endpoints(ENDPOINTS, False, fixtures, tokens, options, results)
+        if any(options['filter'] in endpoint_label(endpoint, True) for endpoint in CATALOG_ENDPOINTS):
+            seed_catalog()
+            self.measure_endpoints(CATALOG_ENDPOINTS, True, fixtures, tokens, options, results)
+        return results
+
+    def measure_endpoints(self, endpoints, catalog, fixtures, tokens, options, results):
+        for endpoint in endpoints:
+            label = endpoint_label(endpoint, catalog)
+            if options['filter'] not in label:
+                continue
+            client = APIClient(raise_request_exception=False)
+            if endpoint.role in tokens:
+                client.credentials(HTTP_AUTHORIZATION=f'JWT {tokens[endpoint.role]}')
+            path = fill(endpoint.path, fixtures)
+            data = fill(endpoint.data, fixtures)
+            status = []
+
+            def call():
+                # budgets are for the uncached path, and writes are rolled
+                # back so every call sees the seeded data
+                cache.clear()
+                with transaction.atomic():
+                    response = client.generic(
+                        endpoint.method, path,
+                        data if isinstance(data, str) else
+                        json.dumps(data) if data is not None else '',
+                        content_type=endpoint.content_type)
+                    # exports only hit the database as they are read
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                    transaction.set_rollback(True)
+                status.append(response.status_code)
+
+            stats = measure(call, repeat=options['repeat'])
+            stats['status'] = status[0]
+            results[label] = stats
+            self.stdout.write(
+                f'{label[:70]:<70} {stats["status"]:>6} {stats["queries"]:>7} {stats["rows"]:>6} '
+                f'{stats["p50_ms"]:>8} {stats["p95_ms"]:>8} {stats["peak_kib"]:>9}')
+
+    def compare(self, results, baseline, options):
+        tolerance, slack = options['tolerance'], options['slack_ms']
+        failures = []
+        for label, stats in results.items():
+            budget = baseline.get(label)
+            if budget is None:
+                failures.append(f'{label}: no baseline, run with --update-baseline')
+                continue
+            if stats['status'] != budget['status']:
+                failures.append(f'{label}: status {stats["status"]} != {budget["status"]}')
+            # queries and rows are deterministic for the seeded data
+            for key in ['queries', 'rows']:
+                if stats[key] > budget[key]:
+                    failures.append(f'{label}: {key} {stats[key]} > {budget[key]}')
+            # p95 of --repeat runs is mostly the slowest one, too noisy to
+            # gate on, it's reported only
+            if stats['p50_ms'] > budget['p50_ms'] * tolerance + slack:
+                failures.append(f'{label}: p50_ms {stats["p50_ms"]} > {budget["p50_ms"]} x {tolerance} + {slack}')
+            if stats['peak_kib'] > budget['peak_kib'] * tolerance + 64:
+                failures.append(f'{label}: peak_kib {stats["peak_kib"]} > {budget["peak_kib"]} x {tolerance}')
+        return failures
@@ -0,0 +1,121 @@
+import io
+import random
+from datetime import timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from core.models import User
+from store.exports import serialized_chunks
+from store.models import Collection, Customer, Order, OrderItem, Product
+from store.optimizer import optimize_queryset
+from store.parsers import MessagePackParser, ORJSONParser
+from store.profiling import measure
+from store.renderers import MessagePackRenderer, ORJSONRenderer, msgpack
+from store.serializers import OrderSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compares the stdlib, orjson and MessagePack renderers and parsers on order list payloads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000],
+                            help='Orders per payload.')
+        parser.add_argument('--items-per-order', type=int, default=4)
+        parser.add_argument('--chunk-size', type=int, default=100,
+                            help='Orders per chunk when streaming the unpaginated list.')
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        # everything created here is rolled back at the end
+        try:
+            with transaction.atomic():
+                self.run(options, random.Random(options['seed']))
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options, rng):
+        sizes = options['sizes']
+        collection = Collection.objects.create(title='benchmark')
+        # titles with accents and quotes, prices of every magnitude
+        products = Product.objects.bulk_create([
+            Product(title=f'Café "benchmark" {i} – déluxe', slug=f'benchmark-{i}',
+                    price=Decimal(rng.randint(100, 999999)).scaleb(-2),
+                    inventory=100, collection=collection)
+            for i in range(200)
+        ])
+        user = User.objects.create(username='benchmark-renderers', email='benchmark-renderers@example.com')
+        customer = Customer.objects.get(user=user)
+        now = timezone.now()
+        orders = Order.objects.bulk_create([
+            Order(customer=customer, payment_status=rng.choice('PCF'))
+            for _ in range(max(sizes))
+        ])
+        # placed_at is auto_now_add, spread it out afterwards
+        for order in orders:
+            order.placed_at = now - timedelta(seconds=rng.randint(0, 10 ** 7), microseconds=rng.randint(0, 999999))
+        Order.objects.bulk_update(orders, ['placed_at'])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=rng.randint(1, 5), unit_price=product.price)
+            for order in orders
+            for product in rng.sample(products, max(1, round(rng.expovariate(1 / options['items_per_order']))))
+        ])
+
+        renderers = [('json', JSONRenderer()), ('orjson', ORJSONRenderer())]
+        parsers = {'json': JSONParser(), 'orjson': ORJSONParser()}
+        if msgpack is not None:
+            renderers.append(('msgpack', MessagePackRenderer()))
+            parsers['msgpack'] = MessagePackParser()
+        else:
+            self.stdout.write('msgpack is not installed, skipping MessagePack.')
+
+        self.stdout.write(f'{"orders":>6} {"step":<9} {"format":<8} {"KiB":>8} '
+                          f'{"p50 ms":>9} {"orders/s":>10} {"peak KiB":>9}')
+        for size in sizes:
+            queryset = Order.objects.filter(customer=customer).order_by('pk')[:size]
+            data = OrderSerializer(optimize_queryset(queryset, OrderSerializer), many=True).data
+            bodies = {name: renderer.render(data) for name, renderer in renderers}
+            if bodies['orjson'] != bodies['json']:
+                raise CommandError(f'orjson and json render {size} orders differently')
+
+            for name, renderer in renderers:
+                self.report(size, 'render', name, len(bodies[name]),
+                            measure(lambda: renderer.render(data), repeat=options['repeat']))
+            for name, parser in parsers.items():
+                self.report(size, 'parse', name, len(bodies[name]),
+                            measure(lambda: parser.parse(io.BytesIO(bodies[name])), repeat=options['repeat']))
+
+            # the unpaginated order list end to end, serialized then
+            # rendered whole or a chunk at a time
+            renderer = ORJSONRenderer()
+
+            def buffered():
+                return renderer.render(OrderSerializer(
+                    optimize_queryset(queryset.all(), OrderSerializer), many=True).data)
+
+            def streamed():
+                return renderer.render_list(serialized_chunks(
+                    queryset.all(), OrderSerializer, {}, options['chunk_size']))
+
+            def written():
+                # chunks go out as they come, like a StreamingHttpResponse
+                for _ in streamed():
+                    pass
+
+            if b''.join(streamed()) != bodies['json']:
+                raise CommandError(f'the streamed list of {size} orders renders differently')
+            for name, func in [('buffered', buffered), ('streamed', written)]:
+                self.report(size, name, 'orjson', len(bodies['json']), measure(func, repeat=options['repeat']))
+
+    def report(self, size, step, name, length, stats):
+        rate = size / max(stats['p50_ms'], 1e-6) * 1000
+        self.stdout.write(f'{size:>6} {step:<9} {name:<8} {length / 1024:>8.1f} '
+                          f'{stats["p50_ms"]:>9} {rate:>10.0f} {stats["peak_kib"]:>9}')
@@ -0,0 +1,93 @@
+import random
+from decimal import Decimal
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from likes.models import LikeCount
+from store.fastpath import CollectionValuesSerializer, ProductValuesSerializer, ReviewValuesSerializer
+from store.models import Collection, Product, Review
+from store.optimizer import optimize_queryset
+from store.profiling import measure
+from tags.models import Tag, TaggedItem
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compares rows/second of the catalog model serializers and their .values() fast paths, ' \
+           'after checking both render the same bytes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        # everything created here is rolled back at the end
+        try:
+            with transaction.atomic():
+                self.run(options['sizes'], options['repeat'], random.Random(options['seed']))
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, sizes, repeat, rng):
+        count = max(sizes)
+        collection = Collection.objects.create(title='benchmark')
+        Collection.objects.bulk_create([Collection(title=f'benchmark {i}') for i in range(count)])
+        products = Product.objects.bulk_create([
+            Product(title=f'benchmark {i}', slug=f'benchmark-{i}',
+                    description=None if i % 10 == 0 else 'x' * rng.randint(0, 500),
+                    price=Decimal(rng.randint(100, 999999)).scaleb(-2),
+                    inventory=rng.randint(1, 1000), collection=collection)
+            for i in range(count)
+        ])
+        content_type = ContentType.objects.get_for_model(Product)
+        tags = Tag.objects.bulk_create([Tag(label=f'benchmark-{i}') for i in range(20)])
+        TaggedItem.objects.bulk_create([
+            TaggedItem(tag=tag, content_type=content_type, object_id=product.pk)
+            for product in products for tag in rng.sample(tags, rng.randint(0, 3))])
+        LikeCount.objects.bulk_create([
+            LikeCount(content_type=content_type, object_id=product.pk, count=rng.randint(1, 500))
+            for product in products if rng.random() < 0.5])
+        Review.objects.bulk_create([
+            Review(product=products[0], name=f'reviewer {i}', description='y' * rng.randint(1, 300))
+            for i in range(count)])
+
+        benchmarks = [
+            (ProductValuesSerializer, Product.objects.filter(collection=collection)),
+            (CollectionValuesSerializer, Collection.objects.filter(title__startswith='benchmark')),
+            (ReviewValuesSerializer, Review.objects.filter(product=products[0])),
+        ]
+        renderer = JSONRenderer()
+        self.stdout.write(f'{"serializer":<24} {"rows":>6} {"path":<7} {"queries":>7} '
+                          f'{"p50 ms":>9} {"rows/s":>10} {"speedup":>8}')
+        for values_serializer, queryset in benchmarks:
+            serializer = values_serializer.serializer_class
+            for size in sizes:
+                rows = queryset.order_by('pk')[:size]
+
+                # .all() so every run queries, neither path gets to reuse the
+                # other's result cache
+                def model():
+                    return renderer.render(
+                        serializer(optimize_queryset(rows.all(), serializer), many=True).data)
+
+                def values():
+                    return renderer.render(values_serializer(values_serializer.values(rows.all())).data)
+
+                if model() != values():
+                    raise CommandError(f'{serializer.__name__} and {values_serializer.__name__} '
+                                       f'render different json for {size} rows')
+
+                baseline = None
+                for name, func in [('model', model), ('values', values)]:
+                    stats = measure(func, repeat=repeat)
+                    rate = size / max(stats['p50_ms'], 1e-6) * 1000
+                    baseline = baseline or rate
+                    self.stdout.write(
+                        f'{serializer.__name__:<24} {size:>6} {name:<7} {stats["queries"]:>7} '
+                        f'{stats["p50_ms"]:>9} {rate:>10.0f} {rate / baseline:>7.1f}x')
@@ -0,0 +1,60 @@
+import time
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from core.authentication import StatelessJWTAuthentication
+from core.tokens import ClaimsRefreshToken
+from store.benchmarks.endpoints import seed
+from store.profiling import measure
+from store.views import OrderViewSet
+
+
+class Command(BaseCommand):
+    help = 'Compares authenticated /store/orders/ throughput with database and stateless JWT authentication.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--orders', type=int, default=3,
+                            help='Orders in the seeded data, kept small so authentication dominates.')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def run(self, options):
+        fixtures = seed(orders=options['orders'])
+        client = APIClient()
+        token = ClaimsRefreshToken.for_user(fixtures['customer_user']).access_token
+        client.credentials(HTTP_AUTHORIZATION=f'JWT {token}')
+
+        def call():
+            response = client.get('/store/orders/')
+            assert response.status_code == 200, response.status_code
+
+        self.stdout.write(f'{"authentication":<28} {"queries":>7} {"p50 ms":>8} '
+                          f'{"p95 ms":>8} {"req/s":>8}')
+        saved = OrderViewSet.authentication_classes
+        try:
+            for name, authentication in [('JWTAuthentication', JWTAuthentication),
+                                         ('StatelessJWTAuthentication', StatelessJWTAuthentication)]:
+                OrderViewSet.authentication_classes = [authentication]
+                # the token version is cached after the first request, as in
+                # production, so time the warm path
+                cache.clear()
+                stats = measure(call, repeat=options['repeat'])
+                start = time.perf_counter()
+                for _ in range(options['repeat']):
+                    call()
+                throughput = options['repeat'] / (time.perf_counter() - start)
+                self.stdout.write(f'{name:<28} {stats["queries"]:>7} {stats["p50_ms"]:>8} '
+                                  f'{stats["p95_ms"]:>8} {throughput:>8.0f}')
+        finally:
+            OrderViewSet.authentication_classes = saved
@@ -0,0 +1,42 @@
+import time
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from store.imports import IMPORT_BATCH_SIZE, IMPORT_FORMATS, ImportResult, import_products
+
+
+class Command(BaseCommand):
+    help = 'Creates or updates products from a CSV or NDJSON file in fixed-size batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=IMPORT_FORMATS,
+                            help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in IMPORT_FORMATS:
+            raise CommandError(f'Unknown format {file_format!r}, pass --format')
+        start = time.perf_counter()
+
+        def report(result):
+            # errors are printed and dropped batch by batch
+            for error in result.errors:
+                self.stderr.write(f'line {error["line"]}: {error["errors"]}')
+            result.errors.clear()
+            elapsed = max(time.perf_counter() - start, 1e-9)
+            rows = result.created + result.updated + result.error_count
+            self.stdout.write(f'{result.created} created, {result.updated} updated, '
+                              f'{result.error_count} errors ({rows / elapsed:.0f} rows/s)')
+
+        try:
+            with path.open('rb') as file:
+                result = import_products(file, file_format, options['batch_size'],
+                                         ImportResult(), report)
+        except OSError as error:
+            raise CommandError(str(error))
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result.created + result.updated} products with '
+            f'{result.error_count} errors in {elapsed:.2f}s.'))
@@ -0,0 +1,66 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.db.models import Max, Min
+from django.utils import timezone
+from store.models import Order
+from store.rollups import date_chunks, rebuild, sales_date
+
+
+def parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'Invalid date {value!r}, expected YYYY-MM-DD')
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the daily sales rollups from the order items, in parallel chunks of days. ' \
+           'Orders placed or changed in a chunk while it is rebuilt may be missed, rebuild it again.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=parse_date,
+                            help='First day, YYYY-MM-DD. Defaults to the day of the first order.')
+        parser.add_argument('--end', type=parse_date,
+                            help='Last day, YYYY-MM-DD. Defaults to the day of the last order.')
+        parser.add_argument('--chunk-days', type=int, default=30)
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        if options['chunk_days'] < 1 or options['workers'] < 1:
+            raise CommandError('--chunk-days and --workers must be at least 1')
+        bounds = Order.objects.aggregate(first=Min('placed_at'), last=Max('placed_at'))
+        if bounds['first'] is None and not (options['start'] and options['end']):
+            self.stdout.write('No orders to roll up.')
+            return
+        start = options['start'] or sales_date(bounds['first'])
+        end = options['end'] or max(sales_date(bounds['last']), timezone.localdate())
+        chunks = list(date_chunks(start, end, options['chunk_days']))
+        begin = time.perf_counter()
+
+        def work(chunk):
+            # every thread has its own connection
+            try:
+                while True:
+                    try:
+                        chunk_start = time.perf_counter()
+                        rows = rebuild(*chunk)
+                        return chunk, rows, time.perf_counter() - chunk_start
+                    except OperationalError as error:
+                        # sqlite fails writers instead of queueing them
+                        if 'locked' not in str(error):
+                            raise
+                        time.sleep(0.05)
+            finally:
+                connection.close()
+
+        total = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for (chunk_start, chunk_end), rows, elapsed in executor.map(work, chunks):
+                total += rows
+                self.stdout.write(f'{chunk_start} .. {chunk_end} {rows:>8} rows in {elapsed:.2f}s')
+        elapsed = max(time.perf_counter() - begin, 1e-9)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {len(chunks)} chunks from {start} to {end}, {total} rows in {elapsed:.2f}s.'))
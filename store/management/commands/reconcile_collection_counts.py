@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from store.models import Collection, Product
+
+
+class Command(BaseCommand):
+    help = 'Recomputes Collection.products_count in batches and fixes any drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        checked = fixed = 0
+
+        while True:
+            # walk collections by primary key so each batch is an index range
+            batch = list(Collection.objects.filter(pk__gt=last_id)
+                         .order_by('pk')
+                         .values_list('pk', 'products_count')[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1][0]
+
+            with transaction.atomic():
+                ids = [pk for pk, _ in batch]
+                actual = dict(Product.objects.filter(collection_id__in=ids)
+                              .order_by().values('collection_id')
+                              .annotate(count=Count('id'))
+                              .values_list('collection_id', 'count'))
+                drifted = [pk for pk, stored in batch
+                           if actual.get(pk, 0) != stored]
+                if drifted:
+                    # recount under the transaction instead of writing the
+                    # values read above, products may have moved since
+                    Collection.objects.recount_products(drifted)
+
+            checked += len(batch)
+            fixed += len(drifted)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} collections, fixed {fixed}.'))
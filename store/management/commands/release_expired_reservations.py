@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from store.inventory import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired inventory reservations in small batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        released = release_expired(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Released {released} expired reservations.'))
@@ -0,0 +1,300 @@
+import itertools
+import math
+import random
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.text import slugify
+from core.models import User
+from likes.models import LikeCount, LikedItem
+from store.models import (Cart, CartItem, Collection, Customer, Order, OrderItem,
+                          Product, Promotion, Review)
+from store.rollups import date_chunks, rebuild
+from tags.models import Tag, TaggedItem
+
+
+WORDS = ['classic', 'organic', 'smart', 'wireless', 'compact', 'deluxe', 'eco',
+         'portable', 'premium', 'vintage', 'ultra', 'mini', 'pro', 'rugged', 'soft',
+         'lamp', 'kettle', 'jacket', 'speaker', 'backpack', 'mug', 'chair', 'watch',
+         'blender', 'scarf', 'headphones', 'notebook', 'bottle', 'sneakers', 'desk']
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def zipf_weights(n, s=1.1):
+    # cumulative weights so random.choices() picks in O(log n)
+    return list(itertools.accumulate(1 / (rank + 1) ** s for rank in range(n)))
+
+
+@contextmanager
+def without_auto_now(*fields):
+    # let us backdate rows, auto_now_add would stamp every one with now()
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = 'Generates a large, skewed, reproducible store dataset with batched bulk inserts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--collections', type=int, default=50)
+        parser.add_argument('--products', type=int, default=20000)
+        parser.add_argument('--promotions', type=int, default=20)
+        parser.add_argument('--customers', type=int, default=20000)
+        parser.add_argument('--orders', type=int, default=270000)
+        parser.add_argument('--items-per-order', type=int, default=4,
+                            help='Average order items per order.')
+        parser.add_argument('--carts', type=int, default=20000)
+        parser.add_argument('--reviews', type=int, default=50000)
+        parser.add_argument('--tags', type=int, default=200)
+        parser.add_argument('--tagged-items', type=int, default=60000)
+        parser.add_argument('--likes', type=int, default=200000)
+        parser.add_argument('--days', type=int, default=365,
+                            help='Spread orders and carts over this many past days.')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.days = options['days']
+        # keep usernames and emails unique when seeding an existing database
+        self.prefix = f's{options["seed"]}u{User.objects.count()}-'
+
+        collection_ids = self.seed_collections(options['collections'])
+        promotion_ids = self.seed_promotions(options['promotions'])
+        product_ids, prices = self.seed_products(options['products'], collection_ids, promotion_ids)
+        user_ids, customer_ids = self.seed_customers(options['customers'])
+        self.seed_orders(options['orders'], options['items_per_order'],
+                         customer_ids, product_ids, prices)
+        self.seed_sales_rollups()
+        self.seed_carts(options['carts'], product_ids)
+        self.seed_reviews(options['reviews'], product_ids)
+        self.seed_tags(options['tags'], options['tagged_items'], product_ids)
+        self.seed_likes(options['likes'], user_ids, product_ids)
+
+    def insert(self, model, rows):
+        # rows is any iterable of unsaved instances, only one batch is ever
+        # held in memory. returns the largest pk from before the insert
+        start = time.perf_counter()
+        before = model.objects.aggregate(last=Max('pk'))['last'] or 0
+        count = 0
+        for chunk in batched(rows, self.batch_size):
+            model.objects.bulk_create(chunk)
+            count += len(chunk)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'{model.__name__:<12} {count:>10} rows '
+                          f'{count / max(elapsed, 1e-9):>10.0f} rows/s')
+        return before
+
+    def new_ids(self, model, before):
+        return list(model.objects.filter(pk__gt=before)
+                    .order_by('pk').values_list('pk', flat=True))
+
+    def past(self):
+        # more recent days are busier
+        days = self.days * (1 - self.rng.random() ** 0.5)
+        return self.now - timedelta(days=days)
+
+    def seed_collections(self, count):
+        before = self.insert(Collection, (
+            Collection(title=f'{self.rng.choice(WORDS).title()} {i}') for i in range(count)))
+        return self.new_ids(Collection, before)
+
+    def seed_promotions(self, count):
+        before = self.insert(Promotion, (
+            Promotion(description=f'Promotion {i}', discount=self.rng.choice([5, 10, 15, 25, 50]))
+            for i in range(count)))
+        return self.new_ids(Promotion, before)
+
+    def seed_products(self, count, collection_ids, promotion_ids):
+        collections = zipf_weights(len(collection_ids), 0.8)
+
+        def rows():
+            for i in range(count):
+                title = ' '.join(self.rng.sample(WORDS, 3)).title() + f' {i}'
+                yield Product(
+                    title=title,
+                    slug=slugify(title),
+                    description=' '.join(self.rng.choices(WORDS, k=30)),
+                    price=Decimal(self.rng.randint(100, 99999)) / 100,
+                    inventory=self.rng.randint(1, 1000),
+                    collection_id=self.rng.choices(collection_ids, cum_weights=collections)[0])
+
+        before = self.insert(Product, rows())
+        product_ids = self.new_ids(Product, before)
+        prices = dict(Product.objects.filter(pk__gt=before).values_list('pk', 'price'))
+
+        if promotion_ids:
+            through = Product.promotions.through
+            self.insert(through, (
+                through(product_id=product_id, promotion_id=promotion_id)
+                for product_id in product_ids if self.rng.random() < 0.1
+                for promotion_id in self.rng.sample(promotion_ids, 1)))
+        return product_ids, [prices[pk] for pk in product_ids]
+
+    def seed_customers(self, count):
+        password = make_password('password')
+        before = self.insert(User, (
+            User(username=f'{self.prefix}{i}', email=f'{self.prefix}{i}@example.com',
+                 password=password, first_name=self.rng.choice(WORDS).title(),
+                 last_name=self.rng.choice(WORDS).title())
+            for i in range(count)))
+        user_ids = self.new_ids(User, before)
+
+        memberships = [Customer.MEMBERSHIP_BRONZE] * 7 + \
+            [Customer.MEMBERSHIP_SILVER] * 2 + [Customer.MEMBERSHIP_GOLD]
+        before = self.insert(Customer, (
+            Customer(user_id=user_id, phone=f'555-{self.rng.randint(0, 9999999):07}',
+                     membership=self.rng.choice(memberships))
+            for user_id in user_ids))
+        return user_ids, self.new_ids(Customer, before)
+
+    def seed_orders(self, count, items_per_order, customer_ids, product_ids, prices):
+        customers = zipf_weights(len(customer_ids))
+        products = zipf_weights(len(product_ids))
+        statuses = [Order.PAYMENT_STATUS_COMPLETE] * 8 + \
+            [Order.PAYMENT_STATUS_PENDING, Order.PAYMENT_STATUS_FAILED]
+        start = time.perf_counter()
+        orders = items = 0
+
+        # orders go in one batch at a time so their ids are known when the
+        # batch's items are generated
+        with without_auto_now(Order._meta.get_field('placed_at')):
+            for size in (min(self.batch_size, count - done)
+                         for done in range(0, count, self.batch_size)):
+                before = Order.objects.aggregate(last=Max('pk'))['last'] or 0
+                Order.objects.bulk_create([
+                    Order(customer_id=customer_id,
+                          payment_status=self.rng.choice(statuses),
+                          placed_at=self.past())
+                    for customer_id in self.rng.choices(customer_ids, cum_weights=customers, k=size)])
+                lines = []
+                for order_id in self.new_ids(Order, before):
+                    picked = self.rng.choices(range(len(product_ids)), cum_weights=products,
+                                              k=max(1, round(self.rng.expovariate(1 / items_per_order))))
+                    for index in set(picked):
+                        lines.append(OrderItem(order_id=order_id, product_id=product_ids[index],
+                                               quantity=self.rng.randint(1, 5),
+                                               unit_price=prices[index]))
+                for chunk in batched(lines, self.batch_size):
+                    OrderItem.objects.bulk_create(chunk)
+                orders += size
+                items += len(lines)
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'{"Order":<12} {orders:>10} rows {orders / max(elapsed, 1e-9):>10.0f} rows/s')
+        self.stdout.write(f'{"OrderItem":<12} {items:>10} rows {items / max(elapsed, 1e-9):>10.0f} rows/s')
+
+    def seed_sales_rollups(self):
+        # the orders went in with bulk_create, which skips the rollups
+        start = time.perf_counter()
+        rows = sum(rebuild(*chunk) for chunk in date_chunks(
+            timezone.localdate(self.now - timedelta(days=self.days)), timezone.localdate(self.now), 30))
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'{"SalesRollups":<12} {rows:>10} rows {rows / max(elapsed, 1e-9):>10.0f} rows/s')
+
+    def seed_carts(self, count, product_ids):
+        products = zipf_weights(len(product_ids))
+        start = time.perf_counter()
+        carts = items = 0
+
+        # cart ids are uuids set on the instances, so each batch's items can
+        # go in right after it and nothing outlives the batch
+        with without_auto_now(Cart._meta.get_field('created_at')):
+            for size in (min(self.batch_size, count - done)
+                         for done in range(0, count, self.batch_size)):
+                chunk = [Cart(created_at=created_at, last_activity=created_at)
+                         for created_at in (self.past() for _ in range(size))]
+                Cart.objects.bulk_create(chunk)
+                lines = [
+                    CartItem(cart_id=cart.pk, product_id=product_id, quantity=self.rng.randint(1, 5))
+                    for cart in chunk
+                    for product_id in set(self.rng.choices(product_ids, cum_weights=products,
+                                                           k=self.rng.randint(1, 8)))]
+                for batch in batched(lines, self.batch_size):
+                    CartItem.objects.bulk_create(batch)
+                carts += size
+                items += len(lines)
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'{"Cart":<12} {carts:>10} rows {carts / max(elapsed, 1e-9):>10.0f} rows/s')
+        self.stdout.write(f'{"CartItem":<12} {items:>10} rows {items / max(elapsed, 1e-9):>10.0f} rows/s')
+
+    def seed_reviews(self, count, product_ids):
+        products = zipf_weights(len(product_ids))
+        self.insert(Review, (
+            Review(product_id=self.rng.choices(product_ids, cum_weights=products)[0],
+                   name=self.rng.choice(WORDS).title(),
+                   description=' '.join(self.rng.choices(WORDS, k=20)))
+            for _ in range(count)))
+
+    def seed_tags(self, tags, count, product_ids):
+        before = self.insert(Tag, (Tag(label=f'{self.rng.choice(WORDS)}-{i}') for i in range(tags)))
+        tag_ids = self.new_ids(Tag, before)
+        if not tag_ids:
+            return
+        content_type = ContentType.objects.get_for_model(Product)
+        weights = zipf_weights(len(tag_ids))
+        self.insert(TaggedItem, (
+            TaggedItem(tag_id=self.rng.choices(tag_ids, cum_weights=weights)[0],
+                       content_type=content_type, object_id=self.rng.choice(product_ids))
+            for _ in range(count)))
+
+    def stride(self, n):
+        # coprime with n, so stepping by it visits every index before repeating
+        while math.gcd(stride := self.rng.randrange(1, max(n, 2)), n) != 1:
+            pass
+        return stride
+
+    def seed_likes(self, count, user_ids, product_ids):
+        if not user_ids or not product_ids:
+            return
+        content_type = ContentType.objects.get_for_model(Product)
+        users = zipf_weights(len(user_ids))
+        products = zipf_weights(len(product_ids), 1.3)
+        counts = Counter()
+
+        def rows():
+            # each user's share of count is fixed up front, so likes come out
+            # user by user and only that user's products have to be tracked.
+            # a repeated draw walks on by a per-user stride to a product the
+            # user hasn't liked yet
+            previous = 0
+            for user_id, weight in zip(user_ids, users):
+                share = count * (weight - previous) / users[-1]
+                previous = weight
+                likes = min(int(share) + (self.rng.random() < share % 1), len(product_ids))
+                stride = self.stride(len(product_ids))
+                liked = set()
+                for index in self.rng.choices(range(len(product_ids)), cum_weights=products, k=likes):
+                    while index in liked:
+                        index = (index + stride) % len(product_ids)
+                    liked.add(index)
+                for index in sorted(liked):
+                    counts[product_ids[index]] += 1
+                    yield LikedItem(user_id=user_id, content_type=content_type,
+                                    object_id=product_ids[index])
+
+        self.insert(LikedItem, rows())
+        self.insert(LikeCount, (
+            LikeCount(content_type=content_type, object_id=product_id, count=likes_count)
+            for product_id, likes_count in sorted(counts.items())))
@@ -0,0 +1,71 @@
+import threading
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from store.models import Cart, CartItem, Collection, Product
+from store.serializers import AddCartItemSerializer
+
+
+class Command(BaseCommand):
+    help = 'Adds the same product to one cart from many threads and checks the final quantity.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--adds', type=int, default=50,
+                            help='Add-to-cart calls per thread.')
+
+    def handle(self, *args, **options):
+        threads, adds = options['threads'], options['adds']
+
+        # threads use their own connections, so this data is committed and
+        # cleaned up afterwards rather than rolled back
+        collection = Collection.objects.create(title='stress')
+        # every add reserves the whole line, stock for all of them
+        product = Product.objects.create(
+            title='stress', price=1, inventory=threads * adds, collection=collection)
+        cart = Cart.objects.create()
+        retries, errors = [], []
+
+        def worker():
+            try:
+                for _ in range(adds):
+                    while True:
+                        serializer = AddCartItemSerializer(
+                            data={'product_id': product.id, 'quantity': 1},
+                            context={'cart_id': cart.id})
+                        serializer.is_valid(raise_exception=True)
+                        try:
+                            serializer.save()
+                        except OperationalError as error:
+                            # sqlite fails lock upgrades instead of waiting
+                            if 'locked' not in str(error):
+                                raise
+                            retries.append(error)
+                            time.sleep(0.001)
+                            continue
+                        break
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        start = time.perf_counter()
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        lines = list(CartItem.objects.filter(cart=cart).values_list('quantity', flat=True))
+        cart.delete()
+        product.delete()
+        collection.delete()
+
+        if errors:
+            raise CommandError(f'{len(errors)} threads failed, first error: {errors[0]!r}')
+        if lines != [threads * adds]:
+            raise CommandError(f'Expected one line with quantity {threads * adds}, got {lines}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{threads * adds} concurrent adds, {len(retries)} lock retries in {elapsed:.2f}s, '
+            f'final quantity {lines[0]}.'))
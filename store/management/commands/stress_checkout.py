@@ -0,0 +1,100 @@
+import threading
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from rest_framework.exceptions import ValidationError
+from core.models import User
+from store.models import Cart, CartItem, Collection, Customer, Order, OrderItem, Product
+from store.serializers import CreateOrderSerializer
+
+
+class Command(BaseCommand):
+    help = 'Checks out many carts holding the same products concurrently and verifies nothing is oversold.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--carts-per-thread', type=int, default=10)
+        parser.add_argument('--products', type=int, default=3)
+        parser.add_argument('--stock', type=int, default=100,
+                            help='Starting inventory of each product, less than the total demand.')
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        per_thread = options['carts_per_thread']
+
+        # threads use their own connections, so this data is committed and
+        # cleaned up afterwards rather than rolled back
+        collection = Collection.objects.create(title='stress')
+        products = [Product.objects.create(title=f'stress {i}', price=10, inventory=options['stock'],
+                                           collection=collection)
+                    for i in range(options['products'])]
+        users = [User.objects.create(username=f'stress-checkout-{i}', email=f'stress-checkout-{i}@example.com')
+                 for i in range(threads)]
+        carts = []
+        for _ in range(threads * per_thread):
+            cart = Cart.objects.create()
+            CartItem.objects.bulk_create([CartItem(cart=cart, product=product, quantity=1)
+                                          for product in products])
+            carts.append(cart.id)
+
+        placed, rejected, retries, errors = [], [], [], []
+
+        def worker(user, cart_ids):
+            try:
+                for cart_id in cart_ids:
+                    while True:
+                        serializer = CreateOrderSerializer(
+                            data={'cart_id': cart_id}, context={'user_id': user.id})
+                        serializer.is_valid(raise_exception=True)
+                        try:
+                            placed.append(serializer.save().id)
+                        except ValidationError:
+                            rejected.append(cart_id)
+                        except OperationalError as error:
+                            # another checkout holds the write lock, retry the cart
+                            if 'locked' not in str(error):
+                                raise
+                            retries.append(cart_id)
+                            time.sleep(0.001)
+                            continue
+                        break
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        start = time.perf_counter()
+        workers = [threading.Thread(target=worker, args=(user, carts[i::threads]))
+                   for i, user in enumerate(users)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        sold = OrderItem.objects.filter(order_id__in=placed).values('product_id') \
+            .annotate(total=Sum('quantity'))
+        sold = {row['product_id']: row['total'] for row in sold}
+        inventory = dict(Product.objects.filter(pk__in=[p.pk for p in products])
+                         .values_list('id', 'inventory'))
+
+        OrderItem.objects.filter(order_id__in=placed).delete()
+        Order.objects.filter(pk__in=placed).delete()
+        Cart.objects.filter(pk__in=carts).delete()
+        Customer.objects.filter(user__in=users).delete()
+        User.objects.filter(pk__in=[user.pk for user in users]).delete()
+        Product.objects.filter(pk__in=[p.pk for p in products]).delete()
+        collection.delete()
+
+        if errors:
+            raise CommandError(f'{len(errors)} threads failed, first error: {errors[0]!r}')
+        for product in products:
+            if inventory[product.pk] < 0 or inventory[product.pk] + sold.get(product.pk, 0) != options['stock']:
+                raise CommandError(f'Inventory of {product} is {inventory[product.pk]} '
+                                   f'after selling {sold.get(product.pk, 0)}')
+        if len(placed) != min(options['stock'], len(carts)):
+            raise CommandError(f'Placed {len(placed)} orders, expected {min(options["stock"], len(carts))}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(placed)} orders placed, {len(rejected)} rejected for stock, '
+            f'{len(retries)} lock retries in {elapsed:.2f}s, nothing oversold.'))
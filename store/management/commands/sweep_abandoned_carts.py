@@ -0,0 +1,39 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from store.cleanup import ABANDONED_CART_AGE, sweep_abandoned_carts
+
+
+class Command(BaseCommand):
+    help = 'Deletes carts idle for longer than a given age in small batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, default=ABANDONED_CART_AGE / timedelta(days=1),
+                            help='Delete carts without item writes for this many days.')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--after',
+                            help='Resume from the created_at cursor printed by an earlier run.')
+
+    def handle(self, *args, **options):
+        after = None
+        if options['after']:
+            after = parse_datetime(options['after'])
+            if after is None:
+                raise CommandError(f'Invalid --after datetime: {options["after"]}')
+            if timezone.is_naive(after):
+                after = timezone.make_aware(after)
+        start = time.perf_counter()
+
+        def report(cursor, carts, rows):
+            elapsed = max(time.perf_counter() - start, 1e-9)
+            self.stdout.write(f'cursor {cursor[0].isoformat()} deleted {carts} carts, '
+                              f'{rows} rows ({rows / elapsed:.0f} rows/s)')
+
+        carts, rows = sweep_abandoned_carts(
+            timedelta(days=options['days']), options['batch_size'], after, report)
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {carts} carts and {rows} rows in total in {elapsed:.2f}s '
+            f'({carts / elapsed:.0f} carts/s).'))
@@ -0,0 +1,59 @@
+from django.db import migrations
+
+
+SQLITE_FORWARD = [
+    """CREATE VIRTUAL TABLE store_product_fts USING fts5(
+        title, description, content='store_product', content_rowid='id')""",
+    """CREATE TRIGGER store_product_fts_insert AFTER INSERT ON store_product BEGIN
+        INSERT INTO store_product_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END""",
+    """CREATE TRIGGER store_product_fts_delete AFTER DELETE ON store_product BEGIN
+        INSERT INTO store_product_fts(store_product_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END""",
+    """CREATE TRIGGER store_product_fts_update AFTER UPDATE OF title, description ON store_product BEGIN
+        INSERT INTO store_product_fts(store_product_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO store_product_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END""",
+    "INSERT INTO store_product_fts(store_product_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS store_product_fts_update',
+    'DROP TRIGGER IF EXISTS store_product_fts_delete',
+    'DROP TRIGGER IF EXISTS store_product_fts_insert',
+    'DROP TABLE IF EXISTS store_product_fts',
+]
+
+MYSQL_FORWARD = [
+    'CREATE FULLTEXT INDEX store_product_fulltext ON store_product (title, description)',
+]
+
+MYSQL_BACKWARD = [
+    'DROP INDEX store_product_fulltext ON store_product',
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for sql in statements.get(vendor, []):
+            schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_collection_products_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_FORWARD, 'mysql': MYSQL_FORWARD}),
+            run({'sqlite': SQLITE_BACKWARD, 'mysql': MYSQL_BACKWARD}),
+        ),
+    ]
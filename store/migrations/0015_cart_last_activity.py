@@ -0,0 +1,63 @@
+# Generated by Django 4.2 on 2026-10-18 09:03
+
+from datetime import timedelta
+from django.conf import settings
+from django.db import migrations, models, transaction
+from django.db.models import Max
+from django.utils import timezone
+import django.utils.timezone
+
+BATCH_SIZE = 1000
+
+
+def backfill_last_activity(apps, schema_editor):
+    # cart items have no timestamp, a reservation is written with every
+    # item change, so its newest expires_at less the TTL is the cart's last
+    # item activity. carts without one fall back to created_at. one short
+    # transaction per batch of carts
+    db = schema_editor.connection.alias
+    Cart = apps.get_model('store', 'Cart')
+    Reservation = apps.get_model('store', 'Reservation')
+    ttl = getattr(settings, 'STORE_RESERVATION_TTL', timedelta(minutes=15))
+    now = timezone.now()
+    carts = Cart.objects.using(db).order_by('pk').only('pk', 'created_at')
+    last_id = None
+    while True:
+        batch = list((carts if last_id is None else carts.filter(pk__gt=last_id))[:BATCH_SIZE])
+        if not batch:
+            break
+        last_id = batch[-1].pk
+        with transaction.atomic(using=db):
+            written = dict(Reservation.objects.using(db)
+                           .filter(cart_item__cart__in=[cart.pk for cart in batch])
+                           .order_by().values('cart_item__cart')
+                           .annotate(last=Max('expires_at'))
+                           .values_list('cart_item__cart', 'last'))
+            for cart in batch:
+                cart.last_activity = cart.created_at
+                if cart.pk in written:
+                    cart.last_activity = max(cart.created_at, min(written[cart.pk] - ttl, now))
+            Cart.objects.using(db).bulk_update(batch, ['last_activity'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_reservation'),
+    ]
+
+    atomic = False
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='last_activity',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.RunPython(backfill_last_activity,
+                             migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['created_at', 'id'], name='store_cart_created_e4200b_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2 on 2026-10-18 09:06
+
+from django.conf import settings
+from django.db import migrations, transaction
+
+BATCH_SIZE = 1000
+
+
+def create_missing_customers(apps, schema_editor):
+    # new users get a customer from a post_save signal, this covers the
+    # ones created before it. one short transaction per batch of users
+    db = schema_editor.connection.alias
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Customer = apps.get_model('store', 'Customer')
+    last_id = 0
+    while True:
+        user_ids = list(User.objects.using(db).filter(pk__gt=last_id)
+                        .order_by('pk').values_list('pk', flat=True)[:BATCH_SIZE])
+        if not user_ids:
+            break
+        last_id = user_ids[-1]
+        with transaction.atomic(using=db):
+            existing = set(Customer.objects.using(db).filter(user_id__in=user_ids)
+                           .values_list('user_id', flat=True))
+            Customer.objects.using(db).bulk_create([
+                Customer(user_id=user_id) for user_id in user_ids
+                if user_id not in existing])
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('store', '0015_cart_last_activity'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_customers,
+                             migrations.RunPython.noop),
+    ]
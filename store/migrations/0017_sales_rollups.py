@@ -0,0 +1,121 @@
+# Generated by Django 4.2 on 2026-10-18 10:08
+
+from django.db import migrations, models, transaction
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+
+def populate_sales_rollups(apps, schema_editor):
+    # existing orders, from here on the rollups are kept up to date as
+    # orders are placed and change. the collection rows are summed up from
+    # the product ones as they stream past
+    OrderItem = apps.get_model('store', 'OrderItem')
+    DailyProductSales = apps.get_model('store', 'DailyProductSales')
+    DailyCollectionSales = apps.get_model('store', 'DailyCollectionSales')
+    sales = OrderItem.objects \
+        .annotate(date=TruncDate('order__placed_at')) \
+        .values('date', 'product_id', 'product__collection_id', 'order__payment_status') \
+        .annotate(items=Count('id'), total_quantity=Sum('quantity'),
+                  revenue=Sum(F('quantity') * F('unit_price'),
+                              output_field=DecimalField(max_digits=14, decimal_places=2))) \
+        .order_by()
+    collections = {}
+    batch = []
+    for row in sales.iterator(chunk_size=BATCH_SIZE):
+        batch.append(DailyProductSales(
+            date=row['date'], product_id=row['product_id'],
+            collection_id=row['product__collection_id'],
+            payment_status=row['order__payment_status'], items=row['items'],
+            quantity=row['total_quantity'], revenue=row['revenue']))
+        totals = collections.setdefault(
+            (row['date'], row['product__collection_id'], row['order__payment_status']), [0, 0, 0])
+        totals[0] += row['items']
+        totals[1] += row['total_quantity']
+        totals[2] += row['revenue']
+        if len(batch) == BATCH_SIZE:
+            with transaction.atomic():
+                DailyProductSales.objects.bulk_create(batch)
+            batch = []
+    with transaction.atomic():
+        DailyProductSales.objects.bulk_create(batch)
+        DailyCollectionSales.objects.bulk_create([
+            DailyCollectionSales(date=date, collection_id=collection_id,
+                                 payment_status=payment_status, items=items,
+                                 quantity=quantity, revenue=revenue)
+            for (date, collection_id, payment_status), (items, quantity, revenue)
+            in collections.items()], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('store', '0016_backfill_customers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCollectionSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('payment_status', models.CharField(choices=[('P', 'Pending'), ('C', 'Complete'), ('F', 'Failed')], max_length=1)),
+                ('items', models.IntegerField(default=0)),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'verbose_name_plural': 'daily collection sales',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('payment_status', models.CharField(choices=[('P', 'Pending'), ('C', 'Complete'), ('F', 'Failed')], max_length=1)),
+                ('items', models.IntegerField(default=0)),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'verbose_name_plural': 'daily product sales',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['placed_at'], name='store_order_placed__4c2ef7_idx'),
+        ),
+        migrations.AddField(
+            model_name='dailyproductsales',
+            name='collection',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.collection'),
+        ),
+        migrations.AddField(
+            model_name='dailyproductsales',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.product'),
+        ),
+        migrations.AddField(
+            model_name='dailycollectionsales',
+            name='collection',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.collection'),
+        ),
+        migrations.AddIndex(
+            model_name='dailyproductsales',
+            index=models.Index(fields=['collection', 'date'], name='store_daily_collect_bb5a60_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyproductsales',
+            constraint=models.UniqueConstraint(fields=('date', 'product', 'payment_status'), name='store_dailyproductsales_unique_day_product_status'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailycollectionsales',
+            constraint=models.UniqueConstraint(fields=('date', 'collection', 'payment_status'), name='store_dailycollectionsales_unique_day_collection_status'),
+        ),
+        migrations.RunPython(populate_sales_rollups,
+                             migrations.RunPython.noop),
+    ]
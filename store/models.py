@@ -2,8 +2,14 @@
 from django.contrib import admin
 from django.conf import settings
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import Count, ExpressionWrapper, F, OuterRef, Prefetch, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from collections import Counter
 from uuid import uuid4
+from core.upserts import upsert_adding
+from .caching import bump_versions
 
 
 class Promotion(models.Model):
@@ -11,10 +17,38 @@ class Promotion(models.Model):
     discount = models.FloatField()
 
 
+class CollectionQuerySet(models.QuerySet):
+    def adjust_products_count(self, deltas):
+        # deltas is {collection_id: +n/-n}, applied in id order like the
+        # upserts in core.upserts
+        changed = False
+        for collection_id in sorted(deltas):
+            delta = deltas[collection_id]
+            if collection_id is not None and delta:
+                Collection.objects.filter(pk=collection_id).update(
+                    products_count=F('products_count') + delta)
+                changed = True
+        if changed:
+            bump_versions('collection')
+
+    def recount_products(self, ids):
+        counts = Product.objects.filter(collection_id=OuterRef('pk')) \
+            .order_by().values('collection_id') \
+            .annotate(count=Count('id')).values('count')
+        bump_versions('collection')
+        return Collection.objects.filter(pk__in=ids).update(
+            products_count=Coalesce(Subquery(counts), Value(0)))
+
+
 class Collection(models.Model):
     title = models.CharField(max_length=255)
     featured_product = models.ForeignKey(
         'Product', on_delete=models.SET_NULL, null=True, related_name='+')
+    # maintained by store.signals.handlers and ProductQuerySet, fix drift
+    # with the reconcile_collection_counts command
+    products_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = CollectionQuerySet.as_manager()
 
     def __str__(self):
         return self.title
@@ -23,6 +57,68 @@ class Collection(models.Model):
         ordering = ['title']
 
 
+class ProductQuerySet(models.QuerySet):
+    # bulk write paths skip model signals, so they keep
+    # Collection.products_count and the response cache versions in step
+    # themselves
+
+    def bulk_create(self, objs, *args, **kwargs):
+        upsert = kwargs.get('ignore_conflicts') or kwargs.get('update_conflicts')
+        with transaction.atomic(using=self.db):
+            moved_from = set()
+            if kwargs.get('update_conflicts'):
+                # upserted rows may leave their collection
+                objs = list(objs)
+                moved_from = set(self.filter(pk__in=[obj.pk for obj in objs if obj.pk is not None])
+                                 .values_list('collection_id', flat=True))
+            objs = super().bulk_create(objs, *args, **kwargs)
+            if upsert:
+                # we can't tell which rows were inserted, count them again
+                Collection.objects.recount_products(
+                    moved_from | {obj.collection_id for obj in objs})
+            else:
+                Collection.objects.adjust_products_count(
+                    Counter(obj.collection_id for obj in objs))
+            bump_versions('product')
+        return objs
+
+    def update(self, **kwargs):
+        if 'collection' not in kwargs and 'collection_id' not in kwargs:
+            rows = super().update(**kwargs)
+            bump_versions('product')
+            return rows
+
+        value = kwargs.get('collection', kwargs.get('collection_id'))
+        if isinstance(value, Collection):
+            value = value.pk
+        with transaction.atomic(using=self.db):
+            before = {
+                row['collection_id']: row['count'] for row in
+                self.order_by().values('collection_id').annotate(count=Count('id'))
+            }
+            moved_to = None
+            if not isinstance(value, int):
+                # an expression, e.g. bulk_update()'s Case(). evaluated on
+                # the rows before the update it says where they end up
+                moved_to = set(self.order_by().annotate(moved_to=value)
+                               .values_list('moved_to', flat=True).distinct())
+            rows = super().update(**kwargs)
+            if moved_to is None:
+                deltas = Counter({key: -count for key, count in before.items()})
+                deltas[value] += sum(before.values())
+                Collection.objects.adjust_products_count(deltas)
+            else:
+                Collection.objects.recount_products(set(before) | moved_to)
+            bump_versions('product')
+        return rows
+
+    def take_inventory(self, quantity):
+        # checkout's stock decrement. product responses show inventory, so
+        # it bumps 'product' like any other update, once the order commits.
+        # collection responses don't depend on it
+        return self.update(inventory=F('inventory') - quantity)
+
+
 class Product(models.Model):
     title = models.CharField(max_length=255)
     slug = models.SlugField(default='-')
@@ -35,11 +131,27 @@ class Product(models.Model):
         Collection, on_delete=models.PROTECT, related_name='products')
     promotions = models.ManyToManyField(Promotion, blank=True)
 
+    objects = ProductQuerySet.as_manager()
+
     def __str__(self) -> str:
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember where the product was loaded from to detect moves on save
+        if 'collection_id' in field_names:
+            instance._loaded_collection_id = instance.collection_id
+        return instance
+
     class Meta:
         ordering = ['title']
+        # composite indexes backing keyset pagination on each ordering field
+        indexes = [
+            models.Index(fields=['title', 'id']),
+            models.Index(fields=['price', 'id']),
+            models.Index(fields=['last_updated', 'id']),
+        ]
 
 
 class Customer(models.Model):
@@ -76,6 +188,24 @@ class Customer(models.Model):
         ordering = ['user__first_name', 'user__last_name']
 
 
+class OrderQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        if 'payment_status' not in kwargs:
+            return super().update(**kwargs)
+        # move the orders' totals to their new status in the sales rollups,
+        # saves do the same through store.signals.handlers
+        from .rollups import move_orders
+
+        with transaction.atomic(using=self.db):
+            old_statuses = {}
+            for pk, status in self.values_list('pk', 'payment_status'):
+                old_statuses.setdefault(status, []).append(pk)
+            rows = super().update(**kwargs)
+            for status, order_ids in old_statuses.items():
+                move_orders(order_ids, status)
+        return rows
+
+
 class Order(models.Model):
     PAYMENT_STATUS_PENDING = 'P'
     PAYMENT_STATUS_COMPLETE = 'C'
@@ -92,10 +222,24 @@ class Order(models.Model):
         max_length=1, choices=PAYMENT_STATUS_CHOICES, default=PAYMENT_STATUS_PENDING)
     customer = models.ForeignKey(Customer, on_delete=models.PROTECT)
 
+    objects = OrderQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # the rollups move the order's totals when this changes on save
+        if 'payment_status' in field_names:
+            instance._loaded_payment_status = instance.payment_status
+        return instance
+
     class Meta:
         permissions = [
             ('cancel_order', 'Can cancel order')
         ]
+        # rebuilding the sales rollups reads orders by day
+        indexes = [
+            models.Index(fields=['placed_at']),
+        ]
 
 
 class OrderItem(models.Model):
@@ -106,6 +250,77 @@ class OrderItem(models.Model):
     quantity = models.PositiveSmallIntegerField()
     unit_price = models.DecimalField(max_digits=6, decimal_places=2)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # what the rollups counted for this line, taken back out on change
+        if {'order_id', 'product_id', 'quantity', 'unit_price'}.issubset(field_names):
+            instance._loaded_sale = (instance.order_id, instance.product_id,
+                                     instance.quantity, instance.unit_price)
+        return instance
+
+
+class SalesRollupManager(models.Manager):
+    def apply_deltas(self, deltas):
+        # adds {key: [*other columns, items, quantity, revenue]} to the
+        # rollups with one upsert per batch, other columns are only set on
+        # new rows
+        columns = [*self.model.rollup_key, *self.model.rollup_columns, 'items', 'quantity', 'revenue']
+        rows = [(*key, *delta) for key, delta in sorted(deltas.items())]
+        # usually inside the checkout's transaction, no savepoint needed
+        with transaction.atomic(using=self.db, savepoint=False):
+            upsert_adding(self.model, self.model.rollup_key, columns,
+                          ['items', 'quantity', 'revenue'], rows, using=self.db)
+
+
+class SalesRollup(models.Model):
+    # order items summed per day and payment status, maintained by
+    # store.rollups as orders are placed and change status
+    date = models.DateField()
+    payment_status = models.CharField(max_length=1, choices=Order.PAYMENT_STATUS_CHOICES)
+    items = models.IntegerField(default=0)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    objects = SalesRollupManager()
+
+    class Meta:
+        abstract = True
+
+
+class DailyProductSales(SalesRollup):
+    # sales stay under the collection the product was in until the day is
+    # rebuilt
+    rollup_key = ['date', 'product_id', 'payment_status']
+    rollup_columns = ['collection_id']
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    collection = models.ForeignKey(Collection, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        verbose_name_plural = 'daily product sales'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product', 'payment_status'],
+                                    name='store_dailyproductsales_unique_day_product_status'),
+        ]
+        indexes = [
+            models.Index(fields=['collection', 'date']),
+        ]
+
+
+class DailyCollectionSales(SalesRollup):
+    # the product rows summed per collection, a dashboard's range of days
+    # reads a few rows per day instead of one per product sold
+    rollup_key = ['date', 'collection_id', 'payment_status']
+    rollup_columns = []
+    collection = models.ForeignKey(Collection, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        verbose_name_plural = 'daily collection sales'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'collection', 'payment_status'],
+                                    name='store_dailycollectionsales_unique_day_collection_status'),
+        ]
+
 
 class Address(models.Model):
     street = models.CharField(max_length=255)
@@ -114,9 +329,86 @@ class Address(models.Model):
     zip = models.DecimalField(max_digits=5, decimal_places=0, null=True)
 
 
+# quantity (smallint) * price (6, 2) summed over a cart
+TOTAL_PRICE_FIELD = models.DecimalField(max_digits=19, decimal_places=2)
+
+
+class CartQuerySet(models.QuerySet):
+    def with_totals(self):
+        # cart total and per line totals are computed by the database,
+        # the items prefetch only loads the product columns we serialize
+        return self.annotate(
+            total_price=Sum(F('items__quantity') * F('items__product__price'),
+                            output_field=TOTAL_PRICE_FIELD)
+        ).prefetch_related(
+            Prefetch('items', queryset=CartItem.objects.with_totals()))
+
+    def touch(self):
+        # record a write to the cart's items, see store.cleanup
+        return self.update(last_activity=timezone.now())
+
+    def abandoned(self, cutoff):
+        # last_activity is never before created_at, so the created_at index
+        # narrows the scan and last_activity filters what's left
+        return self.filter(created_at__lt=cutoff, last_activity__lt=cutoff)
+
+
 class Cart(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid4)
     created_at = models.DateTimeField(auto_now_add=True)
+    last_activity = models.DateTimeField(default=timezone.now, editable=False)
+
+    objects = CartQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+        ]
+
+
+class CartItemQuerySet(models.QuerySet):
+    def add(self, cart_id, product_id, quantity):
+        # insert the line or bump its quantity in a single statement, so
+        # concurrent adds to one cart can't race on unique (cart, product).
+        # a missing cart or product surfaces as an IntegrityError from the
+        # foreign keys instead of a separate existence check
+        connection = connections[self.db]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        cart_id = self.model._meta.get_field('cart').to_python(cart_id)
+        params = [
+            self.model._meta.get_field('cart').get_db_prep_value(cart_id, connection),
+            product_id,
+            quantity,
+        ]
+        with transaction.atomic(using=self.db), connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                cursor.execute(
+                    f'INSERT INTO {table} (cart_id, product_id, quantity) '
+                    f'VALUES (%s, %s, %s) ON DUPLICATE KEY UPDATE '
+                    f'quantity = quantity + VALUES(quantity), '
+                    f'id = LAST_INSERT_ID(id)', params)
+                pk = cursor.lastrowid
+                cursor.execute(
+                    f'SELECT quantity FROM {table} WHERE id = %s', [pk])
+                (quantity,) = cursor.fetchone()
+            else:
+                cursor.execute(
+                    f'INSERT INTO {table} (cart_id, product_id, quantity) '
+                    f'VALUES (%s, %s, %s) ON CONFLICT (cart_id, product_id) '
+                    f'DO UPDATE SET quantity = {table}.quantity + excluded.quantity '
+                    f'RETURNING id, quantity', params)
+                pk, quantity = cursor.fetchone()
+        return self.model.from_db(
+            self.db, ['id', 'cart_id', 'product_id', 'quantity'],
+            [pk, cart_id, product_id, quantity])
+
+    def with_totals(self):
+        return self.select_related('product').only(
+            'id', 'cart_id', 'quantity',
+            'product__id', 'product__title', 'product__price'
+        ).annotate(
+            total_price=ExpressionWrapper(F('quantity') * F('product__price'),
+                                          output_field=TOTAL_PRICE_FIELD))
 
 
 class CartItem(models.Model):
@@ -127,10 +419,30 @@ class CartItem(models.Model):
         validators=[MinValueValidator(1)]
     )
 
+    objects = CartItemQuerySet.as_manager()
+
     class Meta:
         unique_together = [['cart', 'product']]
 
 
+class Reservation(models.Model):
+    # stock held for a cart line until expires_at, see store.inventory
+    cart_item = models.OneToOneField(
+        CartItem, on_delete=models.CASCADE, related_name='reservation')
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # live reservations of a product: product = x AND expires_at > now
+            models.Index(fields=['product', 'expires_at']),
+            # the sweeper walks expired rows oldest first
+            models.Index(fields=['expires_at']),
+        ]
+
+
 class Review(models.Model):
     product = models.ForeignKey(
         Product, on_delete=models.CASCADE, related_name="reviews")
@@ -0,0 +1,119 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.relations import ManyRelatedField, RelatedField
+
+
+class _Plan:
+    def __init__(self):
+        self.select = []
+        self.prefetch = []
+        self.only = []
+        # cleared as soon as a field reads something we can't see, e.g. a
+        # SerializerMethodField or a model property, then every column loads
+        self.can_defer = True
+
+
+def _walk(serializer, model, prefix, plan, defer):
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if field.source == '*' or isinstance(field, serializers.SerializerMethodField):
+            plan.can_defer = False
+            continue
+
+        # follow dotted sources like 'user.first_name' through forward relations
+        current_model, path = model, prefix
+        attrs = field.source_attrs
+        try:
+            for attr in attrs[:-1]:
+                model_field = current_model._meta.get_field(attr)
+                if not (model_field.many_to_one or model_field.one_to_one):
+                    raise FieldDoesNotExist
+                plan.select.append(path + attr)
+                if model_field.concrete:
+                    plan.only.append(path + attr)
+                current_model, path = model_field.related_model, path + attr + '__'
+            model_field = current_model._meta.get_field(attrs[-1])
+        except FieldDoesNotExist:
+            plan.can_defer = False
+            continue
+
+        name = path + model_field.name
+        nested = field.child if isinstance(field, serializers.ListSerializer) else field
+
+        if not model_field.is_relation:
+            plan.only.append(name)
+        elif model_field.many_to_many or model_field.one_to_many:
+            if isinstance(nested, serializers.ModelSerializer):
+                queryset = optimize_queryset(
+                    model_field.related_model._default_manager.all(),
+                    type(nested), defer,
+                    # the prefetch joins back on this column, keep it loaded
+                    keep=[model_field.field.name] if model_field.one_to_many else [])
+                plan.prefetch.append(Prefetch(name, queryset=queryset))
+            else:
+                plan.prefetch.append(name)
+        elif isinstance(nested, serializers.BaseSerializer):
+            # forward fk or one to one rendered inline
+            plan.select.append(name)
+            if model_field.concrete:
+                plan.only.append(name)
+            _walk(nested, model_field.related_model, name + '__', plan, defer)
+        elif isinstance(field, (RelatedField, ManyRelatedField)) or model_field.concrete:
+            # only the key is rendered
+            if model_field.concrete:
+                plan.only.append(name)
+            else:
+                plan.select.append(name)
+        else:
+            plan.can_defer = False
+
+
+# adds the select_related, prefetch_related and only() calls needed to
+# render queryset through serializer_class without extra queries
+def optimize_queryset(queryset, serializer_class, defer=True, keep=()):
+    if not (isinstance(serializer_class, type)
+            and issubclass(serializer_class, serializers.ModelSerializer)
+            and issubclass(queryset.model, serializer_class.Meta.model)):
+        return queryset
+
+    plan = _Plan()
+    _walk(serializer_class(), queryset.model, '', plan, defer)
+
+    # leave relations the queryset already loads its own way alone
+    seen = {lookup if isinstance(lookup, str) else lookup.prefetch_to
+            for lookup in queryset._prefetch_related_lookups}
+    prefetch = [lookup for lookup in plan.prefetch
+                if (lookup if isinstance(lookup, str) else lookup.prefetch_to) not in seen]
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    if plan.select and queryset.query.select_related is not True:
+        queryset = queryset.select_related(*plan.select)
+
+    deferred, _ = queryset.query.deferred_loading
+    if defer and plan.can_defer and not deferred:
+        pk = queryset.model._meta.pk.name
+        # pagination reads the ordering columns off the last row
+        ordering = []
+        for item in queryset.query.order_by or queryset.model._meta.ordering:
+            if not isinstance(item, str) or '__' in item:
+                continue
+            try:
+                ordering.append(queryset.model._meta.get_field(item.lstrip('-')).name)
+            except FieldDoesNotExist:
+                pass
+        queryset = queryset.only(*dict.fromkeys([pk, *keep, *ordering, *plan.only]))
+    return queryset
+
+
+class QuerysetOptimizerMixin:
+    # applies optimize_queryset() to every queryset the viewset renders. it
+    # hooks filter_queryset() so it still runs when a viewset overrides
+    # get_queryset(), and only defers columns on read requests
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        return optimize_queryset(
+            queryset, self.get_serializer_class(),
+            defer=self.request.method in SAFE_METHODS)
@@ -1,5 +1,276 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from django.core.paginator import EmptyPage, Page, Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from .counting import approximate_count
+
+
+class EstimatedPage(Page):
+    # has_more is set when the page was fetched past an estimated count
+    has_more = None
+
+    def has_next(self):
+        if self.has_more is None:
+            return super().has_next()
+        return self.has_more
+
+
+class EstimatedCountPaginator(Paginator):
+    # exact COUNT(*) for small results, estimated or cached past
+    # COUNT_ESTIMATE_THRESHOLD rows, see store.counting
+    approximate = False
+
+    @cached_property
+    def count(self):
+        if not hasattr(self.object_list, 'query'):
+            return super().count
+        (count, self.approximate) = approximate_count(self.object_list)
+        return count
+
+    def validate_number(self, number):
+        # an estimate can be short of the real count, so num_pages doesn't
+        # bound an approximate list. page() fetches the page to find out
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            if not self.approximate or int(number) < 1:
+                raise
+            return int(number)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.approximate:
+            return super().page(number)
+        # one row past the page says whether there is a next one
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage(_('That page contains no results'))
+        object_list = rows[:self.per_page]
+        if hasattr(self.object_list, '_result_cache'):
+            # still a queryset, like django's own pages, the admin's
+            # list_editable formset needs one. it holds the fetched rows the
+            # way prefetch_related() fills querysets
+            object_list = self.object_list[bottom:bottom + self.per_page]
+            object_list._result_cache = rows[:self.per_page]
+            object_list._prefetch_done = True
+        page = self._get_page(object_list, number, self)
+        page.has_more = len(rows) > self.per_page
+        return page
+
+    def _get_page(self, *args, **kwargs):
+        return EstimatedPage(*args, **kwargs)
+
 
 class DefaultPagination(PageNumberPagination):
     page_size = 10
-    
\ No newline at end of file
+    django_paginator_class = EstimatedCountPaginator
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data['count_is_approximate'] = self.page.paginator.approximate
+        return response
+
+    def get_paginated_response_schema(self, schema):
+        schema = super().get_paginated_response_schema(schema)
+        schema['properties']['count_is_approximate'] = {'type': 'boolean'}
+        return schema
+
+
+class KeysetPagination(BasePagination):
+    # seek pagination: no COUNT(*) and no OFFSET, the cursor carries the
+    # ordering values of the last row seen plus its id as a tiebreaker
+    cursor_query_param = 'cursor'
+    page_size = 10
+    ordering = '-id'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_model = queryset.model
+        self.annotations = queryset.query.annotations
+        self.fields = self.get_ordering(queryset)
+        cursor = self.decode_cursor(request)
+
+        reverse = False
+        if cursor is not None:
+            if cursor['o'] != [name for name, desc in self.fields]:
+                raise NotFound(self.invalid_cursor_message)
+            reverse = cursor['r']
+            queryset = queryset.filter(self.seek_filter(cursor, reverse))
+
+        order_by = [
+            ('-' if desc != reverse else '') + name for name, desc in self.fields
+        ]
+        results = list(queryset.order_by(*order_by)[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.build_link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.build_link(self.page[0], reverse=True)
+
+    def get_ordering(self, queryset):
+        # respect whatever OrderingFilter applied, falling back to the model
+        # ordering, and always finish with the primary key so ties are stable
+        ordering = list(queryset.query.order_by) or list(
+            queryset.model._meta.ordering) or [self.ordering]
+        fields = []
+        for item in ordering:
+            if not isinstance(item, str):
+                continue
+            desc = item.startswith('-')
+            name = item.lstrip('-')
+            if name == 'pk':
+                name = queryset.model._meta.pk.name
+            if name not in [f for f, _ in fields]:
+                fields.append((name, desc))
+        pk_name = queryset.model._meta.pk.name
+        if pk_name not in [f for f, _ in fields]:
+            fields.append((pk_name, fields[-1][1] if fields else True))
+        return fields
+
+    def seek_filter(self, cursor, reverse):
+        # (a, b, id) > (x, y, z) expanded into
+        # a > x OR (a = x AND b > y) OR (a = x AND b = y AND id > z)
+        values = [self.to_python(name, value)
+                  for name, value in zip(cursor['o'], cursor['v'])]
+        condition = Q()
+        equal = Q()
+        for (name, desc), value in zip(self.fields, values):
+            lookup = 'lt' if desc != reverse else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def to_python(self, name, value):
+        field = self.model_field(name)
+        try:
+            return field.to_python(value)
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def model_field(self, name):
+        if name in self.annotations:
+            # e.g. the relevance score added by the full text search filter
+            return self.annotations[name].output_field
+        model = self.page_model
+        *path, last = name.split('__')
+        for part in path:
+            model = model._meta.get_field(part).related_model
+        return model._meta.get_field(last)
+
+    def build_link(self, instance, reverse):
+        values = []
+        for name, _ in self.fields:
+            if isinstance(instance, dict):
+                # a .values() row, see store.fastpath
+                value = instance[name]
+            else:
+                value = instance
+                for part in name.split('__'):
+                    value = getattr(value, part)
+            values.append(value.isoformat() if hasattr(value, 'isoformat')
+                          else str(value))
+        cursor = {
+            'o': [name for name, _ in self.fields],
+            'v': values,
+            'r': reverse,
+        }
+        encoded = base64.urlsafe_b64encode(
+            json.dumps(cursor, separators=(',', ':')).encode()).decode()
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if not (isinstance(cursor['o'], list)
+                    and isinstance(cursor['v'], list)
+                    and len(cursor['o']) == len(cursor['v'])):
+                raise ValueError
+            cursor['r'] = bool(cursor['r'])
+            return cursor
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class KeysetOptInPagination(BasePagination):
+    # clients opt in by sending ?cursor= (empty for the first page), everyone
+    # else keeps the fallback behaviour (None means unpaginated)
+    keyset_class = KeysetPagination
+    fallback_class = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.keyset_class.cursor_query_param in request.query_params:
+            self.delegate = self.keyset_class()
+        elif self.fallback_class is not None:
+            self.delegate = self.fallback_class()
+        else:
+            self.delegate = None
+            return None
+        return self.delegate.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.delegate.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return (self.fallback_class or self.keyset_class)().get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.keyset_class.cursor_query_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Keyset pagination cursor, send it empty for the first page.',
+            'schema': {'type': 'string'},
+        }]
+
+
+class ProductPagination(KeysetOptInPagination):
+    fallback_class = DefaultPagination
+
+
+class OrderPagination(KeysetOptInPagination):
+    # never the whole table, a list without ?cursor= is the first page
+    fallback_class = KeysetPagination
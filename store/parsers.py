@@ -0,0 +1,47 @@
+import orjson
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, DataAndFiles, JSONParser
+from .renderers import MessagePackRenderer, ORJSONRenderer, msgpack
+
+
+class UploadParser(BaseParser):
+    # leaves the body unread for store.imports to stream through, it shows
+    # up as request.data['file'] like a multipart upload would
+    def parse(self, stream, media_type=None, parser_context=None):
+        return DataAndFiles({}, {'file': stream} if stream is not None else {})
+
+
+class CSVUploadParser(UploadParser):
+    media_type = 'text/csv'
+
+
+class NDJSONUploadParser(UploadParser):
+    media_type = 'application/x-ndjson'
+
+
+class ORJSONParser(JSONParser):
+    # orjson only reads utf-8, other charsets go through drf's JSONParser.
+    # like it with STRICT_JSON, NaN and Infinity are rejected
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if encoding.lower().replace('_', '-') not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+class MessagePackParser(BaseParser):
+    # needs the optional msgpack package, see REST_FRAMEWORK in settings
+    media_type = 'application/msgpack'
+    renderer_class = MessagePackRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read())
+        except ValueError as exc:
+            raise ParseError(f'MessagePack parse error - {exc or type(exc).__name__}')
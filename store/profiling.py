@@ -0,0 +1,79 @@
+import gc
+import statistics
+import time
+import tracemalloc
+from contextlib import contextmanager
+from django.db import connection
+
+
+class QueryProfile:
+    # counts queries and the rows their SELECTs return while active
+    def __init__(self, count_rows=True):
+        self.count_rows = count_rows
+        self.queries = 0
+        self.rows = 0
+        self._counting = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if self._counting:
+            return execute(sql, params, many, context)
+        self.queries += 1
+        result = execute(sql, params, many, context)
+        if self.count_rows and not many and sql.lstrip().upper().startswith('SELECT'):
+            # run the statement again as a COUNT(*) so the rows the caller
+            # fetches aren't consumed here
+            self._counting = True
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f'SELECT COUNT(*) FROM ({sql}) AS profiled_rows', params)
+                    self.rows += cursor.fetchone()[0]
+            finally:
+                self._counting = False
+        return result
+
+
+@contextmanager
+def profile_queries(count_rows=True):
+    profile = QueryProfile(count_rows)
+    with connection.execute_wrapper(profile):
+        yield profile
+
+
+def measure(func, repeat=10, warmup=1):
+    # runs func repeat times and returns a dict of query count, rows fetched,
+    # p50/p95 latency in ms and peak memory in KiB of a single run
+    for _ in range(warmup):
+        func()
+
+    with profile_queries() as profile:
+        func()
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    # keep collector pauses out of the percentiles
+    timings = []
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+    finally:
+        gc.enable()
+
+    # interpolated, with few samples p95 is close to the slowest run
+    p95 = statistics.quantiles(timings, n=20, method='inclusive')[18] if len(timings) > 1 else timings[0]
+    return {
+        'queries': profile.queries,
+        'rows': profile.rows,
+        'p50_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(p95, 3),
+        'peak_kib': round(peak / 1024, 1),
+    }
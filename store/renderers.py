@@ -0,0 +1,68 @@
+from decimal import Decimal
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+drf_encoder = JSONEncoder()
+
+
+def default(obj):
+    # called for what orjson can't encode itself. it already writes uuids
+    # and dates the way drf's encoder does, decimals are numbers like with
+    # COERCE_DECIMAL_TO_STRING off, the rest (lazy strings, timedeltas,
+    # querysets, generators) goes through drf's encoder
+    if isinstance(obj, Decimal):
+        return float(obj)
+    return drf_encoder.default(obj)
+
+
+class ORJSONRenderer(JSONRenderer):
+    # drf's JSONRenderer output through orjson. ?indent and ascii only
+    # output, which orjson can't write, and anything it rejects e.g. non
+    # string keys or integers past 64 bits, fall back to the stdlib json.
+    # NaN renders as null rather than raising
+    options = orjson.OPT_UTC_Z
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=default, option=self.options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # the same javascript safe escapes as drf
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+    def render_list(self, chunks):
+        # a json array from lists of items, one chunk rendered at a time so
+        # the whole list is never held serialized or encoded
+        yield b'['
+        separator = b''
+        for chunk in chunks:
+            if chunk:
+                yield separator + self.render(chunk)[1:-1]
+                separator = b','
+        yield b']'
+
+
+class MessagePackRenderer(BaseRenderer):
+    # compact binary responses for internal services that send
+    # Accept: application/msgpack. needs the optional msgpack package, see
+    # REST_FRAMEWORK in settings
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=default)
@@ -0,0 +1,161 @@
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import DailyCollectionSales, DailyProductSales, Order, OrderItem, Product
+
+SALES_GROUPS = {'day': 'date', 'collection': 'collection_id', 'product': 'product_id'}
+SALES_MAX_ROWS = getattr(settings, 'STORE_SALES_MAX_ROWS', 1000)
+REVENUE_FIELD = DecimalField(max_digits=14, decimal_places=2)
+
+
+def sales_date(placed_at):
+    # the day in the current time zone, TruncDate() agrees on the rebuild
+    return timezone.localdate(placed_at) if timezone.is_aware(placed_at) else placed_at.date()
+
+
+def add_sale(deltas, key, collection_id, items, quantity, revenue):
+    delta = deltas.setdefault(key, [collection_id, 0, 0, 0])
+    delta[1] += items
+    delta[2] += quantity
+    delta[3] += revenue
+
+
+def apply_deltas(deltas):
+    # deltas are {(date, product_id, payment_status): [collection_id, items,
+    # quantity, revenue]}, the collection rows get their sums
+    collections = {}
+    for (date, product_id, payment_status), (collection_id, *totals) in deltas.items():
+        delta = collections.setdefault((date, collection_id, payment_status), [0, 0, 0])
+        for index, total in enumerate(totals):
+            delta[index] += total
+    DailyProductSales.objects.apply_deltas(deltas)
+    DailyCollectionSales.objects.apply_deltas(collections)
+
+
+def record_lines(placed_at, payment_status, lines):
+    # lines are (product_id, collection_id, quantity, unit_price) of a new
+    # order, runs in the checkout transaction so the rollups commit with it
+    date = sales_date(placed_at)
+    deltas = {}
+    for product_id, collection_id, quantity, unit_price in lines:
+        add_sale(deltas, (date, product_id, payment_status), collection_id,
+                 1, quantity, quantity * unit_price)
+    apply_deltas(deltas)
+
+
+def record_line(item, sign):
+    # one order item added (sign=1) or taken back out (sign=-1), from the
+    # admin inline or a script. item is (order_id, product_id, quantity,
+    # unit_price)
+    order_id, product_id, quantity, unit_price = item
+    placed_at, payment_status = Order.objects.filter(pk=order_id) \
+        .values_list('placed_at', 'payment_status').get()
+    collection_id = Product.objects.filter(pk=product_id) \
+        .values_list('collection_id', flat=True).get()
+    apply_deltas({(sales_date(placed_at), product_id, payment_status):
+                  [collection_id, sign, sign * quantity, sign * quantity * unit_price]})
+
+
+def move_orders(order_ids, old_status):
+    # the orders' totals leave the old_status rows for their current status
+    sales = OrderItem.objects.filter(order_id__in=order_ids) \
+        .exclude(order__payment_status=old_status) \
+        .values('order__placed_at', 'order__payment_status', 'product_id', 'product__collection_id') \
+        .annotate(items=Count('id'), total_quantity=Sum('quantity'),
+                  revenue=Sum(F('quantity') * F('unit_price'), output_field=REVENUE_FIELD)) \
+        .order_by()
+    deltas = {}
+    for row in sales:
+        date = sales_date(row['order__placed_at'])
+        totals = row['items'], row['total_quantity'], row['revenue']
+        add_sale(deltas, (date, row['product_id'], old_status), row['product__collection_id'],
+                 *(-total for total in totals))
+        add_sale(deltas, (date, row['product_id'], row['order__payment_status']),
+                 row['product__collection_id'], *totals)
+    apply_deltas(deltas)
+
+
+def day_bounds(start, end):
+    # start..end inclusive as aware datetimes in the current time zone
+    since = datetime.combine(start, time.min)
+    until = datetime.combine(end + timedelta(days=1), time.min)
+    if settings.USE_TZ:
+        since, until = timezone.make_aware(since), timezone.make_aware(until)
+    return since, until
+
+
+def insert_select(cursor, model, queryset, columns):
+    # the select list is values() fields then annotations, columns maps
+    # their names to the model's columns
+    query = queryset.query
+    # django 5.2 selects them in the order values() named them instead
+    selected = getattr(query, 'selected', None)
+    names = list(selected) if selected else [*query.values_select, *query.annotation_select]
+    table = cursor.db.ops.quote_name(model._meta.db_table)
+    sql, params = query.get_compiler(using=queryset.db).as_sql()
+    cursor.execute(f'INSERT INTO {table} ({", ".join(columns.get(name, name) for name in names)}) {sql}',
+                   params)
+    return cursor.rowcount
+
+
+def rebuild(start, end, using='default'):
+    # recomputes the days start..end with a DELETE and an INSERT .. SELECT
+    # per table, nothing passes through python. sales under a product's old
+    # collection move to its current one
+    since, until = day_bounds(start, end)
+    product_sales = OrderItem.objects.using(using) \
+        .filter(order__placed_at__gte=since, order__placed_at__lt=until) \
+        .annotate(date=TruncDate('order__placed_at')) \
+        .values('date', 'product_id', 'product__collection_id', 'order__payment_status') \
+        .annotate(items=Count('id'), total_quantity=Sum('quantity'),
+                  revenue=Sum(F('quantity') * F('unit_price'), output_field=REVENUE_FIELD)) \
+        .order_by()
+    collection_sales = DailyProductSales.objects.using(using) \
+        .filter(date__gte=start, date__lte=end) \
+        .values('date', 'collection_id', 'payment_status') \
+        .annotate(sum_items=Sum('items'), sum_quantity=Sum('quantity'), sum_revenue=Sum('revenue')) \
+        .order_by()
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        DailyProductSales.objects.using(using).filter(date__gte=start, date__lte=end).delete()
+        DailyCollectionSales.objects.using(using).filter(date__gte=start, date__lte=end).delete()
+        rows = insert_select(cursor, DailyProductSales, product_sales, {
+            'product__collection_id': 'collection_id', 'order__payment_status': 'payment_status',
+            'total_quantity': 'quantity'})
+        insert_select(cursor, DailyCollectionSales, collection_sales, {
+            'sum_items': 'items', 'sum_quantity': 'quantity', 'sum_revenue': 'revenue'})
+    return rows
+
+
+def date_chunks(start, end, days):
+    while start <= end:
+        yield start, min(end, start + timedelta(days=days - 1))
+        start += timedelta(days=days)
+
+
+def sales_summary(start, end, group_by=(), statuses=(Order.PAYMENT_STATUS_COMPLETE,),
+                  collection_id=None, product_id=None, limit=SALES_MAX_ROWS):
+    # reads the rollups only, the collection ones unless products are asked
+    # for. returns the totals and, grouped by any of 'day', 'collection' and
+    # 'product', a row per group with days in order and otherwise the best
+    # sellers first
+    by_product = 'product' in group_by or product_id is not None
+    model = DailyProductSales if by_product else DailyCollectionSales
+    sales = model.objects.filter(date__gte=start, date__lte=end, payment_status__in=statuses)
+    if collection_id is not None:
+        sales = sales.filter(collection_id=collection_id)
+    if product_id is not None:
+        sales = sales.filter(product_id=product_id)
+    # named apart from the columns they sum
+    sums = dict(sum_items=Sum('items'), sum_quantity=Sum('quantity'), sum_revenue=Sum('revenue'))
+    names = {'sum_items': 'items', 'sum_quantity': 'quantity', 'sum_revenue': 'revenue',
+             **{field: name for name, field in SALES_GROUPS.items()}}
+    totals = {names[key]: value or 0 for key, value in sales.aggregate(**sums).items()}
+    if not group_by:
+        return totals, []
+    fields = [SALES_GROUPS[name] for name in group_by]
+    ordering = (['date'] if 'date' in fields else []) + ['-sum_revenue'] + fields
+    rows = sales.values(*fields).annotate(**sums).order_by(*ordering)[:limit]
+    return totals, [{names[key]: value for key, value in row.items()} for row in rows]
@@ -0,0 +1,97 @@
+import re
+from django.conf import settings
+from django.db import connection
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+
+class BaseSearchBackend:
+    # annotation holding the relevance score, higher is better
+    rank_field = 'search_rank'
+
+    def tokenize(self, terms):
+        return re.findall(r'\w+', terms or '')
+
+    def search(self, queryset, terms):
+        raise NotImplementedError
+
+
+class IContainsSearchBackend(BaseSearchBackend):
+    # what DRF's SearchFilter did before, for databases without a full text
+    # index. every term has to appear in the title or the description
+    def search(self, queryset, terms):
+        for token in self.tokenize(terms):
+            queryset = queryset.filter(
+                Q(title__icontains=token) | Q(description__icontains=token))
+        return queryset
+
+
+class MySQLFullTextSearchBackend(BaseSearchBackend):
+    # uses the FULLTEXT(title, description) index created in migration 0013,
+    # InnoDB keeps it in sync with every write on store_product
+    match = 'MATCH (`store_product`.`title`, `store_product`.`description`) ' \
+            'AGAINST (%s IN BOOLEAN MODE)'
+    # innodb_ft_min_token_size and INNODB_FT_DEFAULT_STOPWORD, words the
+    # index doesn't hold can't be required or nothing would ever match
+    min_token_size = getattr(settings, 'STORE_MYSQL_FT_MIN_TOKEN_SIZE', 3)
+    stopwords = frozenset([
+        'a', 'about', 'an', 'are', 'as', 'at', 'be', 'by', 'com', 'de', 'en', 'for',
+        'from', 'how', 'i', 'in', 'is', 'it', 'la', 'of', 'on', 'or', 'that', 'the',
+        'this', 'to', 'was', 'what', 'when', 'where', 'who', 'will', 'with', 'und', 'www',
+    ])
+
+    def indexed(self, token):
+        return len(token) >= self.min_token_size and token.lower() not in self.stopwords
+
+    def boolean_query(self, tokens):
+        # every indexed token is required, the rest only add to the rank.
+        # None when no token is indexed
+        if not any(self.indexed(token) for token in tokens):
+            return None
+        return ' '.join(f'+{token}*' if self.indexed(token) else f'{token}*' for token in tokens)
+
+    def search(self, queryset, terms):
+        tokens = self.tokenize(terms)
+        if not tokens:
+            return queryset
+        query = self.boolean_query(tokens)
+        if query is None:
+            return IContainsSearchBackend().search(queryset, terms)
+        return queryset.annotate(**{
+            self.rank_field: RawSQL(self.match, [query], output_field=FloatField())
+        }).filter(**{f'{self.rank_field}__gt': 0}).order_by(f'-{self.rank_field}')
+
+
+class SQLiteFTS5SearchBackend(BaseSearchBackend):
+    # store_product_fts is an external content FTS5 table created in
+    # migration 0013, triggers on store_product keep it in sync. a rank
+    # subquery that runs the MATCH itself would run it again for every
+    # candidate row, so the matches are materialized once with their bm25()
+    # and each product looks its rank up by rowid
+    matches = 'SELECT rowid FROM store_product_fts WHERE store_product_fts MATCH %s'
+    rank = ('(WITH ranked AS MATERIALIZED ('
+            'SELECT rowid, -bm25(store_product_fts) AS rank FROM store_product_fts '
+            'WHERE store_product_fts MATCH %s) '
+            'SELECT rank FROM ranked WHERE ranked.rowid = "store_product"."id")')
+
+    def search(self, queryset, terms):
+        tokens = self.tokenize(terms)
+        if not tokens:
+            return queryset
+        query = ' '.join(f'"{token}"*' for token in tokens)
+        return queryset.filter(id__in=RawSQL(self.matches, [query])).annotate(**{
+            self.rank_field: RawSQL(self.rank, [query], output_field=FloatField())
+        }).order_by(f'-{self.rank_field}')
+
+
+def get_search_backend():
+    # settings.STORE_SEARCH_BACKEND wins, otherwise pick by database vendor
+    path = getattr(settings, 'STORE_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    if connection.vendor == 'mysql':
+        return MySQLFullTextSearchBackend()
+    if connection.vendor == 'sqlite':
+        return SQLiteFTS5SearchBackend()
+    return IContainsSearchBackend()
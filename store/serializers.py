@@ -1,7 +1,23 @@
 from decimal import Decimal
-from django.db import transaction
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Case, IntegerField, Value, When
+from django.shortcuts import get_object_or_404
 from rest_framework import serializers
+from likes.serializers import LikesCountField
+from tags.serializers import TagsField
+from .customers import get_customer_id
+from .inventory import InsufficientInventory, reserve, reserved_subquery
 from .models import Cart, CartItem, Collection, Customer, Order, OrderItem, Product, Review
+from .rollups import SALES_GROUPS, SALES_MAX_ROWS, record_lines
+
+# the float 1.1 as a Decimal, prices with tax have always been computed with
+# its exact binary value. built once rather than per product
+TAX_RATE = Decimal(1.1)
+
+
+def insufficient_inventory_error(error, field='product_id'):
+    return serializers.ValidationError(
+        {field: [f"Not enough inventory for products {error.product_ids}."]})
 
 
 class CollectionSerializer(serializers.ModelSerializer):
@@ -16,13 +32,15 @@ class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ['id', 'title', 'description', 'slug',
-                  'inventory', 'price', 'price_with_tax', 'collection']
+                  'inventory', 'price', 'price_with_tax', 'collection', 'tags', 'likes_count']
 
+    tags = TagsField()
+    likes_count = LikesCountField()
     price_with_tax = serializers.SerializerMethodField(
         method_name='calculate_tax')
 
     def calculate_tax(self, product: Product):
-        return product.price * Decimal(1.1)
+        return product.price * TAX_RATE
 
 
 class ReviewSerializer(serializers.ModelSerializer):
@@ -47,6 +65,9 @@ class CartItemSerializer(serializers.ModelSerializer):
     total_price = serializers.SerializerMethodField()
 
     def get_total_price(self, cart_item: CartItem):
+        # annotated by CartItem.objects.with_totals()
+        if hasattr(cart_item, 'total_price'):
+            return cart_item.total_price
         return cart_item.quantity * cart_item.product.price
 
     class Meta:
@@ -61,6 +82,9 @@ class CartSerializer(serializers.ModelSerializer):
     total_price = serializers.SerializerMethodField()
 
     def get_total_price(self, cart):
+        # annotated by Cart.objects.with_totals(), Sum() over no items is None
+        if hasattr(cart, 'total_price'):
+            return cart.total_price if cart.total_price is not None else 0
         return sum([item.quantity * item.product.price for item in cart.items.all()])
 
     class Meta:
@@ -72,14 +96,9 @@ class CartSerializer(serializers.ModelSerializer):
 class AddCartItemSerializer(serializers.ModelSerializer):
     product_id = serializers.IntegerField()
 
-    # validate specific field
-    def validate_product_id(self, value):
-        if not Product.objects.filter(pk=value).exists():
-            raise serializers.ValidationError(
-                "No product with given id was found.")
-        return value
-
-    # override default save method to prevent duplicate products in cart
+    # override default save method to prevent duplicate products in cart,
+    # the upsert adds to the quantity of an existing line and the whole line
+    # is reserved again
 
     def save(self, **kwargs):
         cart_id = self.context['cart_id']
@@ -87,15 +106,23 @@ class AddCartItemSerializer(serializers.ModelSerializer):
         quantity = self.validated_data['quantity']
 
         try:
-            cart_item = CartItem.objects.get(
-                cart_id=cart_id, product_id=product_id)
-            cart_item.quantity += quantity
-            cart_item.save()
-            self.instance = cart_item
-        except CartItem.DoesNotExist:
-            self.instance = CartItem.objects.create(
-                cart_id=cart_id, **self.validated_data)
-            # cart_item = CartItem.objects.create(cart_id=cart_id, product_id=product_id, quantity=quantity)
+            with transaction.atomic():
+                self.instance = CartItem.objects.add(cart_id, product_id, quantity)
+                reserve([self.instance])
+        except InsufficientInventory as error:
+            if error.missing_ids:
+                raise serializers.ValidationError(
+                    {'product_id': ["No product with given id was found."]})
+            raise insufficient_inventory_error(error)
+        except IntegrityError:
+            # the foreign keys replace an upfront exists() query, only look
+            # up which one failed once the insert has been rejected
+            if not Product.objects.filter(pk=product_id).exists():
+                raise serializers.ValidationError(
+                    {'product_id': ["No product with given id was found."]})
+            # the same 404 as bulk for an unknown cart
+            get_object_or_404(Cart, pk=cart_id)
+            raise
 
         return self.instance
 
@@ -109,6 +136,71 @@ class UpdateCartItemSerializer(serializers.ModelSerializer):
         model = CartItem
         fields = ['quantity']
 
+    def update(self, instance, validated_data):
+        try:
+            with transaction.atomic():
+                instance = super().update(instance, validated_data)
+                reserve([instance])
+        except InsufficientInventory as error:
+            raise insufficient_inventory_error(error, 'quantity')
+        return instance
+
+
+class BulkCartItemListSerializer(serializers.ListSerializer):
+    def validate(self, attrs):
+        product_ids = [change['product_id'] for change in attrs]
+        if len(set(product_ids)) != len(product_ids):
+            raise serializers.ValidationError(
+                "Each product can only appear once.")
+
+        # one query for every product id in the request
+        found = set(Product.objects.filter(
+            pk__in=product_ids).values_list('id', flat=True))
+        missing = sorted(set(product_ids) - found)
+        if missing:
+            raise serializers.ValidationError(
+                f"No products with given ids were found: {missing}.")
+        return attrs
+
+    def save(self, **kwargs):
+        cart_id = self.context['cart_id']
+        removed = [change['product_id'] for change in self.validated_data
+                   if change['quantity'] == 0]
+        kept = [CartItem(cart_id=cart_id, **change) for change in self.validated_data
+                if change['quantity'] > 0]
+
+        try:
+            with transaction.atomic():
+                if removed:
+                    CartItem.objects.filter(
+                        cart_id=cart_id, product_id__in=removed).delete()
+                if kept:
+                    # inserts new lines and overwrites the quantity of existing
+                    # ones in one statement
+                    CartItem.objects.bulk_create(
+                        kept,
+                        update_conflicts=True,
+                        unique_fields=(['cart', 'product'] if connection.features.supports_update_conflicts_with_target
+                                       else None),
+                        update_fields=['quantity'])
+                    # not every backend returns ids from the upsert
+                    reserve(list(CartItem.objects.filter(
+                        cart_id=cart_id, product_id__in=[item.product_id for item in kept]
+                    ).only('id', 'product_id', 'quantity')))
+        except InsufficientInventory as error:
+            raise insufficient_inventory_error(error)
+
+        return Cart.objects.with_totals().get(pk=cart_id)
+
+
+class CartItemChangeSerializer(serializers.Serializer):
+    # quantity sets the line's quantity, 0 removes the line
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=0, max_value=32767)
+
+    class Meta:
+        list_serializer_class = BulkCartItemListSerializer
+
 
 class CustomerSerializer(serializers.ModelSerializer):
     user_id = serializers.IntegerField(read_only=True)
@@ -135,28 +227,91 @@ class OrderSerializer(serializers.ModelSerializer):
 
 
 class CreateOrderSerializer(serializers.Serializer):
+    cart_id = serializers.UUIDField()
 
-    with transaction.atomic():
-        cart_id = serializers.UUIDField()
-
-        def save(self, **kwargs):
-
-            cart_id = self.validated_data['cart_id']
-
-            (customer, created) = Customer.objects.get_or_create(
-                user_id=self.context['user_id'])
-            order = Order.objects.create(customer=customer)
-
-            cart_items = CartItem.objects.select_related('product').filter(
-                cart_id=cart_id)
-            order_items = [
+    # the whole checkout runs in one transaction with a fixed number of
+    # queries however many items the cart holds
+    def save(self, **kwargs):
+        cart_id = self.validated_data['cart_id']
+
+        with transaction.atomic():
+            # resolved here rather than trusted from the token, the cached
+            # id is dropped when its customer is deleted
+            customer_id = get_customer_id(self.context['user_id'])
+
+            # snapshot the cart once, prices are copied onto the order items
+            cart_items = list(CartItem.objects.filter(cart_id=cart_id)
+                              .values_list('id', 'product_id', 'quantity', 'product__price',
+                                           'product__collection_id'))
+            if not cart_items:
+                raise serializers.ValidationError(
+                    {'cart_id': ['No cart with the given id was found or the cart is empty.']})
+
+            # one conditional UPDATE for every product, a row whose stock is
+            # too low once other carts' live reservations are held back is
+            # left out and the whole order is rejected. this cart's own
+            # reservations, live or expired, go with the cart below
+            quantities = {product_id: quantity for _, product_id, quantity, *_ in cart_items}
+            needed = Case(*[When(pk=product_id, then=Value(quantity))
+                            for product_id, quantity in quantities.items()],
+                          output_field=IntegerField())
+            held = reserved_subquery(exclude_cart_items=[item_id for item_id, *_ in cart_items])
+            updated = Product.objects.filter(
+                pk__in=quantities, inventory__gte=needed + held
+            ).take_inventory(needed)
+            if updated != len(quantities):
+                raise serializers.ValidationError(
+                    {'cart_id': ['Not enough inventory for some products in the cart.']})
+
+            order = Order.objects.create(customer_id=customer_id)
+            OrderItem.objects.bulk_create([
                 OrderItem(
                     order=order,
-                    product=item.product,
-                    price=item.product.price,
-                    quantity=item.quantity
-                ) for item in cart_items
-            ]
-            OrderItem.objects.bulk_create(order_items)
-
-            Cart.objects.filter(pk=cart_id).delete()
+                    product_id=product_id,
+                    unit_price=price,
+                    quantity=quantity
+                ) for _, product_id, quantity, price, _ in cart_items
+            ])
+            record_lines(order.placed_at, order.payment_status, [
+                (product_id, collection_id, quantity, price)
+                for _, product_id, quantity, price, collection_id in cart_items])
+
+            # a concurrent checkout of the same cart got here first
+            (deleted, _) = Cart.objects.filter(pk=cart_id).delete()
+            if not deleted:
+                raise serializers.ValidationError(
+                    {'cart_id': ['This cart has already been checked out.']})
+
+            return order
+
+
+class SalesQuerySerializer(serializers.Serializer):
+    start = serializers.DateField()
+    end = serializers.DateField()
+    # comma separated, e.g. ?group_by=day,collection
+    group_by = serializers.CharField(required=False, default='')
+    status = serializers.CharField(required=False, default=Order.PAYMENT_STATUS_COMPLETE)
+    collection = serializers.IntegerField(required=False)
+    product = serializers.IntegerField(required=False)
+    limit = serializers.IntegerField(required=False, min_value=1,
+                                     max_value=SALES_MAX_ROWS, default=SALES_MAX_ROWS)
+
+    def validate_group_by(self, value):
+        names = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = set(names) - set(SALES_GROUPS)
+        if unknown:
+            raise serializers.ValidationError(
+                f'Unknown groups {", ".join(sorted(unknown))}, expected any of {", ".join(SALES_GROUPS)}.')
+        return list(dict.fromkeys(names))
+
+    def validate_status(self, value):
+        statuses = [status.strip() for status in value.split(',') if status.strip()]
+        choices = dict(Order.PAYMENT_STATUS_CHOICES)
+        if not statuses or set(statuses) - set(choices):
+            raise serializers.ValidationError(f'Expected any of {", ".join(choices)}.')
+        return statuses
+
+    def validate(self, data):
+        if data['start'] > data['end']:
+            raise serializers.ValidationError({'end': ['Must not be before start.']})
+        return data
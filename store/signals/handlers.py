@@ -0,0 +1,122 @@
+from django.conf import settings
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from store.caching import bump_versions
+from store.customers import forget_customer_id
+from store.models import Collection, Customer, Order, OrderItem, Product, Promotion, Review
+from store.rollups import move_orders, record_line
+from tags.models import Tag, TaggedItem
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def create_customer_for_new_user(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        Customer.objects.create(user=instance)
+
+
+@receiver(post_delete, sender=Customer)
+def forget_deleted_customer(sender, instance, **kwargs):
+    forget_customer_id(instance.user_id)
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_collection(sender, instance, raw, **kwargs):
+    if raw or instance.pk is None or hasattr(instance, '_loaded_collection_id'):
+        return
+    # instance wasn't loaded from the db, look up where it lives now
+    instance._loaded_collection_id = Product.objects.filter(
+        pk=instance.pk).values_list('collection_id', flat=True).first()
+
+
+@receiver(post_save, sender=Product)
+def update_products_count_on_save(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    if created:
+        Collection.objects.adjust_products_count({instance.collection_id: 1})
+    else:
+        old_collection_id = getattr(instance, '_loaded_collection_id', None)
+        if old_collection_id != instance.collection_id:
+            Collection.objects.adjust_products_count({
+                old_collection_id: -1,
+                instance.collection_id: 1,
+            })
+    instance._loaded_collection_id = instance.collection_id
+
+
+@receiver(post_delete, sender=Product)
+def update_products_count_on_delete(sender, instance, **kwargs):
+    Collection.objects.adjust_products_count({instance.collection_id: -1})
+
+
+@receiver(pre_save, sender=Order)
+def remember_order_status(sender, instance, raw, **kwargs):
+    if raw or instance.pk is None or hasattr(instance, '_loaded_payment_status'):
+        return
+    instance._loaded_payment_status = Order.objects.filter(
+        pk=instance.pk).values_list('payment_status', flat=True).first()
+
+
+@receiver(post_save, sender=Order)
+def move_sales_on_status_change(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    old_status = getattr(instance, '_loaded_payment_status', None)
+    if not created and old_status is not None and old_status != instance.payment_status:
+        move_orders([instance.pk], old_status)
+    instance._loaded_payment_status = instance.payment_status
+
+
+@receiver(pre_save, sender=OrderItem)
+def remember_order_item_sale(sender, instance, raw, **kwargs):
+    if raw or instance.pk is None or hasattr(instance, '_loaded_sale'):
+        return
+    instance._loaded_sale = OrderItem.objects.filter(pk=instance.pk).values_list(
+        'order_id', 'product_id', 'quantity', 'unit_price').first()
+
+
+# checkout writes its items with bulk_create and records them itself, these
+# cover items added, changed or removed one at a time e.g. in the admin
+@receiver(post_save, sender=OrderItem)
+def update_sales_on_item_save(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    sale = (instance.order_id, instance.product_id, instance.quantity, instance.unit_price)
+    loaded = None if created else getattr(instance, '_loaded_sale', None)
+    if loaded != sale:
+        if loaded is not None:
+            record_line(loaded, -1)
+        record_line(sale, 1)
+    instance._loaded_sale = sale
+
+
+@receiver(post_delete, sender=OrderItem)
+def update_sales_on_item_delete(sender, instance, **kwargs):
+    record_line((instance.order_id, instance.product_id, instance.quantity, instance.unit_price), -1)
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver(m2m_changed, sender=Product.promotions.through)
+def invalidate_product_cache(sender, **kwargs):
+    bump_versions('product')
+
+
+@receiver([post_save, post_delete], sender=Collection)
+def invalidate_collection_cache(sender, **kwargs):
+    bump_versions('collection')
+
+
+@receiver([post_save, post_delete], sender=Promotion)
+def invalidate_promotion_cache(sender, **kwargs):
+    bump_versions('promotion')
+
+
+@receiver([post_save, post_delete], sender=Review)
+def invalidate_review_cache(sender, **kwargs):
+    bump_versions('review')
+
+
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=TaggedItem)
+def invalidate_tag_cache(sender, **kwargs):
+    bump_versions('tag')
@@ -1,3 +1,1253 @@
-from django.test import TestCase
+import csv
+import json
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+from uuid import uuid4
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count, F, Sum, Value
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from core.models import User
+from core.tokens import ClaimsRefreshToken
+from likes.counters import buffer
+from likes.models import LikeCount, LikedItem
+from tags.models import Tag, TaggedItem
+from .caching import get_or_set_coalesced, get_versions
+from .cleanup import sweep_abandoned_carts
+from .counting import approximate_count
+from .customers import customer_id_key, get_customer_id
+from .exports import stream_export
+from .fastpath import CollectionValuesSerializer, ProductValuesSerializer
+from .filters import MAX_TAGS
+from .imports import import_products
+from .inventory import RESERVATION_TTL, release_expired, reserve
+from .management.commands.benchmark_cart_totals import LegacyCartItemSerializer, LegacyCartSerializer
+from .models import (Cart, CartItem, Collection, Customer, DailyCollectionSales, DailyProductSales, Order,
+                     OrderItem, Product, Reservation, Review)
+from .pagination import EstimatedCountPaginator
+from .renderers import ORJSONRenderer, msgpack
+from .rollups import rebuild
+from .search import MySQLFullTextSearchBackend
+from .serializers import CartSerializer, CreateOrderSerializer, ProductSerializer
 
-# Create your tests here.
+
+class AddCartItemTests(TestCase):
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        collection = Collection.objects.create(title='Lamps')
+        cls.product = Product.objects.create(title='Desk Lamp', price=10, inventory=2, collection=collection)
+        cls.cart = Cart.objects.create()
+
+    def add(self, product_id, quantity):
+        return self.client.post(f'/store/carts/{self.cart.pk}/items/',
+                                {'product_id': product_id, 'quantity': quantity}, format='json')
+
+    def test_unknown_product(self):
+        response = self.add(424242, 1)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'product_id': ['No product with given id was found.']})
+
+    def test_not_enough_inventory(self):
+        response = self.add(self.product.pk, 3)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(),
+                         {'product_id': [f'Not enough inventory for products [{self.product.pk}].']})
+
+    def test_adds_to_existing_line(self):
+        self.assertEqual(self.add(self.product.pk, 1).status_code, 201)
+        self.assertEqual(self.add(self.product.pk, 1).status_code, 201)
+        self.assertEqual(list(self.cart.items.values_list('quantity', flat=True)), [2])
+
+    def test_upsert_without_conflict_target(self):
+        # mysql's ON DUPLICATE KEY UPDATE can't name the unique columns
+        with mock.patch.object(connection.features, 'supports_update_conflicts_with_target', False):
+            self.assertEqual(self.add(self.product.pk, 1).status_code, 201)
+        self.assertEqual(list(Reservation.objects.values_list('product_id', 'quantity')), [(self.product.pk, 1)])
+
+    def test_bulk_without_conflict_target(self):
+        with mock.patch.object(connection.features, 'supports_update_conflicts_with_target', False):
+            response = self.client.post(f'/store/carts/{self.cart.pk}/items/bulk/',
+                                        [{'product_id': self.product.pk, 'quantity': 2}], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(self.cart.items.values_list('quantity', flat=True)), [2])
+
+    def test_bulk_malformed_cart_id(self):
+        response = self.client.post('/store/carts/not-a-uuid/items/bulk/', [], format='json')
+        self.assertEqual(response.status_code, 404)
+
+
+class UnknownCartTests(TransactionTestCase):
+    # sqlite only checks the foreign keys when the outermost transaction
+    # commits, which a TestCase never does
+
+    def test_add_to_unknown_cart(self):
+        collection = Collection.objects.create(title='Lamps')
+        product = Product.objects.create(title='Desk Lamp', price=10, inventory=2, collection=collection)
+        response = APIClient().post(f'/store/carts/{uuid4()}/items/',
+                                    {'product_id': product.pk, 'quantity': 1}, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(CartItem.objects.exists())
+        self.assertFalse(Reservation.objects.exists())
+
+
+class ReservationTests(TestCase):
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        collection = Collection.objects.create(title='Lamps')
+        cls.product = Product.objects.create(title='Desk Lamp', price=10, inventory=2, collection=collection)
+        cls.user = User.objects.create_user('customer', 'customer@example.com', 'password')
+
+    def add(self, cart, quantity):
+        return self.client.post(f'/store/carts/{cart.pk}/items/',
+                                {'product_id': self.product.pk, 'quantity': quantity}, format='json')
+
+    def expire(self, cart):
+        Reservation.objects.filter(cart_item__cart=cart).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+    def test_release_expired(self):
+        carts = [Cart.objects.create() for _ in range(3)]
+        for cart in carts:
+            reserve([CartItem.objects.create(cart=cart, product=self.product, quantity=1)])
+            # expiring as they go, the stock is only 2
+            self.expire(cart)
+        Reservation.objects.filter(cart_item__cart=carts[2]).update(expires_at=timezone.now() + timedelta(minutes=5))
+        self.assertEqual(release_expired(batch_size=1), 2)
+        self.assertEqual(list(Reservation.objects.values_list('cart_item__cart', flat=True)), [carts[2].pk])
+        self.assertEqual(release_expired(), 0)
+
+    def test_command(self):
+        cart = Cart.objects.create()
+        self.assertEqual(self.add(cart, 2).status_code, 201)
+        self.expire(cart)
+        out = StringIO()
+        call_command('release_expired_reservations', '--batch-size', '10', stdout=out)
+        self.assertIn('Released 1 expired reservations.', out.getvalue())
+        self.assertFalse(Reservation.objects.exists())
+
+    def test_expired_stock_is_available_again(self):
+        holder, buyer = Cart.objects.create(), Cart.objects.create()
+        self.assertEqual(self.add(holder, 2).status_code, 201)
+        # the other cart holds all of it
+        self.assertEqual(self.add(buyer, 1).status_code, 400)
+        CartItem.objects.create(cart=buyer, product=self.product, quantity=1)
+        checkout = CreateOrderSerializer(data={'cart_id': buyer.pk}, context={'user_id': self.user.pk})
+        checkout.is_valid(raise_exception=True)
+        with self.assertRaises(ValidationError):
+            checkout.save()
+
+        self.expire(holder)
+        release_expired()
+        checkout = CreateOrderSerializer(data={'cart_id': buyer.pk}, context={'user_id': self.user.pk})
+        checkout.is_valid(raise_exception=True)
+        checkout.save()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.inventory, 1)
+
+
+class CartTotalsTests(TestCase):
+    # the totals computed in sql render what the python sums they replaced
+    # did, the serializers from before are kept by benchmark_cart_totals
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        collection = Collection.objects.create(title='Kitchen')
+        # sqlite multiplies these as REAL, 0.70 * 7 is 4.8999999999999995
+        cls.products = [
+            Product.objects.create(title=f'Item {i}', price=Decimal(price), inventory=100, collection=collection)
+            for i, price in enumerate(['0.10', '0.70', '19.99', '3.33'])]
+
+    def setUp(self):
+        self.cart = Cart.objects.create()
+
+    def fill(self, quantities):
+        CartItem.objects.bulk_create([CartItem(cart=self.cart, product=product, quantity=quantity)
+                                      for product, quantity in zip(self.products, quantities)])
+
+    def get(self, path):
+        return self.client.get(path, HTTP_ACCEPT='application/json')
+
+    def legacy(self, serializer_class, instance):
+        return ORJSONRenderer().render(serializer_class(instance).data)
+
+    def legacy_cart(self):
+        return self.legacy(LegacyCartSerializer,
+                           Cart.objects.prefetch_related('items__product').get(pk=self.cart.pk))
+
+    def test_retrieve(self):
+        self.fill([3, 7, 13, 2])
+        self.assertEqual(self.get(f'/store/carts/{self.cart.pk}/').content, self.legacy_cart())
+        data = CartSerializer(Cart.objects.with_totals().get(pk=self.cart.pk)).data
+        # exact decimals rather than the REAL products. sqlite's come back
+        # with 15 digits, which render the same
+        self.assertEqual([item['total_price'] for item in data['items']],
+                         [Decimal('0.30'), Decimal('4.90'), Decimal('259.87'), Decimal('6.66')])
+        self.assertEqual(data['total_price'], Decimal('271.73'))
+
+    def test_empty_cart(self):
+        self.assertEqual(self.get(f'/store/carts/{self.cart.pk}/').content, self.legacy_cart())
+        self.assertEqual(self.get(f'/store/carts/{self.cart.pk}/').json()['total_price'], 0)
+        response = self.client.post('/store/carts/', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.json()['items'], response.json()['total_price']), ([], 0))
+
+    def test_retrieve_item(self):
+        item = CartItem.objects.create(cart=self.cart, product=self.products[1], quantity=7)
+        response = self.get(f'/store/carts/{self.cart.pk}/items/{item.pk}/')
+        self.assertEqual(response.content, self.legacy(LegacyCartItemSerializer, item))
+        self.assertEqual(response.json()['total_price'], 4.9)
+
+    def test_bulk(self):
+        self.fill([1])
+        response = self.client.post(
+            f'/store/carts/{self.cart.pk}/items/bulk/',
+            [{'product_id': product.pk, 'quantity': quantity}
+             for product, quantity in zip(self.products, [3, 7, 13, 2])],
+            format='json', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, self.legacy_cart())
+        self.assertEqual(response.json()['total_price'], 271.73)
+
+
+class ProductsCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lamps = Collection.objects.create(title='Lamps')
+        cls.chairs = Collection.objects.create(title='Chairs')
+
+    def create(self, collection, title='Desk Lamp'):
+        return Product.objects.create(title=title, price=10, inventory=5, collection=collection)
+
+    def assertCounts(self, lamps, chairs):
+        counts = dict(Collection.objects.values_list('title', 'products_count'))
+        self.assertEqual((counts['Lamps'], counts['Chairs']), (lamps, chairs))
+
+    def test_create_move_delete(self):
+        product = self.create(self.lamps)
+        self.create(self.lamps)
+        self.assertCounts(2, 0)
+        product.collection = self.chairs
+        product.save()
+        self.assertCounts(1, 1)
+        # saving again without a move changes nothing
+        product.title = 'Armchair'
+        product.save()
+        self.assertCounts(1, 1)
+        product.delete()
+        self.assertCounts(1, 0)
+
+    def test_move_of_product_not_loaded_from_the_db(self):
+        product = self.create(self.lamps)
+        Product(pk=product.pk, title='Desk Lamp', price=10, inventory=5, collection=self.chairs).save()
+        self.assertCounts(0, 1)
+
+    def test_queryset_update(self):
+        for i in range(3):
+            self.create(self.lamps, f'Lamp {i}')
+        Product.objects.filter(title__in=['Lamp 0', 'Lamp 1']).update(collection=self.chairs)
+        self.assertCounts(1, 2)
+        Product.objects.update(collection_id=self.lamps.pk)
+        self.assertCounts(3, 0)
+        Product.objects.filter(title='Lamp 2').delete()
+        self.assertCounts(2, 0)
+
+    def test_expression_and_bulk_update(self):
+        lamps = [self.create(self.lamps, f'Lamp {i}') for i in range(3)]
+        # drifted, only the collections the rows leave or join are recounted
+        sofas = Collection.objects.create(title='Sofas')
+        Collection.objects.filter(pk=sofas.pk).update(products_count=7)
+        lamps[0].collection = self.chairs
+        Product.objects.bulk_update(lamps[:2], ['collection'])
+        self.assertCounts(2, 1)
+        Product.objects.filter(pk=lamps[2].pk).update(collection=Value(self.chairs.pk))
+        self.assertCounts(1, 2)
+        self.assertEqual(Collection.objects.get(pk=sofas.pk).products_count, 7)
+
+    def test_bulk_create_and_upsert(self):
+        products = Product.objects.bulk_create([
+            Product(title=f'Lamp {i}', price=10, inventory=5, collection=self.lamps) for i in range(3)])
+        self.assertCounts(3, 0)
+        product = products[0]
+        product.collection = self.chairs
+        Product.objects.bulk_create([product], update_conflicts=True, update_fields=['collection'],
+                                    unique_fields=['id'])
+        self.assertCounts(2, 1)
+
+    def test_import(self):
+        self.create(self.lamps, 'Desk Lamp')
+        rows = ('title,slug,price,inventory,collection\n'
+                'Desk Lamp,desk-lamp,10,5,Chairs\n'
+                'Floor Lamp,,20,5,Lamps\n')
+        Product.objects.update(slug='desk-lamp')
+        import_products(StringIO(rows))
+        self.assertCounts(1, 1)
+
+    def test_reconcile(self):
+        self.create(self.lamps)
+        Collection.objects.filter(pk=self.lamps.pk).update(products_count=7)
+        Collection.objects.filter(pk=self.chairs.pk).update(products_count=2)
+        out = StringIO()
+        call_command('reconcile_collection_counts', batch_size=1, stdout=out)
+        self.assertIn('Checked 2 collections, fixed 2.', out.getvalue())
+        self.assertCounts(1, 0)
+
+
+class AbandonedCartTests(TestCase):
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        collection = Collection.objects.create(title='Lamps')
+        cls.product = Product.objects.create(title='Desk Lamp', price=10, inventory=50, collection=collection)
+
+    def create_cart(self, days_old, idle_days=None):
+        cart = Cart.objects.create()
+        created_at = timezone.now() - timedelta(days=days_old)
+        last_activity = timezone.now() - timedelta(days=days_old if idle_days is None else idle_days)
+        Cart.objects.filter(pk=cart.pk).update(created_at=created_at, last_activity=last_activity)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+        return cart
+
+    def remaining(self):
+        return set(Cart.objects.values_list('pk', flat=True))
+
+    def test_only_idle_carts(self):
+        idle = self.create_cart(40)
+        active = self.create_cart(40, idle_days=1)
+        new = self.create_cart(1)
+        self.assertEqual(sweep_abandoned_carts(timedelta(days=30)), (1, 2))
+        self.assertEqual(self.remaining(), {active.pk, new.pk})
+        self.assertFalse(CartItem.objects.filter(cart_id=idle.pk).exists())
+
+    def test_batches_resume_after(self):
+        for _ in range(5):
+            self.create_cart(40)
+        # the same created_at, the id breaks the ties
+        Cart.objects.update(created_at=timezone.now() - timedelta(days=40))
+        batches = []
+
+        class Interrupted(Exception):
+            pass
+
+        def interrupt(cursor, carts, rows):
+            batches.append((cursor, carts))
+            raise Interrupted
+
+        with self.assertRaises(Interrupted):
+            sweep_abandoned_carts(timedelta(days=30), batch_size=2, on_batch=interrupt)
+        self.assertEqual(batches[0][1], 2)
+        self.assertEqual(len(self.remaining()), 3)
+
+        # resuming from the printed created_at skips what came before it
+        after = batches[0][0][0]
+        older = self.create_cart(60)
+        batches = []
+        result = sweep_abandoned_carts(timedelta(days=30), batch_size=2, after=after,
+                                       on_batch=lambda cursor, carts, rows: batches.append((cursor, carts)))
+        self.assertEqual(result, (3, 6))
+        self.assertEqual([carts for _, carts in batches], [2, 1])
+        self.assertEqual(self.remaining(), {older.pk})
+
+    def test_backfill(self):
+        # one cart with no reservation, one last changed 5 days ago and one
+        # whose reservation is still live
+        carts = [self.create_cart(40) for _ in range(3)]
+        Cart.objects.update(last_activity=timezone.now())
+        migration = import_module('store.migrations.0015_cart_last_activity')
+        changed = timezone.now() - timedelta(days=5)
+        for cart, expires_at in [(carts[1], changed + RESERVATION_TTL),
+                                 (carts[2], timezone.now() + RESERVATION_TTL / 3)]:
+            item = cart.items.get()
+            Reservation.objects.create(cart_item=item, product=self.product, quantity=1, expires_at=expires_at)
+        with mock.patch.object(migration, 'BATCH_SIZE', 2):
+            migration.backfill_last_activity(apps, connection.schema_editor())
+        activity = dict(Cart.objects.values_list('pk', 'last_activity'))
+        self.assertEqual(activity[carts[0].pk], Cart.objects.get(pk=carts[0].pk).created_at)
+        self.assertEqual(activity[carts[1].pk], changed)
+        self.assertLess(abs(activity[carts[2].pk] - (timezone.now() - RESERVATION_TTL * 2 / 3)), timedelta(minutes=1))
+        # the cart and its item
+        self.assertEqual(sweep_abandoned_carts(timedelta(days=30)), (1, 2))
+
+    def test_item_writes_touch_the_cart(self):
+        cart = self.create_cart(40)
+        path = f'/store/carts/{cart.pk}/items/'
+        for request in [lambda: self.client.post(path, {'product_id': self.product.pk, 'quantity': 1}, format='json'),
+                        lambda: self.client.patch(f'{path}{cart.items.get().pk}/', {'quantity': 3}, format='json'),
+                        lambda: self.client.post(f'{path}bulk/', [{'product_id': self.product.pk, 'quantity': 1}],
+                                                 format='json')]:
+            Cart.objects.filter(pk=cart.pk).update(last_activity=timezone.now() - timedelta(days=40))
+            self.assertLess(request().status_code, 300)
+            cart.refresh_from_db()
+            self.assertGreater(cart.last_activity, timezone.now() - timedelta(minutes=1))
+        self.assertEqual(sweep_abandoned_carts(timedelta(days=30)), (0, 0))
+
+
+class ResponseCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.collection = Collection.objects.create(title='Lamps')
+        cls.product = Product.objects.create(title='Desk Lamp', price=10, inventory=5, collection=cls.collection)
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, path):
+        response = self.client.get(path, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_cached_until_a_write(self):
+        path = f'/store/collections/{self.collection.pk}/'
+        self.assertEqual(self.get(path)['products_count'], 1)
+        with self.assertNumQueries(0):
+            self.get(path)
+        # versions are bumped once the write commits
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(title='Floor Lamp', price=20, inventory=5, collection=self.collection)
+        self.assertEqual(self.get(path)['products_count'], 2)
+
+    def test_scopes(self):
+        for update in [lambda products: products.take_inventory(1),
+                       lambda products: products.update(price=12)]:
+            versions = get_versions(['product', 'collection'])
+            with self.captureOnCommitCallbacks(execute=True):
+                update(Product.objects.filter(pk=self.product.pk))
+            product, collection = get_versions(['product', 'collection'])
+            self.assertNotEqual(product, versions[0])
+            self.assertEqual(collection, versions[1])
+
+    def test_checkout_updates_cached_inventory(self):
+        path = f'/store/products/{self.product.pk}/'
+        self.assertEqual(self.get(path)['inventory'], 5)
+        cart = Cart.objects.create()
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+        user = User.objects.create_user('customer', 'customer@example.com', 'password')
+        serializer = CreateOrderSerializer(data={'cart_id': cart.pk}, context={'user_id': user.pk})
+        serializer.is_valid(raise_exception=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            serializer.save()
+        self.assertEqual(self.get(path)['inventory'], 3)
+
+    def test_coalesced_miss(self):
+        calls = []
+        results = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'computed'
+
+        def worker():
+            results.append(get_or_set_coalesced('test:coalesced', compute))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((len(calls), results), (1, ['computed'] * 8))
+
+
+class LikeTests(TestCase):
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        collection = Collection.objects.create(title='Lamps')
+        cls.product = Product.objects.create(title='Desk Lamp', price=10, inventory=5, collection=collection)
+        user = User.objects.create_user('liker', 'liker@example.com', 'password')
+        cls.token = str(ClaimsRefreshToken.for_user(user).access_token)
+
+    def setUp(self):
+        cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f'JWT {self.token}')
+        self.path = f'/store/products/{self.product.pk}/'
+
+    def likes_count(self):
+        return self.client.get(self.path, HTTP_ACCEPT='application/json').json()['likes_count']
+
+    def test_like_and_unlike(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(f'{self.path}like/').status_code, 201)
+            self.assertEqual(self.client.post(f'{self.path}like/').status_code, 200)
+        buffer.flush()
+        self.assertEqual(self.likes_count(), 1)
+        response = self.client.get(f'/store/products/liked/?ids={self.product.pk},424242')
+        self.assertEqual(response.json(), {'liked': [self.product.pk]})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(f'{self.path}like/').status_code, 204)
+        buffer.flush()
+        cache.clear()
+        self.assertEqual(self.likes_count(), 0)
+        self.assertEqual(self.client.get(f'/store/products/liked/?ids={self.product.pk}').json(), {'liked': []})
+
+    def test_like_needs_a_user(self):
+        self.client.credentials()
+        self.assertEqual(self.client.post(f'{self.path}like/').status_code, 401)
+
+    def test_like_unknown_product(self):
+        self.assertEqual(self.client.post('/store/products/424242/like/').status_code, 404)
+        self.assertEqual(self.client.post('/store/products/abc/like/').status_code, 404)
+
+
+class CustomerTests(TestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('customer', 'customer@example.com', 'password')
+
+    def test_created_with_the_user(self):
+        self.assertEqual(list(Customer.objects.values_list('user_id', flat=True)), [self.user.pk])
+        self.assertEqual(get_customer_id(self.user.pk), self.user.customer.pk)
+
+    def test_backfill(self):
+        # users inserted without signals, and one whose customer is gone
+        users = User.objects.bulk_create([User(username=f'imported-{i}', email=f'imported-{i}@example.com') for i in range(4)])
+        Customer.objects.filter(user=self.user).delete()
+        kept = Customer.objects.create(user=users[1])
+        backfill = import_module('store.migrations.0016_backfill_customers')
+        with mock.patch.object(backfill, 'BATCH_SIZE', 2):
+            backfill.create_missing_customers(apps, connection.schema_editor())
+        self.assertEqual(sorted(Customer.objects.values_list('user_id', flat=True)),
+                         sorted(user.pk for user in [self.user, *users]))
+        self.assertEqual(Customer.objects.get(user=users[1]).pk, kept.pk)
+
+    def test_delete_forgets_the_id(self):
+        customer_id = get_customer_id(self.user.pk)
+        self.assertEqual(cache.get(customer_id_key(self.user.pk)), customer_id)
+        with self.captureOnCommitCallbacks(execute=True):
+            Customer.objects.filter(pk=customer_id).delete()
+        self.assertIsNone(cache.get(customer_id_key(self.user.pk)))
+
+    def test_checkout_after_the_customer_is_deleted(self):
+        # the token was issued while the old customer existed
+        token = ClaimsRefreshToken.for_user(self.user).access_token
+        with self.captureOnCommitCallbacks(execute=True):
+            Customer.objects.filter(user=self.user).delete()
+        collection = Collection.objects.create(title='Lamps')
+        product = Product.objects.create(title='Desk Lamp', price=10, inventory=5, collection=collection)
+        cart = Cart.objects.create()
+        CartItem.objects.create(cart=cart, product=product, quantity=1)
+        self.client.credentials(HTTP_AUTHORIZATION=f'JWT {token}')
+        response = self.client.post('/store/orders/', {'cart_id': str(cart.pk)}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['customer'], Customer.objects.get(user=self.user).pk)
+
+
+class ListQueryCountTests(TestCase):
+    # the list endpoints run the same queries for one row as for many
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        collection = Collection.objects.create(title='Lamps')
+        cls.products = [Product.objects.create(title=f'Lamp {i}', price=10, inventory=100, collection=collection)
+                        for i in range(3)]
+        cls.user = cls.create_user('customer')
+        cls.staff = cls.create_user('staff', is_staff=True)
+        cls.tokens = {user: str(ClaimsRefreshToken.for_user(user).access_token) for user in [cls.user, cls.staff]}
+
+    @staticmethod
+    def create_user(username, **kwargs):
+        return User.objects.create_user(username, f'{username}@example.com', 'password', **kwargs)
+
+    def create_orders(self, count):
+        for _ in range(count):
+            order = Order.objects.create(customer=self.user.customer)
+            OrderItem.objects.bulk_create([OrderItem(order=order, product=product, quantity=2, unit_price=product.price)
+                                           for product in self.products])
+
+    def get(self, path, user):
+        # the token check is cached, start every request cold
+        cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f'JWT {self.tokens[user]}')
+        response = self.client.get(path, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_orders(self):
+        # paged without a cursor too, a long history stops at page_size
+        for count, total in [(1, 1), (9, 10), (5, 10)]:
+            self.create_orders(count)
+            with self.assertNumQueries(3):
+                page = self.get('/store/orders/', self.user)
+            self.assertEqual(len(page['results']), total)
+            self.assertEqual({len(order['items']) for order in page['results']}, {3})
+        self.assertEqual(len(self.get(page['next'], self.user)['results']), 5)
+
+    def test_orders_cursor(self):
+        for count, total in [(1, 1), (9, 10)]:
+            self.create_orders(count)
+            with self.assertNumQueries(3):
+                page = self.get('/store/orders/?cursor=', self.staff)
+            self.assertEqual(len(page['results']), total)
+
+    def test_customers(self):
+        for count, total in [(0, 2), (8, 10)]:
+            for i in range(count):
+                self.create_user(f'customer-{total}-{i}')
+            with self.assertNumQueries(2):
+                customers = self.get('/store/customers/', self.staff)
+            self.assertEqual(len(customers), total)
+
+    def test_products_with_tags(self):
+        tags = [Tag.objects.create(label=f'tag-{i}') for i in range(5)]
+        collection = self.products[0].collection
+        for count, total in [(0, 3), (7, 10)]:
+            for i in range(count):
+                Product.objects.create(title=f'Lamp {total}-{i}', price=10, inventory=5, collection=collection)
+            # every product gets a different number of tags
+            for i, product in enumerate(Product.objects.all()):
+                TaggedItem.objects.filter(object_id=product.pk).delete()
+                for tag in tags[:i % 4]:
+                    TaggedItem.objects.create(tag=tag, content_object=product)
+            with self.assertNumQueries(5):
+                products = self.get('/store/products/', self.user)['results']
+            self.assertEqual(len(products), total)
+            self.assertEqual(sum(len(product['tags']) for product in products), TaggedItem.objects.count())
+
+
+class TagLookupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        collection = Collection.objects.create(title='Lamps')
+        cls.desk, cls.floor, cls.untagged = [
+            Product.objects.create(title=title, price=10, inventory=5, collection=collection)
+            for title in ['Desk Lamp', 'Floor Lamp', 'Table Lamp']]
+        red, blue = Tag.objects.create(label='red'), Tag.objects.create(label='blue')
+        for tag, obj in [(red, cls.desk), (blue, cls.desk), (blue, cls.floor),
+                         # the same object id under another content type
+                         (red, collection)]:
+            TaggedItem.objects.create(tag=tag, content_object=obj)
+        cls.collection = collection
+
+    def setUp(self):
+        cache.clear()
+
+    def test_tags_for_many(self):
+        ids = [self.desk.pk, self.floor.pk, self.untagged.pk, self.collection.pk]
+        ContentType.objects.get_for_model(Product)
+        with self.assertNumQueries(1):
+            tags = TaggedItem.objects.get_tags_for_many(Product, ids)
+        labels = {pk: [tag.label for tag in product_tags] for pk, product_tags in tags.items()}
+        self.assertEqual(labels, {self.desk.pk: ['blue', 'red'], self.floor.pk: ['blue']})
+        # one instance per tag
+        self.assertIs(tags[self.desk.pk][0], tags[self.floor.pk][0])
+        with self.assertNumQueries(0):
+            self.assertEqual(TaggedItem.objects.get_tags_for_many(Product, []), {})
+
+    def test_tags_field(self):
+        products = self.client.get('/store/products/', HTTP_ACCEPT='application/json').json()['results']
+        self.assertEqual({product['title']: product['tags'] for product in products},
+                         {'Desk Lamp': ['blue', 'red'], 'Floor Lamp': ['blue'], 'Table Lamp': []})
+        product = self.client.get(f'/store/products/{self.desk.pk}/', HTTP_ACCEPT='application/json').json()
+        self.assertEqual(product['tags'], ['blue', 'red'])
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        collection = Collection.objects.create(title='Lamps')
+        # repeated prices, the id breaks the ties
+        Product.objects.bulk_create([
+            Product(title=f'Lamp {i}', slug=f'lamp-{i}', price=i % 4, inventory=5, collection=collection)
+            for i in range(25)])
+
+    def get(self, path):
+        response = self.client.get(path, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_follows_next_and_previous(self):
+        pages = [self.get('/store/products/?cursor=&ordering=-price')]
+        self.assertIsNone(pages[0]['previous'])
+        while pages[-1]['next']:
+            pages.append(self.get(pages[-1]['next']))
+        self.assertEqual([len(page['results']) for page in pages], [10, 10, 5])
+        seen = [(product['price'], product['id']) for page in pages for product in page['results']]
+        expected = Product.objects.order_by('-price', '-id').values_list('price', 'id')
+        self.assertEqual(seen, [(float(price), pk) for price, pk in expected])
+        self.assertEqual(self.get(pages[-1]['previous'])['results'], pages[-2]['results'])
+
+    def test_invalid_cursor(self):
+        for cursor in ['garbage', 'eyJvIjpbImlkIl0sInYiOlsiMSJdLCJyIjpmYWxzZX0=']:
+            response = self.client.get(f'/store/products/?cursor={cursor}&ordering=price')
+            self.assertEqual(response.status_code, 404)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.collection = Collection.objects.create(title='Lamps')
+        cls.desk_lamp = cls.create('Desk Lamp', 'A brass lamp, the lamp for a desk.')
+        cls.floor_lamp = cls.create('Floor Lamp', 'Tall and bright.')
+        cls.chair = cls.create('Office Chair', 'Sits at any desk.')
+
+    @classmethod
+    def create(cls, title, description):
+        return Product.objects.create(title=title, description=description, price=10,
+                                      inventory=5, collection=cls.collection)
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, terms, query=''):
+        response = self.client.get(f'/store/products/?search={terms}{query}', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def titles(self, terms):
+        return [product['title'] for product in self.search(terms)['results']]
+
+    def test_ranked_matches(self):
+        self.assertEqual(self.titles('lamp'), ['Desk Lamp', 'Floor Lamp'])
+        # every term has to match, each one as a prefix
+        self.assertEqual(self.titles('desk lam'), ['Desk Lamp'])
+        self.assertEqual(self.titles('sofa'), [])
+
+    def test_mysql_words_not_indexed(self):
+        backend = MySQLFullTextSearchBackend()
+        # short words and stopwords would fail every boolean mode match
+        self.assertEqual(backend.boolean_query(['a', 'lamp', 'for', 'desk']), 'a* +lamp* for* +desk*')
+        self.assertIsNone(backend.boolean_query(['a', 'of', 'the']))
+        # nothing left for the index, the terms are matched with icontains
+        queryset = backend.search(Product.objects.order_by('title'), 'the')
+        self.assertEqual([product.title for product in queryset], ['Desk Lamp'])
+
+    def test_index_follows_writes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.chair.title = 'Lamp Chair'
+            self.chair.save()
+            self.floor_lamp.delete()
+        self.assertEqual(set(self.titles('lamp')), {'Desk Lamp', 'Lamp Chair'})
+        self.assertEqual(self.titles('office'), [])
+
+    def test_cursor(self):
+        for i in range(12):
+            self.create(f'Reading Lamp {i}', 'Reads well.')
+        page = self.search('reading', '&cursor=')
+        ids = [product['id'] for product in page['results']]
+        while page['next']:
+            page = self.client.get(page['next'], HTTP_ACCEPT='application/json').json()
+            ids += [product['id'] for product in page['results']]
+        self.assertEqual(sorted(ids), sorted(Product.objects.filter(title__startswith='Reading').values_list('id', flat=True)))
+
+
+class ExportTests(TestCase):
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        lamps = Collection.objects.create(title='Lamps')
+        chairs = Collection.objects.create(title='Chairs')
+        cls.lamps = [Product.objects.create(title=f'Lamp {i}', price=10, inventory=5, collection=lamps)
+                     for i in range(3)]
+        Product.objects.create(title='Chair', price=20, inventory=5, collection=chairs)
+        for label in ['brass', 'desk']:
+            TaggedItem.objects.create(tag=Tag.objects.create(label=label), content_object=cls.lamps[0])
+        staff = User.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+        customer = User.objects.create_user('customer', 'customer@example.com', 'password')
+        order = Order.objects.create(customer=customer.customer)
+        OrderItem.objects.bulk_create([OrderItem(order=order, product=product, quantity=1, unit_price=product.price)
+                                       for product in cls.lamps[:2]])
+        cls.collection = lamps
+        cls.tokens = {user.username: str(ClaimsRefreshToken.for_user(user).access_token)
+                      for user in [staff, customer]}
+
+    def export(self, path, user='staff'):
+        self.client.credentials(HTTP_AUTHORIZATION=f'JWT {self.tokens[user]}')
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_products_ndjson(self):
+        lines = self.export(f'/store/products/export/?collection_id={self.collection.pk}').splitlines()
+        products = [json.loads(line) for line in lines]
+        self.assertEqual(sorted(product['id'] for product in products), [lamp.pk for lamp in self.lamps])
+        self.assertIn(['brass', 'desk'], [product['tags'] for product in products])
+
+    def test_products_csv(self):
+        rows = list(csv.DictReader(StringIO(self.export('/store/products/export/?output=csv'))))
+        self.assertEqual(len(rows), 4)
+        lamp = next(row for row in rows if row['id'] == str(self.lamps[0].pk))
+        self.assertEqual((lamp['title'], lamp['price'], lamp['tags']), ('Lamp 0', '10.0', 'brass|desk'))
+
+    def test_orders_csv_has_a_row_per_item(self):
+        rows = list(csv.DictReader(StringIO(self.export('/store/orders/export/?output=csv', 'customer'))))
+        self.assertEqual([row['items.product.title'] for row in rows], ['Lamp 0', 'Lamp 1'])
+        self.assertEqual(len({row['id'] for row in rows}), 1)
+
+    def test_products_need_staff(self):
+        self.assertEqual(self.client.get('/store/products/export/').status_code, 401)
+        self.client.credentials(HTTP_AUTHORIZATION=f'JWT {self.tokens["customer"]}')
+        self.assertEqual(self.client.get('/store/products/export/').status_code, 403)
+
+    def test_unknown_output(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'JWT {self.tokens["staff"]}')
+        self.assertEqual(self.client.get('/store/products/export/?output=xml').status_code, 400)
+
+    def test_chunks(self):
+        response = stream_export(Product.objects.order_by('id'), ProductSerializer, chunk_size=3)
+        chunks = list(response.streaming_content)
+        self.assertEqual([chunk.count(b'\n') for chunk in chunks], [3, 1])
+
+
+class SalesRollupTests(TestCase):
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.lamps = Collection.objects.create(title='Lamps')
+        chairs = Collection.objects.create(title='Chairs')
+        cls.lamp = Product.objects.create(title='Desk Lamp', price=10, inventory=50, collection=cls.lamps)
+        cls.chair = Product.objects.create(title='Office Chair', price=25, inventory=50, collection=chairs)
+        cls.customer = User.objects.create_user('customer', 'customer@example.com', 'password')
+        staff = User.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+        cls.token = str(ClaimsRefreshToken.for_user(staff).access_token)
+
+    def setUp(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'JWT {self.token}')
+        self.today = timezone.localdate().isoformat()
+
+    def checkout(self, lamps, chairs):
+        cart = Cart.objects.create()
+        CartItem.objects.bulk_create([CartItem(cart=cart, product=product, quantity=quantity)
+                                      for product, quantity in [(self.lamp, lamps), (self.chair, chairs)]
+                                      if quantity])
+        serializer = CreateOrderSerializer(data={'cart_id': cart.pk}, context={'user_id': self.customer.pk})
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    def sales(self, query=''):
+        response = self.client.get(f'/store/analytics/sales/?start={self.today}&end={self.today}{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def rows(self):
+        return sorted(DailyProductSales.objects.values_list(
+            'date', 'product_id', 'collection_id', 'payment_status', 'items', 'quantity', 'revenue'))
+
+    def test_checkout_and_status_changes(self):
+        first = self.checkout(2, 1)
+        self.checkout(1, 0)
+        self.assertEqual(self.sales('&status=P')['totals'], {'items': 3, 'quantity': 4, 'revenue': 55.0})
+        self.assertEqual(self.sales()['totals'], {'items': 0, 'quantity': 0, 'revenue': 0})
+
+        first.payment_status = Order.PAYMENT_STATUS_COMPLETE
+        first.save()
+        self.assertEqual(self.sales()['totals'], {'items': 2, 'quantity': 3, 'revenue': 45.0})
+        Order.objects.update(payment_status=Order.PAYMENT_STATUS_COMPLETE)
+        self.assertEqual(self.sales()['totals'], {'items': 3, 'quantity': 4, 'revenue': 55.0})
+        self.assertEqual(self.sales('&status=P')['totals']['items'], 0)
+
+    def test_group_by(self):
+        self.checkout(3, 2)
+        results = self.sales('&status=P&group_by=collection')['results']
+        self.assertEqual(results, [{'collection': self.chair.collection_id, 'items': 1, 'quantity': 2, 'revenue': 50.0},
+                                   {'collection': self.lamps.pk, 'items': 1, 'quantity': 3, 'revenue': 30.0}])
+        results = self.sales(f'&status=P&group_by=day,product&collection={self.lamps.pk}')['results']
+        self.assertEqual(results, [{'day': self.today, 'product': self.lamp.pk, 'items': 1, 'quantity': 3,
+                                    'revenue': 30.0}])
+
+    def test_item_changes_match_a_rebuild(self):
+        order = self.checkout(2, 1)
+        item = order.items.get(product=self.lamp)
+        item.quantity = 5
+        item.save()
+        order.items.get(product=self.chair).delete()
+        OrderItem.objects.create(order=order, product=self.chair, quantity=4, unit_price=20)
+        recorded = self.rows()
+        rebuild(timezone.localdate(), timezone.localdate())
+        self.assertEqual(self.rows(), recorded)
+
+    def test_needs_staff(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'JWT {ClaimsRefreshToken.for_user(self.customer).access_token}')
+        response = self.client.get(f'/store/analytics/sales/?start={self.today}&end={self.today}')
+        self.assertEqual(response.status_code, 403)
+
+
+class SeedStoreTests(TestCase):
+    def seed(self):
+        call_command('seed_store', '--seed', '3', '--batch-size', '7', '--collections', '3', '--products', '20',
+                     '--promotions', '2', '--customers', '6', '--orders', '15', '--carts', '5', '--reviews', '10',
+                     '--tags', '4', '--tagged-items', '12', '--likes', '30', '--days', '10', stdout=StringIO())
+
+    def assertConsistent(self):
+        self.assertEqual(list(Collection.objects.order_by('pk').values_list('products_count', flat=True)),
+                         [Product.objects.filter(collection=pk).count() for pk in Collection.objects.order_by('pk').values_list('pk', flat=True)])
+        self.assertEqual(Customer.objects.count(), User.objects.count())
+        liked = LikedItem.objects.order_by().values('content_type', 'object_id').annotate(count=Count('id'))
+        self.assertEqual(sorted(LikeCount.objects.values_list('content_type', 'object_id', 'count')),
+                         sorted((row['content_type'], row['object_id'], row['count']) for row in liked))
+        sold = OrderItem.objects.aggregate(units=Sum('quantity'), total=Sum(F('quantity') * F('unit_price')))
+        rolled_up = DailyProductSales.objects.aggregate(units=Sum('quantity'), total=Sum('revenue'))
+        self.assertEqual(rolled_up['units'], sold['units'])
+        self.assertEqual(Decimal(rolled_up['total']), Decimal(sold['total']).quantize(Decimal('0.01')))
+        self.assertEqual(rolled_up, DailyCollectionSales.objects.aggregate(
+            units=Sum('quantity'), total=Sum('revenue')))
+
+    def test_seed(self):
+        self.seed()
+        self.assertEqual([model.objects.count() for model in [Collection, Product, User, Order, Cart, Review]],
+                         [3, 20, 6, 15, 5, 10])
+        self.assertTrue(LikedItem.objects.exists())
+        self.assertConsistent()
+
+    def test_seed_again(self):
+        # a second run adds the same again next to the first
+        self.seed()
+        first = list(Product.objects.order_by('pk').values_list('title', 'price'))
+        self.seed()
+        self.assertEqual([model.objects.count() for model in [Collection, Product, User, Order, Cart, Review]],
+                         [6, 40, 12, 30, 10, 20])
+        self.assertEqual(list(Product.objects.order_by('pk').values_list('title', 'price')[20:]), first)
+        self.assertConsistent()
+
+
+class RendererTests(TestCase):
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.collection = Collection.objects.create(title='Lamps')
+        Product.objects.create(title='Desk Lamp\u2028', price=Decimal('10.50'), inventory=5, collection=cls.collection)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_same_output_as_drf(self):
+        data = {'price': Decimal('10.50'), 'id': uuid4(), 'placed_at': timezone.now(), 'day': date(2026, 1, 2),
+                'title': 'Lamp \u2028 \u00e9', 'lazy': gettext_lazy('Lamps')}
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        # past 64 bits orjson gives up and drf's renderer takes over
+        self.assertEqual(ORJSONRenderer().render({'big': 2 ** 70}), JSONRenderer().render({'big': 2 ** 70}))
+
+    def test_list_in_chunks(self):
+        renderer = ORJSONRenderer()
+        chunks = [[{'id': 1}, {'id': 2}], [], [{'id': 3}]]
+        self.assertEqual(b''.join(renderer.render_list(chunks)), renderer.render([{'id': 1}, {'id': 2}, {'id': 3}]))
+        self.assertEqual(b''.join(renderer.render_list([])), b'[]')
+
+    def test_indent(self):
+        response = self.client.get('/store/collections/', HTTP_ACCEPT='application/json; indent=2')
+        self.assertIn(b'\n  {', response.content)
+
+    def test_parser(self):
+        cart = Cart.objects.create()
+        product_id = Product.objects.get().pk
+        response = self.client.post(f'/store/carts/{cart.pk}/items/', f'{{"product_id": {product_id}, "quantity": 2}}',
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        for body in ['{"product_id": ', '{"product_id": NaN, "quantity": 1}']:
+            response = self.client.post(f'/store/carts/{cart.pk}/items/', body, content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+
+    @skipUnless(msgpack, 'msgpack is not installed')
+    def test_msgpack(self):
+        response = self.client.get(f'/store/collections/{self.collection.pk}/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content)['title'], 'Lamps')
+
+        cart = Cart.objects.create()
+        response = self.client.post(f'/store/carts/{cart.pk}/items/',
+                                    msgpack.packb({'product_id': Product.objects.get().pk, 'quantity': 1}),
+                                    content_type='application/msgpack', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual((response.status_code, msgpack.unpackb(response.content)['quantity']), (201, 1))
+        response = self.client.post(f'/store/carts/{cart.pk}/items/', b'\xc1', content_type='application/msgpack')
+        self.assertEqual(response.status_code, 400)
+
+
+class ValuesSerializerTests(TestCase):
+    # the list fast path has to render what the drf serializers render
+    @classmethod
+    def setUpTestData(cls):
+        collection = Collection.objects.create(title='Lamps')
+        Collection.objects.create(title='Empty')
+        desk = Product.objects.create(title='Desk Lamp', description='Brass \u2028 lamp', price=Decimal('10.55'),
+                                      inventory=5, collection=collection)
+        Product.objects.create(title='Floor Lamp', description=None, price=Decimal('999.99'), inventory=1,
+                               collection=collection)
+        for label in ['red', 'blue']:
+            TaggedItem.objects.create(tag=Tag.objects.create(label=label), content_object=desk)
+        LikeCount.objects.create(content_type=ContentType.objects.get_for_model(Product), object_id=desk.pk, count=3)
+
+    def assertSameJSON(self, values_serializer, queryset):
+        drf = JSONRenderer().render(values_serializer.serializer_class(queryset, many=True).data)
+        fast = JSONRenderer().render(values_serializer(values_serializer.values(queryset)).data)
+        self.assertEqual(fast, drf)
+
+    def test_products(self):
+        self.assertSameJSON(ProductValuesSerializer, Product.objects.order_by('id'))
+        product = json.loads(JSONRenderer().render(
+            ProductValuesSerializer(ProductValuesSerializer.values(Product.objects.order_by('id'))).data))[0]
+        self.assertEqual((product['tags'], product['likes_count']), (['blue', 'red'], 3))
+
+    def test_collections(self):
+        self.assertSameJSON(CollectionValuesSerializer, Collection.objects.order_by('id'))
+
+
+class ApproximateCountTests(TestCase):
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        collection = Collection.objects.create(title='Lamps')
+        Product.objects.bulk_create([
+            Product(title=f'Lamp {i}', slug=f'lamp-{i}', price=10, inventory=5, collection=collection)
+            for i in range(25)])
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, path):
+        return self.client.get(path, HTTP_ACCEPT='application/json')
+
+    def test_empty_queryset(self):
+        # .none() compiles to no sql at all
+        with self.assertNumQueries(0):
+            self.assertEqual(approximate_count(Product.objects.none()), (0, False))
+
+    def test_pages_past_a_low_estimate(self):
+        # the real last pages are still served, the extra row fetched with
+        # each page decides whether there's a next one
+        with mock.patch('store.pagination.approximate_count', return_value=(5, True)):
+            pages = []
+            url = '/store/products/'
+            while url:
+                body = self.get(url).json()
+                self.assertTrue(body['count_is_approximate'])
+                pages.append(len(body['results']))
+                url = body['next']
+            self.assertEqual(pages, [10, 10, 5])
+            self.assertEqual(self.get('/store/products/?page=4').status_code, 404)
+
+    def test_cached_count_past_the_threshold(self):
+        products = Product.objects.filter(inventory=5)
+        self.assertEqual(approximate_count(products, threshold=100), (25, False))
+        # counted again, only counts past the threshold are cached
+        self.assertEqual(approximate_count(products, threshold=20), (25, False))
+        Product.objects.filter(pk=Product.objects.order_by('pk')[0].pk).delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(approximate_count(products, threshold=20), (25, True))
+        # other filters are other cache entries
+        self.assertEqual(approximate_count(Product.objects.filter(inventory__gte=5), threshold=20),
+                         (24, False))
+
+    def test_table_estimate(self):
+        with mock.patch('store.counting.table_estimate', return_value=50000) as estimate:
+            with self.assertNumQueries(0):
+                self.assertEqual(approximate_count(Product.objects.all()), (50000, True))
+            # a filtered list can't use the statistics of the whole table
+            self.assertEqual(approximate_count(Product.objects.filter(inventory=5)), (25, False))
+        estimate.assert_called_once()
+        # a small table is counted exactly whatever its statistics say
+        with mock.patch('store.counting.table_estimate', return_value=9999):
+            self.assertEqual(approximate_count(Product.objects.all()), (25, False))
+
+    def test_count_is_approximate(self):
+        body = self.get('/store/products/').json()
+        self.assertEqual((body['count'], body['count_is_approximate']), (25, False))
+        cache.clear()
+        with mock.patch('store.pagination.approximate_count', return_value=(30000, True)):
+            body = self.get('/store/products/').json()
+            self.assertEqual((body['count'], body['count_is_approximate']), (30000, True))
+            # an estimate past the real count ends at the real last page
+            self.assertIsNone(self.get('/store/products/?page=3').json()['next'])
+            self.assertEqual(self.get('/store/products/?page=4').status_code, 404)
+
+    def test_admin_changelist(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        with mock.patch('store.pagination.approximate_count', return_value=(15, True)), \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/store/product/?p=3')
+        changelist = response.context['cl']
+        self.assertIsInstance(changelist.paginator, EstimatedCountPaginator)
+        self.assertEqual((changelist.result_count, len(changelist.result_list)), (15, 5))
+        # show_full_result_count = False, the unfiltered COUNT(*) isn't run either
+        self.assertIsNone(changelist.full_result_count)
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql']
+                          and 'store_product' in query['sql']])
+
+
+class TagFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        collection = Collection.objects.create(title='Lamps')
+        tags = {label: Tag.objects.create(label=label) for label in ['brass', 'desk', 'tall']}
+        for title, labels in [('Desk Lamp', ['brass', 'desk']), ('Floor Lamp', ['brass', 'tall']),
+                              ('Reading Lamp', ['desk']), ('Plain Lamp', [])]:
+            product = Product.objects.create(title=title, price=10, inventory=5, collection=collection)
+            for label in labels:
+                TaggedItem.objects.create(tag=tags[label], content_object=product)
+        # a second tag with the same label
+        TaggedItem.objects.create(tag=Tag.objects.create(label='tall'), content_object=product)
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, query):
+        return self.client.get(f'/store/products/?{query}', HTTP_ACCEPT='application/json')
+
+    def titles(self, query):
+        response = self.get(query)
+        self.assertEqual(response.status_code, 200)
+        return sorted(product['title'] for product in response.json()['results'])
+
+    def test_all_of(self):
+        self.assertEqual(self.titles('tags=brass,desk'), ['Desk Lamp'])
+        self.assertEqual(self.titles('tags=brass'), ['Desk Lamp', 'Floor Lamp'])
+        self.assertEqual(self.titles('tags=tall'), ['Floor Lamp', 'Plain Lamp'])
+        self.assertEqual(self.titles('tags=desk,tall'), [])
+
+    def test_any_of(self):
+        self.assertEqual(self.titles('tags_any=desk,tall'), ['Desk Lamp', 'Floor Lamp', 'Plain Lamp', 'Reading Lamp'])
+        self.assertEqual(self.titles('tags_any=desk,no-such-tag'), ['Desk Lamp', 'Reading Lamp'])
+
+    def test_unknown_tag(self):
+        response = self.get('tags=no-such-tag')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['count'], response.json()['results']), (0, []))
+
+    def test_too_many_tags(self):
+        labels = ','.join(f'tag-{i}' for i in range(MAX_TAGS + 1))
+        for name in ['tags', 'tags_any']:
+            response = self.get(f'{name}={labels}')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {name: [f'At most {MAX_TAGS} tags can be given.']})
+
+    def test_queries_per_tag_count(self):
+        Tag.objects.bulk_create([Tag(label=f'tag-{i}') for i in range(MAX_TAGS)])
+        for name in ['tags', 'tags_any']:
+            queries = []
+            for count in [1, MAX_TAGS - 2]:
+                labels = ','.join(['brass', 'desk'] + [f'tag-{i}' for i in range(count)])
+                cache.clear()
+                with CaptureQueriesContext(connection) as captured:
+                    self.assertEqual(self.get(f'{name}={labels}').status_code, 200)
+                queries.append(len(captured))
+            self.assertEqual(queries[0], queries[1])
+
+
+class ImportProductsTests(TestCase):
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.lamps = Collection.objects.create(title='Lamps')
+
+    @staticmethod
+    def csv(*rows):
+        return 'title,slug,description,price,inventory,collection\n' + ''.join(f'{row}\n' for row in rows)
+
+    def test_repeated_slug_in_batch(self):
+        rows = ('title,slug,price,inventory,collection\n'
+                'Desk Lamp,lamp,10,5,Lamps\n'
+                'Floor Lamp,lamp,20,5,Lamps\n')
+        result = import_products(StringIO(rows))
+        self.assertEqual((result.created, result.error_count), (1, 1))
+        self.assertEqual(result.errors, [{'line': 2, 'errors': {'slug': ['Overridden by line 3 with the same slug.']}}])
+        self.assertEqual(Product.objects.get(slug='lamp').title, 'Floor Lamp')
+
+    def test_bad_rows_are_reported(self):
+        result = import_products(StringIO(self.csv(
+            'Desk Lamp,,,10,5,Lamps',
+            'Floor Lamp,,,0,5,Lamps',
+            'Wall Lamp,,,10,5,Sofas',
+            'Table Lamp,,,12,5,Lamps')), batch_size=10)
+        self.assertEqual((result.created, result.updated, result.error_count), (2, 0, 2))
+        self.assertEqual([error['line'] for error in result.errors], [3, 4])
+        self.assertIn('price', result.errors[0]['errors'])
+        self.assertEqual(result.errors[1]['errors'], {'collection': ['No collection with this title.']})
+        self.assertEqual(sorted(Product.objects.values_list('slug', flat=True)), ['desk-lamp', 'table-lamp'])
+        self.lamps.refresh_from_db()
+        self.assertEqual(self.lamps.products_count, 2)
+
+    def test_ndjson(self):
+        lines = [json.dumps({'title': 'Desk Lamp', 'price': '10.50', 'inventory': 5, 'collection': 'Lamps'}),
+                 '{"title": ',
+                 '',
+                 '["not", "an", "object"]']
+        result = import_products(BytesIO('\n'.join(lines).encode()), 'ndjson')
+        self.assertEqual((result.created, result.error_count), (1, 2))
+        self.assertEqual([error['line'] for error in result.errors], [2, 4])
+        self.assertEqual(Product.objects.get(slug='desk-lamp').price, Decimal('10.50'))
+
+    def test_existing_slug_is_updated(self):
+        product = Product.objects.create(title='Desk Lamp', slug='desk-lamp', description='Brass',
+                                         price=10, inventory=5, collection=self.lamps)
+        shades = Collection.objects.create(title='Shades')
+        # a row without a description keeps the stored one
+        result = import_products(StringIO('title,slug,price,inventory,collection\n'
+                                          'Desk Lamp II,desk-lamp,12,7,Shades\n'))
+        self.assertEqual((result.created, result.updated, result.error_count), (0, 1, 0))
+        product.refresh_from_db()
+        self.assertEqual((product.title, product.description, product.price, product.inventory, product.collection),
+                         ('Desk Lamp II', 'Brass', 12, 7, shades))
+        self.assertEqual(list(Collection.objects.order_by('pk').values_list('products_count', flat=True)), [0, 1])
+
+    def test_queries_per_batch(self):
+        # the collections once, then the same statements for a batch of
+        # any size
+        for size in [4, 40]:
+            rows = [f'Lamp {size}-{i},,,10,5,Lamps' for i in range(size * 2)]
+            with self.assertNumQueries(1 + 2 * 7):
+                result = import_products(StringIO(self.csv(*rows)), batch_size=size)
+            self.assertEqual(result.created, size * 2)
+
+    def test_endpoint(self):
+        staff = User.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+        customer = User.objects.create_user('customer', 'customer@example.com', 'password')
+        path = '/store/products/import/'
+        body = self.csv('Desk Lamp,,,10,5,Lamps', 'Floor Lamp,,,0,5,Lamps')
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'JWT {ClaimsRefreshToken.for_user(customer).access_token}')
+        self.assertEqual(self.client.post(path, body, content_type='text/csv').status_code, 403)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'JWT {ClaimsRefreshToken.for_user(staff).access_token}')
+        response = self.client.post(path, body, content_type='text/csv', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({key: value for key, value in response.json().items() if key != 'errors'},
+                         {'created': 1, 'updated': 0, 'error_count': 1})
+        # a multipart upload, its format from the file name
+        upload = SimpleUploadedFile('products.ndjson', b'{"title": "Desk Lamp", "price": 11, '
+                                                       b'"inventory": 5, "collection": "Lamps"}\n')
+        response = self.client.post(path, {'file': upload}, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json()['updated'], 1)
+        response = self.client.post(f'{path}?input=xml', body, content_type='text/csv', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ConcurrencyTests(TransactionTestCase):
+    # small runs of the stress commands, their threads need committed data.
+    # they raise CommandError on a lost update or an oversold product
+    def test_checkout(self):
+        out = StringIO()
+        call_command('stress_checkout', threads=4, carts_per_thread=5, stock=12, stdout=out)
+        self.assertIn('12 orders placed, 8 rejected for stock', out.getvalue())
+
+    def test_add_to_cart(self):
+        out = StringIO()
+        call_command('stress_add_to_cart', threads=4, adds=10, stdout=out)
+        self.assertIn('final quantity 40', out.getvalue())
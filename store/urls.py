@@ -10,6 +10,7 @@ router.register('collections', views.CollectionViewSet)
 router.register('carts', views.CartViewSet)
 router.register('customers', views.CustomerViewSet)
 router.register('orders', views.OrderViewSet, basename='orders')
+router.register('analytics/sales', views.SalesAnalyticsViewSet, basename='sales-analytics')
 
 
 products_router = routers.NestedDefaultRouter(
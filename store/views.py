@@ -1,33 +1,49 @@
-from django.db.models import Count
+from rest_framework.generics import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.decorators import action
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.filters import OrderingFilter
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.mixins import CreateModelMixin, RetrieveModelMixin, DestroyModelMixin, UpdateModelMixin
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework import status
 from core import serializers
+from core.authentication import StatelessJWTAuthentication
+from likes.models import LikedItem
 
-from store.pagination import DefaultPagination
+from store.caching import CachedResponseMixin
+from store.exports import EXPORT_FORMATS, stream_export
+from store.fastpath import (CollectionValuesSerializer, ProductValuesSerializer,
+                            ReviewValuesSerializer, ValuesListMixin)
+from store.imports import IMPORT_FORMATS, ImportResult, import_products
+from store.optimizer import QuerysetOptimizerMixin, optimize_queryset
+from store.pagination import OrderPagination, ProductPagination
+from store.parsers import CSVUploadParser, NDJSONUploadParser
 from store.permissions import FullDjangoModelPermissions, IsAdminOrReadOnly
-from .filters import ProductFilter
+from store.rollups import sales_summary
+from .filters import FullTextSearchFilter, ProductFilter
 from .models import Cart, CartItem, Customer, Order, OrderItem, Product, Collection, Review
-from .serializers import AddCartItemSerializer, CartItemSerializer, CartSerializer, CreateOrderSerializer, CustomerSerializer, OrderSerializer, ProductSerializer, CollectionSerializer, ReviewSerializer, UpdateCartItemSerializer
+from .serializers import AddCartItemSerializer, CartItemChangeSerializer, CartItemSerializer, CartSerializer, CreateOrderSerializer, CustomerSerializer, OrderSerializer, ProductSerializer, CollectionSerializer, ReviewSerializer, SalesQuerySerializer, UpdateCartItemSerializer
 
 
-class ProductViewSet(ModelViewSet):
+class ProductViewSet(CachedResponseMixin, ValuesListMixin, QuerysetOptimizerMixin, ModelViewSet):
+    # only the user's id and is_staff are needed, read them from the token
+    authentication_classes = [StatelessJWTAuthentication]
+    # likes_count isn't a scope, the counters flush every second and would
+    # empty the cache as often. cached counts lag by up to the response ttl
+    cache_scopes = ['product', 'collection', 'promotion', 'tag']
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    values_serializer_class = ProductValuesSerializer
 
     # filtering
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, OrderingFilter]
     filterset_class = ProductFilter
 
-    # pagination settings - page number -settings
-    pagination_class = DefaultPagination
+    # pagination settings - page number, or keyset when ?cursor= is sent
+    pagination_class = ProductPagination
     permission_classes = [IsAdminOrReadOnly]
-    search_fields = ['title', 'description']
     ordering_fields = ['price', 'last_updated']
 
     def get_serializer_context(self):
@@ -38,11 +54,63 @@ class ProductViewSet(ModelViewSet):
             return Response({'error': 'Product cannot be deleted, its associated with an orderitem'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
         return super().destroy(request, *args, **kwargs)
 
+    @action(detail=True, methods=['POST', 'DELETE'], permission_classes=[IsAuthenticated])
+    def like(self, request, pk=None):
+        product = get_object_or_404(Product.objects.only('id'), pk=pk)
+        if request.method == 'POST':
+            created = LikedItem.objects.like(request.user.id, product)
+            return Response({'liked': True},
+                            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+        LikedItem.objects.unlike(request.user.id, product)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
-class CollectionViewSet(ModelViewSet):
-    queryset = Collection.objects.annotate(
-        products_count=Count('products')).all()
+    # which of ?ids=1,2,3 the user liked, list responses are cached for
+    # everyone so this is fetched separately
+    @action(detail=False, methods=['GET'], permission_classes=[IsAuthenticated])
+    def liked(self, request):
+        try:
+            ids = [int(pk) for pk in request.query_params.get('ids', '').split(',') if pk.strip()]
+        except ValueError:
+            return Response({'ids': ['Expected comma separated product ids.']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > 100:
+            return Response({'ids': ['At most 100 ids can be given.']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response({'liked': sorted(LikedItem.objects.liked_ids(request.user.id, Product, ids))})
+
+    # the whole filtered list as ?output=ndjson or csv, streamed in chunks
+    @action(detail=False, methods=['GET'], permission_classes=[IsAdminUser])
+    def export(self, request):
+        return export_response(self, 'products')
+
+    # creates or updates products from a csv or ndjson file, sent as the
+    # multipart field 'file' or as the body with a text/csv or
+    # application/x-ndjson content type
+    @action(detail=False, methods=['POST'], url_path='import', url_name='import',
+            permission_classes=[IsAdminUser],
+            parser_classes=[MultiPartParser, CSVUploadParser, NDJSONUploadParser])
+    def bulk_import(self, request):
+        file = request.data.get('file')
+        if file is None:
+            return Response({'file': ['No file was submitted.']}, status=status.HTTP_400_BAD_REQUEST)
+        media_type = request.content_type.partition(';')[0].strip()
+        input_format = request.query_params.get('input') or next(
+            (key for key, value in EXPORT_FORMATS.items() if value == media_type),
+            getattr(file, 'name', '').rpartition('.')[2].lower())
+        if input_format not in IMPORT_FORMATS:
+            return Response({'input': [f'Expected one of {", ".join(IMPORT_FORMATS)}.']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        result = import_products(file, input_format, result=ImportResult(max_errors=100))
+        return Response(result.as_dict())
+
+
+class CollectionViewSet(CachedResponseMixin, ValuesListMixin, QuerysetOptimizerMixin, ModelViewSet):
+    authentication_classes = [StatelessJWTAuthentication]
+    # products_count changes bump 'collection' themselves
+    cache_scopes = ['collection']
+    queryset = Collection.objects.all()
     serializer_class = CollectionSerializer
+    values_serializer_class = CollectionValuesSerializer
     permission_classes = [IsAdminOrReadOnly]
 
     def destroy(self, request, *args, **kwargs):
@@ -51,8 +119,11 @@ class CollectionViewSet(ModelViewSet):
         return super().destroy(request, *args, **kwargs)
 
 
-class ReviewViewSet(ModelViewSet):
+class ReviewViewSet(CachedResponseMixin, ValuesListMixin, QuerysetOptimizerMixin, ModelViewSet):
+    authentication_classes = [StatelessJWTAuthentication]
+    cache_scopes = ['review']
     serializer_class = ReviewSerializer
+    values_serializer_class = ReviewValuesSerializer
 
     # overide default method to prevenyt returning all reviews on each product
     def get_queryset(self):
@@ -62,16 +133,17 @@ class ReviewViewSet(ModelViewSet):
         return {'product_id': self.kwargs['product_pk']}
 
 
-class CartViewSet(CreateModelMixin,
+class CartViewSet(QuerysetOptimizerMixin,
+                  CreateModelMixin,
                   RetrieveModelMixin,
                   DestroyModelMixin,
                   GenericViewSet):
-    # also fetch the items of the cart with the product... eager loading
-    queryset = Cart.objects.prefetch_related('items__product').all()
+    # totals are computed in SQL, items are prefetched with their line totals
+    queryset = Cart.objects.with_totals()
     serializer_class = CartSerializer
 
 
-class CartItemViewSet(ModelViewSet):
+class CartItemViewSet(QuerysetOptimizerMixin, ModelViewSet):
     http_method_names = ['get', 'post', 'patch', 'delete']
 
     def get_serializer_class(self):
@@ -86,10 +158,38 @@ class CartItemViewSet(ModelViewSet):
 
     # overide existing method
     def get_queryset(self):
-        return CartItem.objects.filter(cart_id=self.kwargs['cart_pk']).select_related('product')
+        return CartItem.objects.with_totals().filter(cart_id=self.kwargs['cart_pk'])
+
+    # every item write keeps the cart from being swept as abandoned
+    def touch_cart(self):
+        Cart.objects.filter(pk=self.kwargs['cart_pk']).touch()
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        self.touch_cart()
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self.touch_cart()
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        self.touch_cart()
+
+    # apply many {product_id, quantity} changes at once and return the cart
+    @action(detail=False, methods=['POST'])
+    def bulk(self, request, cart_pk=None):
+        get_object_or_404(Cart, pk=cart_pk)
+        serializer = CartItemChangeSerializer(
+            data=request.data, many=True, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        cart = serializer.save()
+        self.touch_cart()
+        return Response(CartSerializer(cart).data)
 
 
-class CustomerViewSet(ModelViewSet):
+class CustomerViewSet(QuerysetOptimizerMixin, ModelViewSet):
+    authentication_classes = [StatelessJWTAuthentication]
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
     permission_classes = [IsAdminUser]
@@ -97,8 +197,8 @@ class CustomerViewSet(ModelViewSet):
     # return customer profile who is loged in
     @action(detail=False, methods=['GET', 'PUT'], permission_classes=[IsAuthenticated])
     def me(self, request):
-        (customer, created) = Customer.objects.get_or_create(
-            user_id=request.user.id)
+        # every user gets a customer when it's created
+        customer = get_object_or_404(Customer, user_id=request.user.id)
         if request.method == 'GET':
             serializer = CustomerSerializer(customer)
             return Response(serializer.data)
@@ -109,8 +209,20 @@ class CustomerViewSet(ModelViewSet):
             return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class OrderViewSet(ModelViewSet):
+class OrderViewSet(QuerysetOptimizerMixin, ModelViewSet):
+    authentication_classes = [StatelessJWTAuthentication]
     permission_classes = [IsAuthenticated]
+    # keyset pages, from the first one when there's no ?cursor=
+    pagination_class = OrderPagination
+
+    def create(self, request, *args, **kwargs):
+        serializer = CreateOrderSerializer(
+            data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        order = serializer.save()
+        # reload through the optimizer so the response is two queries
+        order = optimize_queryset(Order.objects.filter(pk=order.pk), OrderSerializer).get()
+        return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
 
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -126,6 +238,37 @@ class OrderViewSet(ModelViewSet):
 
         if user.is_staff:
             return Order.objects.all()
-        (customer_id, created) = Customer.objects.only(
-            'id').get_or_create(user_id=user.id)
-        return Order.objects.filter(customer_id=customer_id)
+        return Order.objects.filter(customer__user_id=user.id)
+
+    @action(detail=False, methods=['GET'])
+    def export(self, request):
+        return export_response(self, 'orders')
+
+
+class SalesAnalyticsViewSet(GenericViewSet):
+    authentication_classes = [StatelessJWTAuthentication]
+    permission_classes = [IsAdminUser]
+
+    # totals between ?start= and ?end=, answered from the daily rollups
+    # without touching the orders
+    def list(self, request):
+        query = SalesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        totals, results = sales_summary(
+            params['start'], params['end'], params['group_by'], params['status'],
+            params.get('collection'), params.get('product'), params['limit'])
+        return Response({'start': params['start'], 'end': params['end'],
+                         'totals': totals, 'results': results})
+
+
+def export_response(view, filename):
+    # same filters as the list, but no pagination. ?format= is taken by
+    # drf's renderer negotiation hence ?output=
+    output = view.request.query_params.get('output', 'ndjson')
+    if output not in EXPORT_FORMATS:
+        return Response({'output': [f'Expected one of {", ".join(EXPORT_FORMATS)}.']},
+                        status=status.HTTP_400_BAD_REQUEST)
+    queryset = view.filter_queryset(view.get_queryset())
+    return stream_export(queryset, view.get_serializer_class(), output, filename,
+                         context=view.get_serializer_context())
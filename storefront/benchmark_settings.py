@@ -0,0 +1,26 @@
+# settings for `manage.py benchmark_endpoints`, runs against an in-memory
+# SQLite test database with no outside services
+from .settings import *
+
+DEBUG = False
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+}
+
+MIDDLEWARE = [item for item in MIDDLEWARE if not item.startswith('debug_toolbar')]
+SILENCED_SYSTEM_CHECKS = ['debug_toolbar.W001']
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+
+# hashing cost would dominate every auth endpoint otherwise
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
@@ -1,7 +1,21 @@
+import hashlib
+from collections import defaultdict
+from django.conf import settings
+from django.core.cache import cache
 from django.db import models
+from django.db.models import Case, Count, Value, When
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 
+# label -> tag ids entries are evicted on tag writes, the timeout only
+# bounds how long a bulk update() can go unnoticed
+TAG_LABEL_TIMEOUT = getattr(settings, 'TAGS_LABEL_CACHE_TIMEOUT', 60 * 5)
+
+
+def label_cache_key(label):
+    # labels can hold anything up to 255 characters, keep keys short and safe
+    return 'tags:label:' + hashlib.md5(label.encode()).hexdigest()
+
 
 
 class TaggedItemManager(models.Manager):
@@ -13,16 +27,90 @@ class TaggedItemManager(models.Manager):
         object_id = obj_id
         )
 
+    def get_tags_for_many(self, obj_type, obj_ids):
+        # {object id: [tags sorted by label]} in one query on the
+        # (object_id, content_type) index, untagged objects are left out.
+        # objects sharing a tag share its instance
+        obj_ids = list(obj_ids)
+        if not obj_ids:
+            return {}
+        content_type = ContentType.objects.get_for_model(obj_type)
+
+        tags = defaultdict(list)
+        loaded = {}
+        for object_id, tag_id, label in self.filter(
+            content_type=content_type,
+            object_id__in=obj_ids
+        ).order_by('tag__label', 'tag_id').values_list('object_id', 'tag_id', 'tag__label'):
+            if tag_id not in loaded:
+                loaded[tag_id] = Tag.from_db(self.db, ['id', 'label'], [tag_id, label])
+            tags[object_id].append(loaded[tag_id])
+        return dict(tags)
+
+    def object_ids_tagged(self, obj_type, tag_groups, match_all=True):
+        # a values('object_id') queryset to use as a semi-join, e.g.
+        # filter(id__in=...). tag_groups is a list of tag id lists: with
+        # match_all an object needs a tag from every group, otherwise one
+        # from any. runs on the (tag, content_type, object_id) index
+        content_type = ContentType.objects.get_for_model(obj_type)
+        tag_ids = [tag_id for group in tag_groups for tag_id in group]
+        tagged_items = self.filter(tag_id__in=tag_ids, content_type=content_type)
+        if match_all and len(tag_groups) > 1:
+            # count the distinct groups each object has a tag from
+            group = Case(*[When(tag_id__in=group, then=Value(index))
+                           for index, group in enumerate(tag_groups)])
+            tagged_items = tagged_items.order_by().values('object_id') \
+                .annotate(groups=Count(group, distinct=True)) \
+                .filter(groups=len(tag_groups))
+        return tagged_items.values('object_id')
+
+
+class TagManager(models.Manager):
+    def ids_for_labels(self, labels):
+        # {label: [tag ids]}, labels aren't unique so one can have several
+        # tags and unknown ones map to []. cached per label
+        keys = {label: label_cache_key(label) for label in labels}
+        cached = cache.get_many(keys.values())
+        found = {label: cached[key] for label, key in keys.items() if key in cached}
+        missing = [label for label in keys if label not in found]
+        if missing:
+            loaded = {label: [] for label in missing}
+            for label, tag_id in self.filter(label__in=missing).order_by('id').values_list('label', 'id'):
+                loaded[label].append(tag_id)
+            cache.set_many({keys[label]: ids for label, ids in loaded.items()},
+                           timeout=TAG_LABEL_TIMEOUT)
+            found.update(loaded)
+        return found
+
 
 class Tag(models.Model):
+    objects = TagManager()
     label = models.CharField(max_length=255)
 
     def __str__(self) -> str:
         return self.label
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # a rename has to evict the old label as well
+        if 'label' in field_names:
+            instance._loaded_label = instance.label
+        return instance
+
 class TaggedItem(models.Model):
     objects = TaggedItemManager()
     tag = models.ForeignKey(Tag, on_delete=models.CASCADE)
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     object_id = models.PositiveIntegerField()
-    content_object = GenericForeignKey() #reads actual object tag is applide
\ No newline at end of file
+    content_object = GenericForeignKey() #reads actual object tag is applide
+
+    class Meta:
+        indexes = [
+            # lookups by object, get_tags_for() and get_tags_for_many().
+            # object_id leads so planners don't pick this index to group
+            # every content type row by object in object_ids_tagged()
+            models.Index(fields=['object_id', 'content_type']),
+            # lookups by tag, object_ids_tagged()
+            models.Index(fields=['tag', 'content_type', 'object_id']),
+        ]
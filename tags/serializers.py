@@ -0,0 +1,10 @@
+from core.fields import BatchLoadedField
+from .models import TaggedItem
+
+
+class TagsField(BatchLoadedField):
+    # renders an object's tag labels, the tags of a whole list come from
+    # one query
+    def load(self, model, pks):
+        tags = TaggedItem.objects.get_tags_for_many(model, pks)
+        return {pk: [tag.label for tag in tags.get(pk, [])] for pk in pks}
@@ -0,0 +1,13 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from tags.models import Tag, label_cache_key
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def evict_tag_label(sender, instance, **kwargs):
+    labels = {instance.label, getattr(instance, '_loaded_label', instance.label)}
+    instance._loaded_label = instance.label
+    keys = [label_cache_key(label) for label in labels]
+    transaction.on_commit(lambda: cache.delete_many(keys))